@@ -0,0 +1,152 @@
+"""
+Admission control for CPU-heavy analysis work (image quality, CNN, video).
+
+At most ``ADMISSION_CONCURRENCY`` analyses run at once. Beyond that, work
+waits in a per-program queue and slots are handed out by weighted round
+robin across programs, so one program bulk-uploading thousands of photos
+gets its share of the CPU rather than all of it. A program's weight is 1
+unless ``ADMISSION_WEIGHTS`` (``program_id=weight,...``) says otherwise.
+
+When ``ADMISSION_MAX_QUEUE`` analyses are already waiting, new requests are
+refused with ``Overloaded``, which the upload route turns into a ``429``
+carrying a ``Retry-After`` estimated from the queue depth and the recent
+average analysis time.
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from backend import metrics
+
+ADMISSION_CONCURRENCY = int(os.getenv("ADMISSION_CONCURRENCY", str(os.cpu_count() or 1)))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+
+
+def _parse_weights(value: str) -> dict[str, int]:
+    weights = {}
+    for item in value.split(","):
+        program_id, _, weight = item.strip().partition("=")
+        if program_id and weight:
+            weights[program_id] = max(1, int(weight))
+    return weights
+
+
+ADMISSION_WEIGHTS = _parse_weights(os.getenv("ADMISSION_WEIGHTS", ""))
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Analysis queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        concurrency: int = ADMISSION_CONCURRENCY,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        weights: dict[str, int] | None = None,
+    ):
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max_queue
+        self.weights = weights if weights is not None else ADMISSION_WEIGHTS
+        self._active = 0
+        self._queued = 0
+        self._queues: dict[str, deque[asyncio.Future]] = {}
+        self._rotation: deque[str] = deque()
+        self._credits: dict[str, int] = {}
+        self._avg_service = 0.5  # seconds, EWMA of slot hold time
+
+    def retry_after(self) -> int:
+        backlog = (self._queued + 1) / self.concurrency
+        return max(1, math.ceil(backlog * self._avg_service))
+
+    def _publish(self) -> None:
+        metrics.ADMISSION_IN_FLIGHT.set(self._active)
+        metrics.ADMISSION_QUEUE_DEPTH.set(self._queued)
+        metrics.ADMISSION_QUEUED_PROGRAMS.set(len(self._queues))
+
+    def _pick(self) -> asyncio.Future | None:
+        """Next waiter by weighted round robin over programs with queued work."""
+        while self._rotation:
+            program_id = self._rotation[0]
+            queue = self._queues[program_id]
+            if not queue:
+                self._rotation.popleft()
+                del self._queues[program_id]
+                self._credits.pop(program_id, None)
+                continue
+            if self._credits.get(program_id, 0) <= 0:
+                self._credits[program_id] = self.weights.get(program_id, 1)
+            self._credits[program_id] -= 1
+            if self._credits[program_id] == 0:
+                self._rotation.rotate(-1)
+            waiter = queue.popleft()
+            self._queued -= 1
+            if not waiter.cancelled():
+                return waiter
+        return None
+
+    def _release(self) -> None:
+        self._active -= 1
+        while self._active < self.concurrency:
+            waiter = self._pick()
+            if waiter is None:
+                break
+            self._active += 1  # the slot passes straight to the waiter
+            waiter.set_result(None)
+        self._publish()
+
+    async def _acquire(self, program_id: str, may_reject: bool) -> None:
+        if self._active < self.concurrency and not self._queued:
+            self._active += 1
+            metrics.ADMISSION_WAIT.observe(0.0)
+            self._publish()
+            return
+        if may_reject and self._queued >= self.max_queue:
+            metrics.ADMISSION_REJECTED.inc()
+            raise Overloaded(self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        if program_id not in self._queues:
+            self._queues[program_id] = deque()
+            self._rotation.append(program_id)
+        self._queues[program_id].append(waiter)
+        self._queued += 1
+        self._publish()
+        start = time.perf_counter()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release()  # handed a slot just as we were cancelled
+            elif waiter in self._queues.get(program_id, ()):
+                self._queues[program_id].remove(waiter)
+                self._queued -= 1
+                self._publish()
+            raise
+        metrics.ADMISSION_WAIT.observe(time.perf_counter() - start)
+
+    @asynccontextmanager
+    async def slot(self, program_id: str, may_reject: bool = True):
+        """Hold one analysis slot for *program_id*.
+
+        Raises ``Overloaded`` if the queue is full and *may_reject* is set;
+        a request that was already admitted for an earlier file passes
+        ``may_reject=False`` so it isn't cut off halfway through.
+        """
+        await self._acquire(program_id, may_reject)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            held = time.perf_counter() - start
+            self._avg_service += 0.1 * (held - self._avg_service)
+            self._release()
+
+
+admission = AdmissionController()
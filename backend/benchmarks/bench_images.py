@@ -0,0 +1,145 @@
+"""
+Benchmarks for the image analysis hot paths.
+
+Measures ``check_quality``, ``classify`` and ``check_category`` per image
+(grouped by resolution) and per batch, the cascade classifier against the
+full pass, plus the ``POST /api/uploads`` endpoint end to end through the
+ASGI app in-process.
+"""
+
+import asyncio
+import os
+import shutil
+import time
+from collections import Counter
+
+from backend.benchmarks.common import summarize, time_calls
+
+BENCH_PROGRAM_ID = "_benchmark"
+
+
+def bench_quality(corpus: list[dict], repeat: int) -> dict:
+    from backend.qualify_image import check_quality
+
+    by_resolution: dict[str, list[float]] = {}
+    for item in corpus:
+        key = f"{item['width']}x{item['height']}"
+        for _ in range(repeat):
+            start = time.perf_counter()
+            check_quality(item["bytes"])
+            by_resolution.setdefault(key, []).append(time.perf_counter() - start)
+
+    batch = [item["bytes"] for item in corpus]
+    return {
+        "per_image": {k: summarize(v) for k, v in by_resolution.items()},
+        "batch": time_calls(lambda: [check_quality(b) for b in batch], repeat, len(batch)),
+    }
+
+
+def bench_cnn(corpus: list[dict], repeat: int, category: str) -> dict:
+    from backend.classify_image import _get_model, check_category, classify
+
+    _get_model()  # exclude weight loading from the timings
+
+    per_image: dict[str, dict[str, list[float]]] = {"classify": {}, "check_category": {}}
+    for item in corpus:
+        key = f"{item['width']}x{item['height']}"
+        for _ in range(repeat):
+            start = time.perf_counter()
+            classify(item["bytes"])
+            per_image["classify"].setdefault(key, []).append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            check_category(item["bytes"], category)
+            per_image["check_category"].setdefault(key, []).append(
+                time.perf_counter() - start
+            )
+
+    batch = [item["bytes"] for item in corpus]
+    return {
+        "per_image": {
+            fn: {k: summarize(v) for k, v in groups.items()}
+            for fn, groups in per_image.items()
+        },
+        "batch": {
+            "classify": time_calls(lambda: [classify(b) for b in batch], repeat, len(batch)),
+            "check_category": time_calls(
+                lambda: [check_category(b, category) for b in batch], repeat, len(batch)
+            ),
+        },
+    }
+
+
+def bench_cascade(corpus: list[dict], repeat: int, category: str) -> dict:
+    """Cascade vs. always-full ``check_category``: latency, escalations, agreement."""
+    from backend import classify_image as ci
+
+    ci._get_model()
+    decisions: Counter[str] = Counter()
+    disagreements = []
+    full_samples: list[float] = []
+    cascade_samples: list[float] = []
+    for item in corpus:
+        img = ci._load_image(item["bytes"])
+        for _ in range(repeat):
+            start = time.perf_counter()
+            full = ci.match_category(ci.classify_images([img])[0], category)
+            full_samples.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            result, decision = ci.cascade_first_pass(img, category)
+            if decision is None:
+                result = ci.classify_images([img])[0]
+            cascaded = ci.match_category(result, category)
+            cascade_samples.append(time.perf_counter() - start)
+        decisions[decision or "escalate"] += 1
+        if cascaded["matches"] != full["matches"]:
+            disagreements.append(item["name"])
+
+    n = len(corpus)
+    return {
+        "settings": {
+            "size": ci.CASCADE_SIZE,
+            "accept": ci.CASCADE_ACCEPT,
+            "reject": ci.CASCADE_REJECT,
+        },
+        "full": summarize(full_samples),
+        "cascade": summarize(cascade_samples),
+        "decisions": dict(decisions),
+        "escalation_rate": round(decisions["escalate"] / n, 4) if n else None,
+        # Share of images whose match verdict differs from the full pass
+        "disagreement_rate": round(len(disagreements) / n, 4) if n else None,
+        "disagreements": disagreements,
+    }
+
+
+async def _bench_upload(corpus: list[dict], repeat: int, files_per_request: int) -> dict:
+    import httpx
+
+    from backend.main import app
+    from backend.storage import LocalStorage, upload_storage
+
+    transport = httpx.ASGITransport(app=app)
+    samples: list[float] = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for i in range(repeat):
+            chunk = [
+                corpus[(i * files_per_request + j) % len(corpus)]
+                for j in range(files_per_request)
+            ]
+            files = [("files", (f"{c['name']}.jpg", c["bytes"], "image/jpeg")) for c in chunk]
+            start = time.perf_counter()
+            resp = await client.post(
+                "/api/uploads", files=files, data={"program_id": BENCH_PROGRAM_ID}
+            )
+            samples.append(time.perf_counter() - start)
+            resp.raise_for_status()
+
+    if isinstance(upload_storage, LocalStorage):
+        shutil.rmtree(os.path.join(upload_storage.root, BENCH_PROGRAM_ID), ignore_errors=True)
+    return summarize(samples, files_per_request)
+
+
+def bench_upload(corpus: list[dict], repeat: int, files_per_request: int = 4) -> dict:
+    """End-to-end upload latency; needs the main database to be reachable."""
+    return asyncio.run(_bench_upload(corpus, repeat, files_per_request))
@@ -0,0 +1,69 @@
+"""
+Per-worker memory of the CNN classifier, with and without a shared model.
+
+Forks N workers the way gunicorn does. In ``lazy`` mode each worker loads
+MobileNetV2 itself, as it would under ``uvicorn --workers``. In ``preload``
+mode the parent calls ``preload_model()`` first. Each worker then classifies
+one image and reports its RSS, PSS and private (USS) memory from
+``/proc/self/smaps_rollup`` while all workers are still alive, so PSS
+splits the shared pages fairly between them. Linux only.
+"""
+
+import multiprocessing as mp
+
+
+def _memory_kb() -> dict:
+    fields = {"Rss": "rss", "Pss": "pss", "Private_Clean": "uss", "Private_Dirty": "uss"}
+    out = {"rss": 0, "pss": 0, "uss": 0}
+    with open("/proc/self/smaps_rollup") as fp:
+        for line in fp:
+            key, _, rest = line.partition(":")
+            if key in fields:
+                out[fields[key]] += int(rest.split()[0])
+    return out
+
+
+def _worker(image: bytes, results, release) -> None:
+    import torch
+
+    from backend.classify_image import classify
+
+    torch.set_num_threads(1)
+    classify(image)
+    results.put(_memory_kb())
+    release.wait()
+
+
+def _run_mode(image: bytes, workers: int, preload: bool) -> dict:
+    ctx = mp.get_context("fork")
+    results, release = ctx.Queue(), ctx.Event()
+    procs = [ctx.Process(target=_worker, args=(image, results, release)) for _ in range(workers)]
+    for proc in procs:
+        proc.start()
+    samples = [results.get(timeout=300) for _ in procs]
+    release.set()
+    for proc in procs:
+        proc.join()
+
+    def mb(key: str) -> float:
+        return round(sum(s[key] for s in samples) / len(samples) / 1024, 1)
+
+    return {
+        "workers": workers,
+        "preload": preload,
+        "per_worker_rss_mb": mb("rss"),
+        "per_worker_pss_mb": mb("pss"),
+        "per_worker_uss_mb": mb("uss"),
+        "total_pss_mb": round(sum(s["pss"] for s in samples) / 1024, 1),
+    }
+
+
+def bench_memory(corpus: list[dict], workers: int) -> dict:
+    image = corpus[0]["bytes"]
+    # Lazy first: once the parent has preloaded, later forks inherit the model
+    lazy = _run_mode(image, workers, preload=False)
+
+    from backend.classify_image import preload_model
+
+    preload_model()
+    return {"lazy": lazy, "preload": _run_mode(image, workers, preload=True)}
@@ -0,0 +1,160 @@
+"""
+Benchmarks for the dynamic-table routes against a local Postgres.
+
+For each target size (10k … 10M rows) a fresh table is created through the
+API, then single-row insert, batch insert, page reads at several offsets and
+full-table export throughput are measured. Batch inserts go through the API
+up to ``--api-rows``; the rest of the table is filled server-side with
+``generate_series`` so large sizes stay practical.
+
+There is no export endpoint yet, so export is measured as a ``COPY ... TO
+STDOUT`` stream of the whole table, which is what an export would run.
+"""
+
+import random
+import time
+from datetime import date, timedelta
+
+from fastapi import HTTPException
+
+from backend.benchmarks.common import summarize, time_async_calls
+
+BENCH_PROJECT = "bench_tables"
+SIZES: list[int] = [10_000, 100_000, 1_000_000, 10_000_000]
+
+FIELDS = [
+    {"name": "species", "type": "STRING"},
+    {"name": "latitude", "type": "FLOAT"},
+    {"name": "longitude", "type": "FLOAT"},
+    {"name": "observed_on", "type": "DATE"},
+    {"name": "count", "type": "INT"},
+]
+
+
+def synthetic_rows(n: int, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    return [
+        {
+            "species": rng.choice(["Blue Jay", "Robin", "Cardinal", "Heron"]),
+            "latitude": rng.uniform(-90, 90),
+            "longitude": rng.uniform(-180, 180),
+            "observed_on": (date(2024, 1, 1) + timedelta(days=rng.randrange(365))).isoformat(),
+            "count": rng.randrange(1, 50),
+        }
+        for _ in range(n)
+    ]
+
+
+async def _fill(table: str, target: int) -> None:
+    from backend.routes.dynamic_tables import _project_conn
+
+    async with _project_conn(BENCH_PROJECT) as conn:
+        current = await conn.fetchval(f'SELECT COUNT(*) FROM "{table}"')
+        if current < target:
+            await conn.execute(
+                f"""
+                INSERT INTO "{table}" (species, latitude, longitude, observed_on, count)
+                SELECT 'Robin', random() * 180 - 90, random() * 360 - 180,
+                       DATE '2024-01-01' + (g % 365), g % 50
+                FROM generate_series(1, $1) g
+                """,
+                target - current,
+            )
+        await conn.execute(f'ANALYZE "{table}"')
+
+
+async def _export(table: str) -> tuple[float, int]:
+    from backend.routes.dynamic_tables import _project_conn
+
+    sent = 0
+
+    async def sink(chunk: bytes) -> None:
+        nonlocal sent
+        sent += len(chunk)
+
+    async with _project_conn(BENCH_PROJECT) as conn:
+        start = time.perf_counter()
+        await conn.copy_from_table(table, output=sink, format="csv")
+        return time.perf_counter() - start, sent
+
+
+async def _drop(table: str) -> None:
+    from backend.routes.dynamic_tables import _project_conn
+
+    async with _project_conn(BENCH_PROJECT) as conn:
+        await conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+
+
+async def bench_table_size(client, size: int, repeat: int, api_rows: int, batch_size: int) -> dict:
+    table = f"bench_{size}"
+    try:
+        await _drop(table)
+    except HTTPException:
+        pass  # project doesn't exist yet
+    resp = await client.post(
+        "/api/tables",
+        json={"project_name": BENCH_PROJECT, "table_name": table, "fields": FIELDS},
+    )
+    resp.raise_for_status()
+    base = f"/api/tables/{BENCH_PROJECT}/{table}"
+    result: dict = {"rows": size}
+
+    row = synthetic_rows(1)[0]
+
+    async def insert_one():
+        (await client.post(f"{base}/rows", json={"data": row})).raise_for_status()
+
+    result["insert_row"] = await time_async_calls(insert_one, repeat)
+
+    samples: list[float] = []
+    inserted = 0
+    seed = 0
+    while inserted < min(api_rows, size):
+        rows = synthetic_rows(batch_size, seed)
+        seed += 1
+        start = time.perf_counter()
+        (await client.post(f"{base}/rows/batch", json={"rows": rows})).raise_for_status()
+        samples.append(time.perf_counter() - start)
+        inserted += batch_size
+    result["insert_batch"] = summarize(samples, batch_size)
+
+    await _fill(table, size)
+
+    pages = {}
+    for limit in (100, 1000):
+        for label, offset in (("head", 0), ("middle", size // 2), ("tail", max(size - limit, 0))):
+
+            async def read_page(limit=limit, offset=offset):
+                (
+                    await client.get(f"{base}/rows", params={"limit": limit, "offset": offset})
+                ).raise_for_status()
+
+            pages[f"limit{limit}_{label}"] = await time_async_calls(read_page, repeat, limit)
+    result["read_page"] = pages
+
+    elapsed, sent = await _export(table)
+    result["export"] = {
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(size / elapsed, 1) if elapsed else None,
+        "megabytes": round(sent / 1e6, 2),
+    }
+
+    await _drop(table)
+    return result
+
+
+async def run(sizes: list[int], repeat: int, api_rows: int, batch_size: int) -> dict:
+    import httpx
+
+    from backend.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    results = {}
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", timeout=None
+    ) as client:
+        for size in sizes:
+            results[str(size)] = await bench_table_size(
+                client, size, repeat, api_rows, batch_size
+            )
+    return results
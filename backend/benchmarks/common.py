@@ -0,0 +1,74 @@
+"""Shared timing and result helpers for the benchmark suites."""
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+
+def summarize(samples: list[float], items: int = 1) -> dict:
+    """Summarise per-call wall times (seconds) into latency and throughput."""
+    ordered = sorted(samples)
+    total = sum(samples)
+    return {
+        "calls": len(samples),
+        "median_ms": round(statistics.median(ordered) * 1000, 3),
+        "p95_ms": round(ordered[int(0.95 * (len(ordered) - 1))] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+        "items_per_sec": round(len(samples) * items / total, 2) if total else None,
+    }
+
+
+def time_calls(fn, repeat: int, items: int = 1) -> dict:
+    """Call ``fn()`` *repeat* times and summarise the timings."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples, items)
+
+
+async def time_async_calls(fn, repeat: int, items: int = 1) -> dict:
+    """Await ``fn()`` *repeat* times and summarise the timings."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples, items)
+
+
+def run_metadata() -> dict:
+    """Describe the environment a run was taken in, for comparing runs."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(__file__),
+            check=False,
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": commit or None,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def write_results(results: dict, out: str | None) -> None:
+    text = json.dumps(results, indent=2, default=str)
+    if out:
+        os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+        with open(out, "w") as fp:
+            fp.write(text + "\n")
+    else:
+        print(text)
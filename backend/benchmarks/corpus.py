@@ -0,0 +1,112 @@
+"""
+Synthetic image corpora for the image benchmarks.
+
+Images are generated deterministically from a seed: a textured scene of
+gradients and random shapes, optionally degraded with Gaussian blur and
+additive noise, then JPEG-encoded so the benchmarks exercise the same
+decode path as real uploads. ``load_directory`` loads a folder of real
+photos in the same shape instead.
+"""
+
+import os
+
+import cv2
+import numpy as np
+
+RESOLUTIONS: list[tuple[int, int]] = [(320, 240), (640, 480), (1920, 1080), (4032, 3024)]
+BLUR_LEVELS: list[int] = [0, 5, 15]
+NOISE_LEVELS: list[float] = [0.0, 10.0, 30.0]
+
+
+def synthetic_image(
+    width: int, height: int, blur: int = 0, noise: float = 0.0, seed: int = 0
+) -> np.ndarray:
+    """Return a BGR uint8 image with texture, blur (kernel size) and noise (std)."""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    img = np.empty((height, width, 3), dtype=np.float32)
+    img[..., 0] = x
+    img[..., 1] = y
+    img[..., 2] = (x + y) / 2
+    img = img.astype(np.uint8)
+
+    scale = max(width, height)
+    for _ in range(40):
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        radius = int(rng.integers(scale // 80 + 1, scale // 8 + 2))
+        cv2.circle(img, center, radius, color, thickness=-1)
+
+    if blur:
+        k = blur | 1  # kernel size must be odd
+        img = cv2.GaussianBlur(img, (k, k), 0)
+    if noise:
+        img = np.clip(img + rng.normal(0, noise, img.shape), 0, 255).astype(np.uint8)
+    return img
+
+
+def encode_jpeg(img: np.ndarray, quality: int = 90) -> bytes:
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("JPEG encoding failed")
+    return buf.tobytes()
+
+
+def build_corpus(
+    resolutions: list[tuple[int, int]] | None = None,
+    blur_levels: list[int] | None = None,
+    noise_levels: list[float] | None = None,
+    per_variant: int = 1,
+) -> list[dict]:
+    """Return a list of ``{"name", "width", "height", "blur", "noise", "bytes"}``."""
+    corpus = []
+    seed = 0
+    for width, height in resolutions or RESOLUTIONS:
+        for blur in blur_levels if blur_levels is not None else BLUR_LEVELS:
+            for noise in noise_levels if noise_levels is not None else NOISE_LEVELS:
+                for _ in range(per_variant):
+                    img = synthetic_image(width, height, blur, noise, seed)
+                    corpus.append(
+                        {
+                            "name": f"{width}x{height}_b{blur}_n{noise:g}_{seed}",
+                            "width": width,
+                            "height": height,
+                            "blur": blur,
+                            "noise": noise,
+                            "bytes": encode_jpeg(img),
+                        }
+                    )
+                    seed += 1
+    return corpus
+
+
+def load_directory(path: str, limit: int | None = None) -> list[dict]:
+    """Load real photos (jpg/png/webp) from *path* as a corpus, in name order.
+
+    Synthetic images say nothing about classifier accuracy; point the CNN
+    and cascade suites at a folder of real uploads for that.
+    """
+    corpus = []
+    for name in sorted(os.listdir(path)):
+        if name.rsplit(".", 1)[-1].lower() not in ("jpg", "jpeg", "png", "webp"):
+            continue
+        with open(os.path.join(path, name), "rb") as fp:
+            data = fp.read()
+        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+        if img is None:
+            continue
+        height, width = img.shape[:2]
+        corpus.append(
+            {
+                "name": name,
+                "width": width,
+                "height": height,
+                "blur": None,
+                "noise": None,
+                "bytes": data,
+            }
+        )
+        if limit and len(corpus) >= limit:
+            break
+    return corpus
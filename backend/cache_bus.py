@@ -0,0 +1,166 @@
+"""
+Cross-worker cache invalidation over Postgres LISTEN/NOTIFY.
+
+Each worker keeps in-process caches (program configs, compiled row
+validators, BK-trees of image hashes). Routes that change the data behind
+them ``publish`` a topic such as ``"program"`` with a small payload; every
+worker — including the publisher — receives it on its listener connection
+and runs the handlers its caches ``subscribe``-d for that topic.
+
+Passing the route's session to ``publish`` sends the NOTIFY inside the same
+transaction, so other workers hear about the change only once it commits.
+The publisher also runs its handlers immediately, so it never serves its
+own stale entry. Events that add to a cache rather than drop from it pass
+``local=False``: the publisher then applies them from its own listener like
+every other worker, only once the transaction has committed.
+
+If the listener connection drops, notifications may be missed: handlers
+are called with ``None`` ("drop everything") on every (re)connect. Caches
+that can't tolerate staleness should only be used while ``listening`` is
+true, and should skip storing a value if ``generation`` moved while they
+were loading it.
+"""
+
+import asyncio
+import json
+import os
+from collections import defaultdict
+from collections.abc import Callable
+from contextlib import suppress
+
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from backend import metrics
+from backend.database import DATABASE_URL, engine
+
+CACHE_BUS_CHANNEL = os.getenv("CACHE_BUS_CHANNEL", "eco_cache")
+# Seconds between listener liveness checks, and before reconnecting
+CACHE_BUS_KEEPALIVE = float(os.getenv("CACHE_BUS_KEEPALIVE", "30"))
+CACHE_BUS_RECONNECT = float(os.getenv("CACHE_BUS_RECONNECT", "2"))
+
+# Called with the published payload, or None when everything must go
+Handler = Callable[[dict | None], None]
+
+# pg_notify rejects payloads of 8000 bytes or more
+MAX_PAYLOAD_BYTES = 7900
+
+_NOTIFY_SQL = text("SELECT pg_notify(:channel, :payload)")
+
+
+class CacheBus:
+    def __init__(self, dsn: str, channel: str = CACHE_BUS_CHANNEL):
+        self.dsn = dsn
+        self.channel = channel
+        self.listening = False
+        # Bumped on every event; lets loaders detect a concurrent invalidation
+        self.generation = 0
+        self._handlers: dict[str, list[Handler]] = defaultdict(list)
+        self._task: asyncio.Task | None = None
+
+    def subscribe(self, topic: str, handler: Handler) -> None:
+        self._handlers[topic].append(handler)
+
+    def _dispatch(self, topic: str, data: dict | None) -> None:
+        self.generation += 1
+        metrics.CACHE_BUS_EVENTS.labels(topic).inc()
+        for handler in self._handlers.get(topic, ()):
+            handler(data)
+
+    def _flush(self) -> None:
+        self.generation += 1
+        for handlers in self._handlers.values():
+            for handler in handlers:
+                handler(None)
+
+    def _on_notify(self, conn, pid: int, channel: str, payload: str) -> None:
+        try:
+            message = json.loads(payload)
+            topic, data = message["topic"], message["data"]
+        except (ValueError, KeyError, TypeError):
+            return
+        self._dispatch(topic, data)
+
+    async def publish(
+        self,
+        topic: str,
+        data: dict,
+        conn: AsyncSession | AsyncConnection | None = None,
+        local: bool = True,
+    ) -> None:
+        """Invalidate *topic* entries matching *data* in every worker.
+
+        With *conn*, the NOTIFY joins the caller's transaction and is
+        delivered when the caller commits; otherwise it is sent right away.
+        With ``local=False`` this worker's handlers aren't run ahead of the
+        delivery.
+        """
+        if local:
+            self._dispatch(topic, data)
+        params = {"channel": self.channel, "payload": self.payload(topic, data)}
+        if conn is not None:
+            await conn.execute(_NOTIFY_SQL, params)
+            return
+        async with engine.begin() as own:
+            await own.execute(_NOTIFY_SQL, params)
+
+    @staticmethod
+    def payload(topic: str, data: dict) -> str:
+        return json.dumps({"topic": topic, "data": data})
+
+    async def publish_committed(self, topic: str, data: dict) -> None:
+        """``publish`` for a change that has already committed.
+
+        The request must not fail for a write that succeeded, so a failed
+        send is only counted; the other workers' caches then stay stale
+        until their TTLs or periodic reloads catch up.
+        """
+        try:
+            await self.publish(topic, data)
+        except (OSError, SQLAlchemyError):
+            metrics.CACHE_BUS_PUBLISH_FAILURES.labels(topic).inc()
+
+    async def _listen(self) -> None:
+        conn = await asyncpg.connect(self.dsn)
+        lost = asyncio.Event()
+        conn.add_termination_listener(lambda _: lost.set())
+        try:
+            await conn.add_listener(self.channel, self._on_notify)
+            # Anything could have changed while nobody was listening
+            self._flush()
+            self.listening = True
+            metrics.CACHE_BUS_LISTENING.set(1)
+            while True:
+                with suppress(TimeoutError):
+                    async with asyncio.timeout(CACHE_BUS_KEEPALIVE):
+                        await lost.wait()
+                        return
+                async with asyncio.timeout(CACHE_BUS_KEEPALIVE):
+                    await conn.execute("SELECT 1")
+        finally:
+            self.listening = False
+            metrics.CACHE_BUS_LISTENING.set(0)
+            with suppress(Exception):
+                await conn.close(timeout=1)
+
+    async def _listen_loop(self) -> None:
+        while True:
+            with suppress(OSError, TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError):
+                await self._listen()
+            await asyncio.sleep(CACHE_BUS_RECONNECT)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+
+cache_bus = CacheBus(DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://"))
@@ -0,0 +1,203 @@
+"""
+Live feed of rows inserted into dynamic tables.
+
+The insert routes call ``publish`` inside their transaction with the ids
+they inserted, which becomes a ``NOTIFY`` on ``CHANGE_FEED_CHANNEL`` sent
+at commit. Ids travel as ``[first, last]`` runs, so a 10k-row batch costs
+one short payload.
+
+Each worker holds one ``LISTEN`` connection per database it has
+subscribers for. That is the main database in schema mode, or each project
+database otherwise. Notifications are fanned out to per-table feeds.
+
+A feed coalesces the notifications that arrive within
+``CHANGE_FEED_COALESCE`` seconds and fetches those rows once, as JSON
+rendered by Postgres. It then hands the same text to every subscriber, so
+a burst of inserts watched by many dashboards costs one query per worker.
+
+Subscribers get a bounded queue. One that falls ``CHANGE_FEED_QUEUE``
+batches behind is sent ``None`` and dropped; it can reconnect and resume
+from the last id it saw. If a listener connection is lost, its feeds tell
+their subscribers the same way, since notifications may have been missed.
+"""
+
+import asyncio
+import json
+import os
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager, suppress
+
+import asyncpg
+
+from backend import metrics
+
+CHANGE_FEED_CHANNEL = os.getenv("CHANGE_FEED_CHANNEL", "eco_rows")
+CHANGE_FEED_COALESCE = float(os.getenv("CHANGE_FEED_COALESCE", "0.2"))
+CHANGE_FEED_QUEUE = int(os.getenv("CHANGE_FEED_QUEUE", "64"))
+# Seconds between keepalive comments on an idle event stream
+CHANGE_FEED_HEARTBEAT = float(os.getenv("CHANGE_FEED_HEARTBEAT", "15"))
+
+# NOTIFY payloads must stay under 8000 bytes
+_RUNS_PER_NOTIFY = 200
+
+# (first id, last id) inclusive
+Run = tuple[int, int]
+# Renders the rows in the given runs as a JSON array, ordered by id
+Fetch = Callable[[list[Run]], Awaitable[str]]
+Batch = tuple[int, int, str] | None  # (lowest id, highest id, rows JSON), or None: resync
+
+
+def id_runs(ids: list[int]) -> list[Run]:
+    """Collapse ids into sorted runs of consecutive values."""
+    runs: list[list[int]] = []
+    for i in sorted(ids):
+        if runs and i == runs[-1][1] + 1:
+            runs[-1][1] = i
+        else:
+            runs.append([i, i])
+    return [(a, b) for a, b in runs]
+
+
+def sse_event(event: str, data: str, event_id: int | None = None) -> str:
+    """Format one server-sent event; multi-line *data* is split across ``data:`` lines."""
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+class _TableFeed:
+    def __init__(self, fetch: Fetch):
+        self.fetch = fetch
+        self.subscribers: set[asyncio.Queue[Batch]] = set()
+        self._pending: list[Run] = []
+        self._flusher: asyncio.Task | None = None
+
+    def notify(self, runs: list[Run]) -> None:
+        self._pending.extend(runs)
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush())
+
+    def _send(self, batch: Batch) -> None:
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(batch)
+            except asyncio.QueueFull:
+                # Too far behind: make room for the resync marker and drop it
+                self.subscribers.discard(queue)
+                metrics.CHANGE_FEED_DROPPED.inc()
+                queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def _flush(self) -> None:
+        await asyncio.sleep(CHANGE_FEED_COALESCE)
+        runs, self._pending = self._pending, []
+        self._flusher = None
+        try:
+            rows_json = await self.fetch(runs)
+        except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError):
+            self.resync()
+            return
+        metrics.CHANGE_FEED_BATCHES.inc()
+        self._send((min(a for a, _ in runs), max(b for _, b in runs), rows_json))
+
+    def resync(self) -> None:
+        self._send(None)
+
+
+class _Listener:
+    """One LISTEN connection and the table feeds it serves."""
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.feeds: dict[tuple[str, str], _TableFeed] = {}
+        self._conn: asyncpg.Connection | None = None
+        self._lock = asyncio.Lock()
+
+    def _on_notify(self, conn, pid: int, channel: str, payload: str) -> None:
+        try:
+            message = json.loads(payload)
+            key = (message["project"], message["table"])
+            runs = [(int(a), int(b)) for a, b in message["runs"]]
+        except (ValueError, KeyError, TypeError):
+            return
+        feed = self.feeds.get(key)
+        if feed is not None and runs:
+            feed.notify(runs)
+
+    def _on_lost(self, conn) -> None:
+        if conn is self._conn:
+            self._conn = None
+            for feed in self.feeds.values():
+                feed.resync()
+
+    async def ensure(self) -> None:
+        async with self._lock:
+            if self._conn is not None and not self._conn.is_closed():
+                return
+            conn = await asyncpg.connect(self.dsn)
+            conn.add_termination_listener(self._on_lost)
+            await conn.add_listener(CHANGE_FEED_CHANNEL, self._on_notify)
+            self._conn = conn
+
+    async def close(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            with suppress(Exception):
+                await conn.close(timeout=1)
+
+
+class ChangeFeed:
+    def __init__(self) -> None:
+        self._listeners: dict[str, _Listener] = {}
+
+    async def publish(
+        self, conn: asyncpg.Connection, project: str, table: str, ids: list[int]
+    ) -> None:
+        """Announce inserted *ids*; delivered when *conn*'s transaction commits."""
+        runs = id_runs(ids)
+        for start in range(0, len(runs), _RUNS_PER_NOTIFY):
+            payload = json.dumps(
+                {"project": project, "table": table, "runs": runs[start:start + _RUNS_PER_NOTIFY]}
+            )
+            await conn.execute("SELECT pg_notify($1, $2)", CHANGE_FEED_CHANNEL, payload)
+
+    @asynccontextmanager
+    async def subscribe(
+        self, dsn: str, project: str, table: str, fetch: Fetch
+    ) -> AsyncIterator[asyncio.Queue[Batch]]:
+        """Queue of ``(highest id, rows JSON)`` batches for inserts into *table*.
+
+        *dsn* is the database whose notifications to listen on; *fetch*
+        loads the announced rows (the first subscriber's is used).
+        """
+        listener = self._listeners.get(dsn)
+        if listener is None:
+            listener = self._listeners[dsn] = _Listener(dsn)
+        key = (project, table)
+        feed = listener.feeds.get(key)
+        if feed is None:
+            feed = listener.feeds[key] = _TableFeed(fetch)
+        queue: asyncio.Queue[Batch] = asyncio.Queue(CHANGE_FEED_QUEUE)
+        feed.subscribers.add(queue)
+        metrics.CHANGE_FEED_SUBSCRIBERS.inc()
+        try:
+            await listener.ensure()
+            yield queue
+        finally:
+            metrics.CHANGE_FEED_SUBSCRIBERS.dec()
+            feed.subscribers.discard(queue)
+            if not feed.subscribers and listener.feeds.get(key) is feed:
+                del listener.feeds[key]
+            if not listener.feeds and self._listeners.get(dsn) is listener:
+                del self._listeners[dsn]
+                await listener.close()
+
+    async def close(self) -> None:
+        listeners, self._listeners = list(self._listeners.values()), {}
+        for listener in listeners:
+            await listener.close()
+
+
+change_feed = ChangeFeed()
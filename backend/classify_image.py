@@ -6,7 +6,11 @@ no ExecuTorch runtime needed. Classifies images and checks whether
 the detected label matches an expected category (e.g. "bird").
 """
 
+import gc
 import io
+import itertools
+import os
+import random
 from functools import lru_cache
 
 import torch
@@ -14,9 +18,16 @@ import torchvision.models as models
 from PIL import Image
 from torchvision.models.mobilenetv2 import MobileNet_V2_Weights
 
+from backend import metrics
+from backend.metrics import span
+
 WEIGHTS = MobileNet_V2_Weights.DEFAULT
 LABELS: list[str] = WEIGHTS.meta["categories"]
 
+# Minimum size requested from PIL's JPEG draft mode; the transform resizes
+# the short side to 232px, so 2x that keeps resampling quality
+DRAFT_SIZE = 464
+
 # ImageNet indices for bird species
 BIRD_INDICES: set[int] = set(range(7, 25)) | set(range(80, 101)) | set(range(127, 146))
 
@@ -26,30 +37,51 @@ CATEGORY_INDICES: dict[str, set[int]] = {
     "bird": BIRD_INDICES,
 }
 
+# Cascade mode for check_category: a cheap low-resolution pass first, and the
+# full 224px pass only when the first one is ambiguous
+CNN_CASCADE = os.getenv("CNN_CASCADE", "0") == "1"
+CASCADE_SIZE = int(os.getenv("CASCADE_SIZE", "128"))
+# Exit early when the category's probability mass is at least ACCEPT (and the
+# top-1 label is in the category) or at most REJECT
+CASCADE_ACCEPT = float(os.getenv("CASCADE_ACCEPT", "0.85"))
+CASCADE_REJECT = float(os.getenv("CASCADE_REJECT", "0.05"))
+# Fraction of early exits re-checked with the full pass to measure agreement
+CASCADE_AUDIT_RATE = float(os.getenv("CASCADE_AUDIT_RATE", "0.0"))
+
 
 @lru_cache(maxsize=1)
 def _get_model():
     model = models.mobilenet_v2(weights=WEIGHTS).eval()
+    model.requires_grad_(False)
     return model
 
 
-def classify(image_bytes: bytes, confidence_threshold: float = 0.15) -> dict:
-    """Classify an image and return label + confidence.
+def preload_model() -> None:
+    """Load the model in a parent process so forked workers share it.
 
-    Returns:
-        {
-            "label": str,          # ImageNet label or "unknown"
-            "confidence": float,   # 0.0-1.0
-            "top5": [{"label": str, "confidence": float}, ...]
-        }
+    Call once before forking (``gunicorn.conf.py`` does with
+    ``PRELOAD_MODEL=1``). The weights are moved into shared memory, and the
+    objects alive at this point are frozen out of the cyclic GC, whose
+    bookkeeping writes would otherwise copy every page of the parent heap
+    into each worker. Don't run inference here: torch's intra-op thread pool
+    must be started after the fork.
     """
-    img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    tensor = WEIGHTS.transforms()(img).unsqueeze(0)
+    model = _get_model()
+    for tensor in itertools.chain(model.parameters(), model.buffers()):
+        tensor.share_memory_()
+    gc.collect()
+    gc.freeze()
+
+
+def _load_image(image_bytes: bytes) -> Image.Image:
+    img = Image.open(io.BytesIO(image_bytes))
+    # JPEG only: decode at the smallest DCT scale that still covers the
+    # model's resize step, instead of full resolution
+    img.draft("RGB", (DRAFT_SIZE, DRAFT_SIZE))
+    return img.convert("RGB")
 
-    with torch.no_grad():
-        logits = _get_model()(tensor)
 
-    probs = torch.softmax(logits.squeeze(), dim=0)
+def _result_from_probs(probs: torch.Tensor, confidence_threshold: float) -> dict:
     top5_probs, top5_indices = probs.topk(5)
 
     top_idx = top5_indices[0].item()
@@ -69,8 +101,75 @@ def classify(image_bytes: bytes, confidence_threshold: float = 0.15) -> dict:
     }
 
 
-def check_category(image_bytes: bytes, expected_category: str) -> dict:
-    """Classify an image and check if it matches the expected category.
+def _forward(batch: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+    """Run MobileNetV2, returning logits and the pooled 1280-d features.
+
+    Mirrors ``MobileNetV2.forward`` but keeps the penultimate-layer vector
+    that the classifier head consumes.
+    """
+    model = _get_model()
+    features = model.features(batch)
+    pooled = torch.flatten(torch.nn.functional.adaptive_avg_pool2d(features, (1, 1)), 1)
+    return model.classifier(pooled), pooled
+
+
+def classify_images(
+    images: list[Image.Image],
+    confidence_threshold: float = 0.15,
+    with_embedding: bool = False,
+) -> list[dict]:
+    """Classify already-decoded RGB images in a single batched forward pass.
+
+    With ``with_embedding`` each result also carries ``"embedding"``, the
+    1280-d float32 feature vector as a NumPy array.
+    """
+    if not images:
+        return []
+    with span("cnn.preprocess"):
+        transform = WEIGHTS.transforms()
+        batch = torch.stack([transform(img) for img in images])
+
+    with span("cnn.inference"), torch.no_grad():
+        logits, embeddings = _forward(batch)
+
+    probs = torch.softmax(logits, dim=1)
+    results = [_result_from_probs(p, confidence_threshold) for p in probs]
+    if with_embedding:
+        for result, emb in zip(results, embeddings.numpy()):
+            result["embedding"] = emb
+    return results
+
+
+def classify_batch(
+    images: list[bytes], confidence_threshold: float = 0.15, with_embedding: bool = False
+) -> list[dict]:
+    """Classify several encoded images with one forward pass.
+
+    Returns one ``classify``-shaped dict per input, in order.
+    """
+    with span("cnn.decode"):
+        decoded = [_load_image(b) for b in images]
+    return classify_images(decoded, confidence_threshold, with_embedding)
+
+
+def classify(
+    image_bytes: bytes, confidence_threshold: float = 0.15, with_embedding: bool = False
+) -> dict:
+    """Classify an image and return label + confidence.
+
+    Returns:
+        {
+            "label": str,          # ImageNet label or "unknown"
+            "confidence": float,   # 0.0-1.0
+            "top5": [{"label": str, "confidence": float}, ...]
+            "embedding": np.ndarray,  # only with with_embedding=True
+        }
+    """
+    return classify_batch([image_bytes], confidence_threshold, with_embedding)[0]
+
+
+def match_category(result: dict, expected_category: str) -> dict:
+    """Check a ``classify`` result against the expected category.
 
     Returns:
         {
@@ -81,7 +180,6 @@ def check_category(image_bytes: bytes, expected_category: str) -> dict:
             "message": str,
         }
     """
-    result = classify(image_bytes)
     label = result["label"]
     confidence = result["confidence"]
 
@@ -103,10 +201,104 @@ def check_category(image_bytes: bytes, expected_category: str) -> dict:
     else:
         message = f"CNN detected: {label} ({confidence:.0%}) — expected {expected_category}"
 
-    return {
+    matched = {
         "label": label,
         "confidence": confidence,
         "matches": matches,
         "expected_category": expected_category,
         "message": message,
     }
+    if "embedding" in result:
+        matched["embedding"] = result["embedding"]
+    return matched
+
+
+def _category_indices(expected_category: str) -> set[int]:
+    expected_lower = expected_category.lower()
+    indices = CATEGORY_INDICES.get(expected_lower)
+    if indices is None:
+        indices = {i for i, label in enumerate(LABELS) if expected_lower in label.lower()}
+    return indices
+
+
+@lru_cache(maxsize=4)
+def _cascade_transform(size: int):
+    from torchvision import transforms
+
+    return transforms.Compose(
+        [
+            transforms.Resize(size),
+            transforms.CenterCrop(size),
+            transforms.ToTensor(),
+            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+        ]
+    )
+
+
+def cascade_first_pass(
+    img: Image.Image, expected_category: str, confidence_threshold: float = 0.15
+) -> tuple[dict, str | None]:
+    """Run the low-resolution pass and decide whether it is conclusive.
+
+    Returns the ``classify``-shaped result (without an embedding: features
+    of a 128px input aren't comparable with the 224px ones in the embedding
+    store) and ``"accept"`` / ``"reject"`` if the category probability
+    clears a margin, or None if the image has to escalate to the full pass.
+    """
+    with span("cnn.cascade"), torch.no_grad():
+        batch = _cascade_transform(CASCADE_SIZE)(img).unsqueeze(0)
+        logits, _ = _forward(batch)
+        probs = torch.softmax(logits, dim=1)[0]
+
+    result = _result_from_probs(probs, confidence_threshold)
+    indices = _category_indices(expected_category)
+    mass = float(probs[list(indices)].sum()) if indices else 0.0
+    top_idx = int(probs.argmax())
+    if mass >= CASCADE_ACCEPT and top_idx in indices:
+        # The category is certain even when its mass is spread over labels
+        # too thin to clear the top-1 confidence threshold
+        result["label"] = LABELS[top_idx]
+        return result, "accept"
+    if mass <= CASCADE_REJECT:
+        return result, "reject"
+    return result, None
+
+
+def check_category(
+    image_bytes: bytes, expected_category: str, with_embedding: bool = False
+) -> dict:
+    """Classify an image and check if it matches the expected category.
+
+    Returns the ``match_category`` dict for the image. With ``CNN_CASCADE``
+    on, clear-cut images are decided by the low-resolution pass alone and
+    come back without an embedding.
+    """
+    if not CNN_CASCADE:
+        return match_category(
+            classify(image_bytes, with_embedding=with_embedding), expected_category
+        )
+
+    with span("cnn.decode"):
+        img = _load_image(image_bytes)
+    result, decision = cascade_first_pass(img, expected_category)
+    if decision is not None:
+        metrics.CNN_CASCADE.labels(decision).inc()
+        matched = match_category(result, expected_category)
+        matched["matches"] = decision == "accept"
+        if CASCADE_AUDIT_RATE and random.random() < CASCADE_AUDIT_RATE:
+            full = match_category(classify_images([img])[0], expected_category)
+            agrees = "agree" if full["matches"] == matched["matches"] else "disagree"
+            metrics.CNN_CASCADE_AUDIT.labels(agrees).inc()
+    else:
+        metrics.CNN_CASCADE.labels("escalate").inc()
+        matched = match_category(
+            classify_images([img], with_embedding=with_embedding)[0], expected_category
+        )
+    if not with_embedding:
+        matched.pop("embedding", None)
+    return matched
+
+
+def check_category_batch(images: list[bytes], expected_category: str) -> list[dict]:
+    """Batched ``check_category``: one forward pass for all *images*."""
+    return [match_category(r, expected_category) for r in classify_batch(images)]
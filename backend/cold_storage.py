@@ -0,0 +1,362 @@
+"""
+Cold storage for old dynamic-table rows.
+
+``archive_table`` moves the rows of a dynamic table whose ``created_at`` is
+before a cutoff out of Postgres into Parquet files. Files are partitioned
+Hive-style by month of ``created_at``
+(``<project>/<table>/year=2023/month=06/<batch>.parquet``). They live
+under ``COLD_STORAGE_DIR``, or in ``COLD_S3_BUCKET`` with
+``COLD_STORAGE=s3`` (same S3 settings as ``backend.storage``).
+
+Rows move in batches of ``COLD_ARCHIVE_BATCH``. Each batch is one
+transaction: the rows are deleted with ``RETURNING``, written as Parquet,
+and listed in the project's ``_cold_files`` catalog before the transaction
+commits. Readers only scan files named in the catalog, so a run that fails
+part-way leaves at most an unlisted orphan file, never a lost or doubled
+row. The deletes run with ``eco.sync_archiving`` on, so offline clients
+(``backend.sync``) don't see archived rows as deleted.
+
+``read_rows`` reads archived rows back with DuckDB, which only fetches the
+row groups it needs. ``GET /api/tables/{project}/{table}/rows`` pages over
+archived and hot rows as one table ordered by id. Archived rows are
+read-only.
+
+Usage::
+
+    python -m backend.cold_storage --project birds --before 2024-01-01
+    python -m backend.cold_storage --project birds --table sightings --older-than 365
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+import asyncpg
+
+from backend import sync
+from backend.storage import S3_ENDPOINT_URL, S3_REGION, LocalStorage, S3Storage
+
+COLD_STORAGE = os.getenv("COLD_STORAGE", "local")
+COLD_STORAGE_DIR = os.getenv("COLD_STORAGE_DIR", "/app/cold")
+COLD_S3_BUCKET = os.getenv("COLD_S3_BUCKET", "ecoexchange-cold")
+COLD_S3_PREFIX = os.getenv("COLD_S3_PREFIX", "")
+COLD_ARCHIVE_BATCH = int(os.getenv("COLD_ARCHIVE_BATCH", "50000"))
+
+CATALOG_TABLE = "_cold_files"
+
+# Arrow types for Postgres udt names; anything else is stored as text
+_ARROW_TYPES = {
+    "int2": "int16",
+    "int4": "int32",
+    "int8": "int64",
+    "float4": "float32",
+    "float8": "float64",
+    "numeric": "float64",
+    "bool": "bool_",
+    "date": "date32",
+}
+
+
+def _make_storage() -> LocalStorage | S3Storage:
+    if COLD_STORAGE == "local":
+        return LocalStorage(COLD_STORAGE_DIR, fsync="always")
+    if COLD_STORAGE == "s3":
+        return S3Storage(COLD_S3_BUCKET, COLD_S3_PREFIX)
+    raise ValueError(f"COLD_STORAGE must be local or s3, got {COLD_STORAGE!r}")
+
+
+cold_store = _make_storage()
+
+
+async def catalog_exists(conn: asyncpg.Connection) -> bool:
+    return await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", f'"{CATALOG_TABLE}"')
+
+
+async def _ensure_catalog(conn: asyncpg.Connection) -> None:
+    await conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS "{CATALOG_TABLE}" (
+            table_name TEXT NOT NULL,
+            key TEXT PRIMARY KEY,
+            rows INTEGER NOT NULL,
+            min_id INTEGER NOT NULL,
+            max_id INTEGER NOT NULL,
+            archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    await conn.execute(
+        f'CREATE INDEX IF NOT EXISTS "{CATALOG_TABLE}_table_idx" ON "{CATALOG_TABLE}" (table_name)'
+    )
+
+
+def _to_parquet(columns: list[tuple[str, str]], rows: list[asyncpg.Record]) -> bytes:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise RuntimeError("archiving rows needs pyarrow installed") from exc
+
+    arrays = []
+    for i, (_, udt) in enumerate(columns):
+        values = [r[i] for r in rows]
+        if udt == "numeric":
+            values = [None if v is None else float(v) for v in values]
+        if udt in _ARROW_TYPES:
+            arrays.append(pa.array(values, type=getattr(pa, _ARROW_TYPES[udt])()))
+        elif udt in ("timestamp", "timestamptz"):
+            tz = "UTC" if udt == "timestamptz" else None
+            arrays.append(pa.array(values, type=pa.timestamp("us", tz=tz)))
+        else:
+            arrays.append(
+                pa.array([None if v is None else str(v) for v in values], type=pa.string())
+            )
+    out = io.BytesIO()
+    pq.write_table(
+        pa.Table.from_arrays(arrays, names=[name for name, _ in columns]),
+        out,
+        compression="zstd",
+    )
+    return out.getvalue()
+
+
+async def archive_table(
+    conn: asyncpg.Connection, project: str, table: str, before: datetime
+) -> dict | None:
+    """Move rows of *table* created before *before* into cold storage.
+
+    Returns ``{"rows": moved, "files": [keys]}``, or None if *table*
+    doesn't exist.
+    """
+    records = await conn.fetch(
+        """
+        SELECT column_name, udt_name FROM information_schema.columns
+        WHERE table_name = $1 AND table_schema = current_schema()
+        ORDER BY ordinal_position
+        """,
+        table,
+    )
+    if not records:
+        return None
+    columns = [
+        (r["column_name"], r["udt_name"])
+        for r in records
+        if r["column_name"] != sync.VERSION_COLUMN
+    ]
+    select_list = ", ".join(f'"{name}"' for name, _ in columns)
+    created_at = next(i for i, (name, _) in enumerate(columns) if name == "created_at")
+    row_id = next(i for i, (name, _) in enumerate(columns) if name == "id")
+    await cold_store.prepare()
+    await _ensure_catalog(conn)
+
+    moved, files = 0, []
+    while True:
+        async with conn.transaction():
+            await conn.execute(f"SET LOCAL {sync.ARCHIVING_SETTING} = 'on'")
+            # The outer created_at test lets partitioned tables prune
+            rows = await conn.fetch(
+                f"""
+                DELETE FROM "{table}"
+                WHERE created_at < $1 AND id IN (
+                    SELECT id FROM "{table}" WHERE created_at < $1 ORDER BY id LIMIT $2
+                )
+                RETURNING {select_list}
+                """,
+                before,
+                COLD_ARCHIVE_BATCH,
+            )
+            by_month: dict[tuple[int, int], list[asyncpg.Record]] = defaultdict(list)
+            for r in rows:
+                by_month[(r[created_at].year, r[created_at].month)].append(r)
+            for (year, month), part in sorted(by_month.items()):
+                key = (
+                    f"{project}/{table}/year={year:04d}/month={month:02d}/"
+                    f"{uuid.uuid4().hex}.parquet"
+                )
+                data = await asyncio.to_thread(_to_parquet, columns, part)
+                await cold_store.save(key, data, "application/vnd.apache.parquet")
+                ids = [r[row_id] for r in part]
+                await conn.execute(
+                    f"""
+                    INSERT INTO "{CATALOG_TABLE}" (table_name, key, rows, min_id, max_id)
+                    VALUES ($1, $2, $3, $4, $5)
+                    """,
+                    table,
+                    key,
+                    len(part),
+                    min(ids),
+                    max(ids),
+                )
+                files.append(key)
+        moved += len(rows)
+        if len(rows) < COLD_ARCHIVE_BATCH:
+            return {"rows": moved, "files": files}
+
+
+async def cold_files(conn: asyncpg.Connection, table: str) -> list[asyncpg.Record]:
+    """Catalog entries for *table*: ``key``, ``rows``, ``min_id``, ``max_id``."""
+    if not await catalog_exists(conn):
+        return []
+    return await conn.fetch(
+        f'SELECT key, rows, min_id, max_id FROM "{CATALOG_TABLE}" WHERE table_name = $1',
+        table,
+    )
+
+
+def _sql_string(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _connect_duckdb():
+    try:
+        import duckdb
+    except ImportError as exc:
+        raise RuntimeError("reading archived rows needs duckdb installed") from exc
+    db = duckdb.connect()
+    if isinstance(cold_store, S3Storage):
+        options = {
+            "KEY_ID": os.getenv("AWS_ACCESS_KEY_ID"),
+            "SECRET": os.getenv("AWS_SECRET_ACCESS_KEY"),
+            "REGION": S3_REGION or os.getenv("AWS_DEFAULT_REGION"),
+        }
+        if S3_ENDPOINT_URL:
+            endpoint = urlsplit(S3_ENDPOINT_URL)
+            options["ENDPOINT"] = endpoint.netloc
+            options["URL_STYLE"] = "path"
+            options["USE_SSL"] = "true" if endpoint.scheme == "https" else "false"
+        settings = "".join(
+            f", {name} {_sql_string(value)}" for name, value in options.items() if value
+        )
+        db.execute(f"CREATE SECRET (TYPE s3{settings})")
+    return db
+
+
+def _scan_path(key: str) -> str:
+    if isinstance(cold_store, S3Storage):
+        return f"s3://{cold_store.bucket}/{cold_store.prefix}{key}"
+    return cold_store.path(key)
+
+
+def _read_rows_sync(keys: list[str], limit: int, offset: int) -> list[dict]:
+    db = _connect_duckdb()
+    try:
+        paths = ", ".join(_sql_string(_scan_path(k)) for k in keys)
+        result = db.execute(
+            f"""
+            SELECT * FROM read_parquet([{paths}], union_by_name = true)
+            ORDER BY id LIMIT ? OFFSET ?
+            """,
+            [limit, offset],
+        )
+        names = [d[0] for d in result.description]
+        return [dict(zip(names, row)) for row in result.fetchall()]
+    finally:
+        db.close()
+
+
+def _page_files(files: list[asyncpg.Record], limit: int, offset: int) -> tuple[list[str], int]:
+    """The files holding rows ``offset .. offset + limit`` and the offset into them."""
+    files = sorted(files, key=lambda f: f["min_id"])
+    if any(a["max_id"] >= b["min_id"] for a, b in zip(files, files[1:])):
+        return [f["key"] for f in files], offset  # id ranges overlap: scan them all
+    keys, seen = [], 0
+    for f in files:
+        if not keys and f["rows"] <= offset:
+            offset -= f["rows"]
+            continue
+        if seen >= offset + limit:
+            break
+        keys.append(f["key"])
+        seen += f["rows"]
+    return keys, offset
+
+
+async def read_rows(files: list[asyncpg.Record], limit: int, offset: int = 0) -> list[dict]:
+    """Archived rows from catalog entries *files*, ordered by id, *offset* first."""
+    if limit <= 0:
+        return []
+    keys, offset = _page_files(files, limit, offset)
+    if not keys:
+        return []
+    return await asyncio.to_thread(_read_rows_sync, keys, limit, offset)
+
+
+async def run(args: argparse.Namespace) -> int:
+    # Imported here: the routes module pulls in the whole API
+    from backend.routes.dynamic_tables import _IDENTIFIER_RE, _project_conn, close_pool
+
+    if args.before is not None:
+        before = datetime.fromisoformat(args.before)
+    else:
+        before = datetime.now() - timedelta(days=args.older_than)
+    project = args.project.lower()
+    if not _IDENTIFIER_RE.match(project):
+        print(f"Invalid project name: {project}", file=sys.stderr)
+        return 1
+
+    failed = 0
+    try:
+        async with _project_conn(project) as conn:
+            tables = [t.lower() for t in args.table] or [
+                r["table_name"]
+                for r in await conn.fetch(
+                    """
+                    SELECT t.table_name FROM information_schema.tables t
+                    JOIN pg_class c
+                      ON c.relname = t.table_name
+                     AND c.relnamespace = current_schema()::regnamespace
+                    WHERE t.table_schema = current_schema() AND t.table_type = 'BASE TABLE'
+                      AND NOT c.relispartition AND t.table_name NOT IN ($1, $2)
+                    ORDER BY t.table_name
+                    """,
+                    sync.TOMBSTONE_TABLE,
+                    CATALOG_TABLE,
+                )
+            ]
+            for table in tables:
+                start = time.perf_counter()
+                try:
+                    result = await archive_table(conn, project, table, before)
+                except (OSError, RuntimeError, asyncpg.PostgresError) as exc:
+                    print(f"  {table}: failed: {exc}", file=sys.stderr)
+                    failed += 1
+                    continue
+                if result is None:
+                    print(f"  {table}: no such table", file=sys.stderr)
+                    failed += 1
+                    continue
+                print(
+                    f"  {table}: {result['rows']} rows in {len(result['files'])} files "
+                    f"({time.perf_counter() - start:.1f}s)"
+                )
+    finally:
+        await close_pool()
+    return 1 if failed else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Move old dynamic-table rows into Parquet cold storage."
+    )
+    parser.add_argument("--project", required=True)
+    parser.add_argument(
+        "--table", action="append", default=[], help="table to archive (default: all)"
+    )
+    cutoff = parser.add_mutually_exclusive_group(required=True)
+    cutoff.add_argument("--before", help="archive rows created before this ISO date")
+    cutoff.add_argument(
+        "--older-than", type=int, metavar="DAYS", help="archive rows older than DAYS days"
+    )
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
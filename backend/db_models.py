@@ -1,4 +1,4 @@
-from sqlalchemy import Integer, String, Text
+from sqlalchemy import BigInteger, Boolean, Float, Integer, String, Text
 from sqlalchemy.dialects.postgresql import ARRAY, JSON, JSONB
 from sqlalchemy.orm import Mapped, mapped_column
 
@@ -70,3 +70,39 @@ class SubmissionDB(Base):
     habitat: Mapped[str | None] = mapped_column(String, nullable=True)
     confidence: Mapped[str | None] = mapped_column(String, nullable=True)
     submitted_at: Mapped[str] = mapped_column(String, nullable=False)
+
+
+class UploadAnalysisDB(Base):
+    __tablename__ = "upload_analyses"
+
+    path: Mapped[str] = mapped_column(String, primary_key=True)
+    program_id: Mapped[str] = mapped_column(String, nullable=False, index=True)
+    quality_score: Mapped[float | None] = mapped_column(Float, nullable=True)
+    quality_warnings: Mapped[list | None] = mapped_column(JSONB, nullable=True)
+    label: Mapped[str | None] = mapped_column(String, nullable=True)
+    confidence: Mapped[float | None] = mapped_column(Float, nullable=True)
+    top5: Mapped[list | None] = mapped_column(JSONB, nullable=True)
+    expected_category: Mapped[str | None] = mapped_column(String, nullable=True)
+    matches: Mapped[bool | None] = mapped_column(Boolean, nullable=True)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    analyzed_at: Mapped[str] = mapped_column(String, nullable=False)
+
+
+class ImageHashDB(Base):
+    __tablename__ = "image_hashes"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    program_id: Mapped[str] = mapped_column(String, nullable=False, index=True)
+    phash: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    url: Mapped[str] = mapped_column(String, nullable=False)
+
+
+class TableProfileDB(Base):
+    __tablename__ = "table_profiles"
+
+    project_name: Mapped[str] = mapped_column(String, primary_key=True)
+    table_name: Mapped[str] = mapped_column(String, primary_key=True)
+    profile: Mapped[dict] = mapped_column(JSONB, nullable=False)
+    # Mergeable counters behind the profile (see backend.profiling)
+    state: Mapped[dict] = mapped_column(JSONB, nullable=False)
+    profiled_at: Mapped[str] = mapped_column(String, nullable=False)
@@ -0,0 +1,258 @@
+"""
+Append-only on-disk store of CNN embeddings for uploaded images.
+
+Every classified upload's 1280-d MobileNetV2 feature vector is L2-normalised,
+converted to float16 and appended to ``vectors.f16``; ``ids.tsv`` maps each
+upload id to its stored path and matrix row. Readers memory-map the matrix, so the
+store is shared between worker processes and costs no resident memory
+beyond the pages a query touches.
+
+Similarity is cosine similarity computed as batched dot products over
+row chunks. Once the store holds ``EMBEDDING_IVF_MIN`` vectors an inverted
+file (IVF) index is trained with a few rounds of k-means; queries then only
+score the rows in the ``EMBEDDING_IVF_NPROBE`` nearest lists, plus any rows
+appended since the index was built.
+
+Training never runs on a request. The index is saved to ``ivf.npz`` next
+to the matrix and every process loads it when the file changes. When a
+query finds the index missing, or a tenth of the store newer than it, one
+process retrains it in a background thread. Queries meanwhile use the old
+index, or a full scan. ``python -m backend.reanalyze --train-index``
+rebuilds it offline.
+"""
+
+import fcntl
+import os
+import threading
+from contextlib import suppress
+
+import numpy as np
+
+EMBEDDING_DIR = os.getenv("EMBEDDING_DIR", "/app/embeddings")
+EMBEDDING_DIM = 1280
+EMBEDDING_IVF_MIN = int(os.getenv("EMBEDDING_IVF_MIN", "200000"))
+EMBEDDING_IVF_NPROBE = int(os.getenv("EMBEDDING_IVF_NPROBE", "8"))
+
+_CHUNK_ROWS = 65536
+
+
+class _IVFIndex:
+    def __init__(
+        self, centroids: np.ndarray, order: np.ndarray, bounds: np.ndarray, built_rows: int
+    ):
+        self.centroids = centroids
+        # Rows sorted by list; list c is order[bounds[c]:bounds[c + 1]]
+        self.order = order
+        self.bounds = bounds
+        self.built_rows = built_rows
+
+    def save(self, path: str) -> None:
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as fp:
+            np.savez(
+                fp,
+                centroids=self.centroids,
+                order=self.order,
+                bounds=self.bounds,
+                built_rows=np.int64(self.built_rows),
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "_IVFIndex":
+        with np.load(path) as data:
+            return cls(data["centroids"], data["order"], data["bounds"], int(data["built_rows"]))
+
+    @classmethod
+    def train(cls, matrix: np.ndarray, iterations: int = 10, seed: int = 0) -> "_IVFIndex":
+        n = matrix.shape[0]
+        nlist = max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(seed)
+        sample = matrix[np.sort(rng.choice(n, size=min(n, nlist * 64), replace=False))]
+        sample = sample.astype(np.float32)
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[assign == c]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    centroids[c] = centroid / (np.linalg.norm(centroid) or 1.0)
+
+        assignments = np.empty(n, dtype=np.int32)
+        for start in range(0, n, _CHUNK_ROWS):
+            chunk = matrix[start : start + _CHUNK_ROWS].astype(np.float32)
+            assignments[start : start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(nlist + 1))
+        return cls(centroids, order, bounds, n)
+
+    def candidates(self, query: np.ndarray, nprobe: int, total_rows: int) -> np.ndarray:
+        nearest = np.argsort(self.centroids @ query)[::-1][:nprobe]
+        tail = np.arange(self.built_rows, total_rows)
+        lists = [self.order[self.bounds[c] : self.bounds[c + 1]] for c in nearest]
+        return np.concatenate(lists + [tail])
+
+
+class EmbeddingStore:
+    def __init__(self, directory: str = EMBEDDING_DIR, dim: int = EMBEDDING_DIM):
+        self.directory = directory
+        self.dim = dim
+        self._vectors_path = os.path.join(directory, "vectors.f16")
+        self._ids_path = os.path.join(directory, "ids.tsv")
+        self._ivf_path = os.path.join(directory, "ivf.npz")
+        self._lock = threading.Lock()
+        self._ivf_mtime: float | None = None
+        self._training: threading.Thread | None = None
+        self._entries: dict[int, tuple[str, str]] = {}
+        self._row_of: dict[str, int] = {}
+        self._ids_offset = 0
+        self._matrix: np.ndarray | None = None
+        self._ivf: _IVFIndex | None = None
+
+    def append(self, upload_id: str, path: str, vector: np.ndarray) -> None:
+        """Append one embedding. Safe across processes via an exclusive file lock."""
+        vec = np.asarray(vector, dtype=np.float32).reshape(self.dim)
+        vec = (vec / (np.linalg.norm(vec) or 1.0)).astype(np.float16)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._ids_path, "a") as ids_fp:
+            fcntl.flock(ids_fp, fcntl.LOCK_EX)
+            try:
+                # Record the row explicitly so a torn append can't shift ids,
+                # and cut a torn vector off so later rows stay aligned
+                with open(self._vectors_path, "ab") as vec_fp:
+                    row = vec_fp.tell() // (self.dim * 2)
+                    os.ftruncate(vec_fp.fileno(), row * self.dim * 2)
+                    vec_fp.write(vec.tobytes())
+                ids_fp.write(f"{upload_id}\t{path}\t{row}\n")
+            finally:
+                fcntl.flock(ids_fp, fcntl.LOCK_UN)
+
+    def _refresh(self) -> int:
+        """Pick up rows appended (by any process) since the last call."""
+        if not os.path.exists(self._ids_path):
+            return 0
+        with open(self._ids_path) as fp:
+            fp.seek(self._ids_offset)
+            data = fp.read()
+        complete = data[: data.rfind("\n") + 1]
+        self._ids_offset += len(complete.encode())
+        for line in complete.splitlines():
+            upload_id, path, row = line.split("\t")
+            self._row_of[upload_id] = int(row)
+            self._entries[int(row)] = (upload_id, path)
+
+        rows = os.path.getsize(self._vectors_path) // (self.dim * 2)
+        if self._matrix is None or self._matrix.shape[0] != rows:
+            self._matrix = np.memmap(
+                self._vectors_path, dtype=np.float16, mode="r", shape=(rows, self.dim)
+            ) if rows else None
+        return rows
+
+    def _load_index(self) -> None:
+        """Pick up an index saved (by any process) since the last call."""
+        try:
+            mtime = os.path.getmtime(self._ivf_path)
+        except OSError:
+            return
+        if mtime != self._ivf_mtime:
+            with suppress(OSError, ValueError, KeyError):
+                self._ivf = _IVFIndex.load(self._ivf_path)
+            self._ivf_mtime = mtime
+
+    def _index_due(self, rows: int) -> bool:
+        # Retrain once a tenth of the store arrived after the last build
+        return rows >= EMBEDDING_IVF_MIN and (
+            self._ivf is None or rows - self._ivf.built_rows > self._ivf.built_rows // 10
+        )
+
+    def train_index(self, wait: bool = True) -> int | None:
+        """Train the IVF index over the whole store and save it; returns its rows.
+
+        An exclusive file lock keeps processes from training at the same
+        time. Without *wait*, returns None at once if another process holds
+        it, or if the saved index turns out to be current after all.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, "ivf.lock"), "a") as lock_fp:
+            try:
+                fcntl.flock(lock_fp, fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+            except BlockingIOError:
+                return None
+            try:
+                with self._lock:
+                    rows = self._refresh()
+                    matrix = self._matrix
+                    self._load_index()
+                    if not wait and not self._index_due(rows):
+                        return None
+                if not rows:
+                    return 0
+                _IVFIndex.train(matrix).save(self._ivf_path)
+            finally:
+                fcntl.flock(lock_fp, fcntl.LOCK_UN)
+        with self._lock:
+            self._load_index()
+        return rows
+
+    def _train_in_background(self) -> None:
+        if self._training is not None and self._training.is_alive():
+            return
+
+        def train() -> None:
+            with suppress(OSError):
+                self.train_index(wait=False)
+
+        self._training = threading.Thread(target=train, name="ivf-train", daemon=True)
+        self._training.start()
+
+    def similar(self, upload_id: str, k: int = 10) -> list[dict] | None:
+        """Return the *k* most similar stored uploads, or None if *upload_id* is unknown."""
+        with self._lock:
+            rows = self._refresh()
+            row = self._row_of.get(upload_id)
+            if row is None or row >= rows:
+                return None
+            self._load_index()
+            if rows < EMBEDDING_IVF_MIN:
+                self._ivf = None
+            elif self._index_due(rows):
+                self._train_in_background()
+            matrix = self._matrix
+            query = matrix[row].astype(np.float32)
+
+            if self._ivf is not None:
+                candidate_rows = np.sort(
+                    self._ivf.candidates(query, EMBEDDING_IVF_NPROBE, rows)
+                )
+                scores = matrix[candidate_rows].astype(np.float32) @ query
+            else:
+                scores = np.empty(rows, dtype=np.float32)
+                for start in range(0, rows, _CHUNK_ROWS):
+                    chunk = matrix[start : start + _CHUNK_ROWS].astype(np.float32)
+                    scores[start : start + len(chunk)] = chunk @ query
+                candidate_rows = np.arange(rows)
+
+            keep = candidate_rows != row
+            scores, candidate_rows = scores[keep], candidate_rows[keep]
+            if len(scores) > k:
+                top = np.argpartition(scores, -k)[-k:]
+            else:
+                top = np.arange(len(scores))
+            top = top[np.argsort(scores[top])[::-1]]
+            results = []
+            for i in top:
+                entry = self._entries.get(int(candidate_rows[i]))
+                if entry is None:
+                    continue  # vector whose id line was never written
+                results.append(
+                    {
+                        "id": entry[0],
+                        "url": f"/uploads/{entry[1]}",
+                        "score": round(float(scores[i]), 4),
+                    }
+                )
+            return results
+
+
+embedding_store = EmbeddingStore()
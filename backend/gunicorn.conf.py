@@ -0,0 +1,44 @@
+"""
+Gunicorn settings for running several API workers on one host.
+
+The app (and, with ``PRELOAD_MODEL=1``, the CNN weights) is loaded once in the
+master process and shared copy-on-write with every forked worker, so each
+extra worker only adds its own activations and heap rather than another
+copy of MobileNetV2 and the torch runtime.
+
+    gunicorn -c backend/gunicorn.conf.py backend.main:app
+
+Plain ``uvicorn --workers N`` spawns fresh interpreters instead of forking,
+so every worker there loads its own copy of the model.
+"""
+
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+
+# Torch intra-op threads per worker; keep workers x threads <= cores
+TORCH_THREADS = int(os.getenv("TORCH_THREADS", "1"))
+
+
+def on_starting(server):
+    if os.getenv("PRELOAD_MODEL", "1") == "1":
+        from backend.classify_image import preload_model
+
+        preload_model()
+
+
+def post_fork(server, worker):
+    import torch
+
+    torch.set_num_threads(TORCH_THREADS)
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,215 @@
+"""
+Perceptual hashing and near-duplicate lookup for uploaded images.
+
+``phash`` computes a 64-bit DCT perceptual hash from the grayscale image the
+quality scan already decoded, so re-encoded, resized or lightly edited
+copies of a photo land within a small Hamming distance of each other.
+
+Hashes are persisted per program in the ``image_hashes`` table and indexed
+in memory with a BK-tree per program, loaded lazily on first lookup. A
+BK-tree query with a small radius only visits the branches whose edge
+distance is within the radius of the query distance, so lookups stay
+sub-linear as a program's store grows.
+
+Trees are kept only while the cache bus is listening (see
+``backend.cache_bus``). Each stored hash is announced on the
+``"image_hash"`` topic when the upload commits, and every worker, the
+uploading one included, adds it to its tree then; an upload whose commit
+fails never reaches a tree. A program's tree is dropped in every worker
+when the program changes.
+"""
+
+import asyncio
+import os
+from collections.abc import Iterable
+
+import cv2
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.cache_bus import cache_bus
+from backend.db_models import ImageHashDB
+
+# Maximum Hamming distance (out of 64 bits) reported as a near-duplicate
+DUPLICATE_MAX_DISTANCE = int(os.getenv("DUPLICATE_MAX_DISTANCE", "8"))
+
+
+def phash(gray: np.ndarray) -> int:
+    """Return the 64-bit DCT perceptual hash of a grayscale image."""
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    # Skip the DC term when picking the threshold; it dwarfs the rest
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def to_signed(h: int) -> int:
+    """Map an unsigned 64-bit hash into Postgres' signed BIGINT range."""
+    return h - (1 << 64) if h >= (1 << 63) else h
+
+
+def to_unsigned(h: int) -> int:
+    return h + (1 << 64) if h < 0 else h
+
+
+class BKTree:
+    """Burkhard-Keller tree over 64-bit hashes under Hamming distance.
+
+    Nodes are ``[hash, items, children]`` lists where ``children`` maps the
+    edge distance to the child node.
+    """
+
+    __slots__ = ("_root", "_size")
+
+    def __init__(self) -> None:
+        self._root: list | None = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, h: int, item: str) -> None:
+        """Index *item* under *h*; adding the same pair twice is a no-op."""
+        if self._root is None:
+            self._size += 1
+            self._root = [h, [item], {}]
+            return
+        node = self._root
+        while True:
+            d = (node[0] ^ h).bit_count()
+            if d == 0:
+                if item not in node[1]:
+                    self._size += 1
+                    node[1].append(item)
+                return
+            child = node[2].get(d)
+            if child is None:
+                self._size += 1
+                node[2][d] = [h, [item], {}]
+                return
+            node = child
+
+    def search(self, h: int, k: int) -> list[tuple[int, str]]:
+        """Return ``(distance, item)`` pairs within distance *k*, closest first."""
+        if self._root is None:
+            return []
+        found: list[tuple[int, str]] = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            d = (node[0] ^ h).bit_count()
+            if d <= k:
+                found.extend((d, item) for item in node[1])
+            for edge, child in node[2].items():
+                if d - k <= edge <= d + k:
+                    stack.append(child)
+        found.sort()
+        return found
+
+
+class HashIndex:
+    """Per-program BK-trees backed by the ``image_hashes`` table."""
+
+    def __init__(self) -> None:
+        self._trees: dict[str, BKTree] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+        # Hashes announced while a program's tree is loading, replayed onto it
+        self._pending: dict[str, list[tuple[int, str]]] = {}
+        # Bumped by evict; a tree loaded across an eviction isn't kept
+        self._epoch = 0
+
+    async def _tree(self, db: AsyncSession, program_id: str) -> BKTree:
+        tree = self._trees.get(program_id)
+        if tree is not None and cache_bus.listening:
+            return tree
+        lock = self._locks.setdefault(program_id, asyncio.Lock())
+        async with lock:
+            tree = self._trees.get(program_id)
+            if tree is not None and cache_bus.listening:
+                return tree
+            epoch = self._epoch
+            pending = self._pending[program_id] = []
+            try:
+                tree = BKTree()
+                result = await db.execute(
+                    select(ImageHashDB.phash, ImageHashDB.url).where(
+                        ImageHashDB.program_id == program_id
+                    )
+                )
+                for h, url in result.all():
+                    tree.add(to_unsigned(h), url)
+                for h, url in pending:
+                    tree.add(h, url)
+            finally:
+                del self._pending[program_id]
+            if cache_bus.listening and self._epoch == epoch:
+                self._trees[program_id] = tree
+        return tree
+
+    async def lookup(
+        self,
+        db: AsyncSession,
+        program_id: str,
+        h: int,
+        k: int = DUPLICATE_MAX_DISTANCE,
+        recent: Iterable[tuple[int, str]] = (),
+    ) -> list[tuple[int, str]]:
+        """Stored images of *program_id* within Hamming distance *k* of *h*.
+
+        *recent* holds ``(hash, url)`` pairs added but not yet committed (the
+        earlier files of the same upload), which no tree has seen yet.
+        """
+        found = (await self._tree(db, program_id)).search(h, k)
+        # An uncached load may have autoflushed some of them already
+        seen = {url for _, url in found}
+        extra = [
+            (d, url)
+            for rh, url in recent
+            if (d := (rh ^ h).bit_count()) <= k and url not in seen
+        ]
+        if extra:
+            found = sorted(found + extra)
+        return found
+
+    async def add(self, db: AsyncSession, program_id: str, h: int, url: str) -> None:
+        """Record a stored image's hash; the caller commits the session.
+
+        Trees pick the hash up once the commit announces it; until then pass
+        it to ``lookup`` as *recent*.
+        """
+        db.add(ImageHashDB(program_id=program_id, phash=to_signed(h), url=url))
+        await cache_bus.publish(
+            "image_hash", {"program_id": program_id, "phash": h, "url": url}, db, local=False
+        )
+
+    def apply(self, program_id: str, h: int, url: str) -> None:
+        """Index a hash another upload (in any worker) just committed."""
+        tree = self._trees.get(program_id)
+        if tree is not None:
+            tree.add(h, url)
+        pending = self._pending.get(program_id)
+        if pending is not None:
+            pending.append((h, url))
+
+    def evict(self, program_id: str | None = None) -> None:
+        """Drop cached trees so they reload from the database on next use."""
+        self._epoch += 1
+        if program_id is None:
+            self._trees.clear()
+        else:
+            self._trees.pop(program_id, None)
+
+
+def _on_hash(data: dict | None) -> None:
+    if data is None:
+        hash_index.evict()
+    else:
+        hash_index.apply(data["program_id"], data["phash"], data["url"])
+
+
+hash_index = HashIndex()
+cache_bus.subscribe(
+    "program", lambda data: hash_index.evict(data["program_id"] if data else None)
+)
+cache_bus.subscribe("image_hash", _on_hash)
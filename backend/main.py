@@ -1,55 +1,80 @@
+import asyncio
 import os
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 
-import sqlalchemy
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 
-from backend.database import Base, async_session, engine
-from backend.db_models import DatasetDB, FormConfigDB, ProgramDB, SubmissionDB  # noqa: F401
-from backend.routes import datasets, dynamic_tables, form_configs, programs, submissions, uploads
-from backend.seed import seed
+from backend import metrics
+from backend.cache_bus import cache_bus
+from backend.change_feed import change_feed
+from backend.database import engine
+from backend.db_models import DatasetDB, FormConfigDB, ProgramDB, SubmissionDB, UploadAnalysisDB, ImageHashDB, TableProfileDB  # noqa: F401
+from backend.migrations import run_migrations
+from backend.replicas import ReadYourWritesMiddleware, replica_set
+from backend.storage import LocalStorage, upload_storage
+from backend.routes import datasets, dynamic_tables, form_configs, programs, species, submissions, tiles, uploads
+
+# Seconds between partition maintenance runs; 0 disables the background task
+PARTITION_MAINTENANCE_INTERVAL = int(os.getenv("PARTITION_MAINTENANCE_INTERVAL", "3600"))
+# Seconds between data-profiling runs over program tables; 0 disables
+PROFILE_INTERVAL = int(os.getenv("PROFILE_INTERVAL", "3600"))
+
+
+async def _partition_maintenance_loop() -> None:
+    while True:
+        try:
+            await dynamic_tables.maintain_all_partitions()
+        except Exception:
+            pass  # maintenance failure shouldn't take down the API
+        await asyncio.sleep(PARTITION_MAINTENANCE_INTERVAL)
+
+
+async def _profiling_loop() -> None:
+    while True:
+        try:
+            await dynamic_tables.profile_all_tables()
+        except Exception:
+            pass  # a failed run is retried next interval
+        await asyncio.sleep(PROFILE_INTERVAL)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-        # Add contribution_spec column if missing (no Alembic migrations)
-        await conn.execute(
-            sqlalchemy.text(
-                "ALTER TABLE programs ADD COLUMN IF NOT EXISTS contribution_spec JSONB"
-            )
-        )
-        await conn.execute(
-            sqlalchemy.text(
-                "ALTER TABLE programs ADD COLUMN IF NOT EXISTS project_name VARCHAR"
-            )
-        )
-        await conn.execute(
-            sqlalchemy.text(
-                "ALTER TABLE programs ADD COLUMN IF NOT EXISTS table_name VARCHAR"
-            )
-        )
-        await conn.execute(
-            sqlalchemy.text(
-                "ALTER TABLE programs ADD COLUMN IF NOT EXISTS cnn_filter VARCHAR"
-            )
-        )
-        await conn.execute(
-            sqlalchemy.text(
-                "ALTER TABLE programs ADD COLUMN IF NOT EXISTS table_cnn JSONB"
-            )
-        )
-    async with async_session() as session:
-        await seed(session)
+    await run_migrations(engine)
+    await upload_storage.prepare()
+    cache_bus.start()
+    background = []
+    if PARTITION_MAINTENANCE_INTERVAL > 0:
+        background.append(asyncio.create_task(_partition_maintenance_loop()))
+    if PROFILE_INTERVAL > 0:
+        background.append(asyncio.create_task(_profiling_loop()))
+    if replica_set.replicas:
+        await replica_set.check_all()
+        background.append(asyncio.create_task(replica_set.health_loop()))
     yield
+    for task in background:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    await cache_bus.stop()
+    await change_feed.close()
+    await dynamic_tables.close_pool()
+    await replica_set.dispose()
     await engine.dispose()
 
 
-app = FastAPI(title="EcoExchange API", lifespan=lifespan)
+app = FastAPI(
+    title="EcoExchange API",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
+metrics.instrument_engine(engine)
+app.add_middleware(ReadYourWritesMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],
@@ -64,10 +89,24 @@ app.include_router(submissions.router)
 app.include_router(uploads.router)
 app.include_router(dynamic_tables.router)
 app.include_router(form_configs.router)
+app.include_router(tiles.router)
+app.include_router(species.router)
+
+
+if isinstance(upload_storage, LocalStorage):
+    os.makedirs(upload_storage.root, exist_ok=True)
+    app.mount("/uploads", StaticFiles(directory=upload_storage.root), name="uploads")
+else:
+
+    @app.get("/uploads/{key:path}", include_in_schema=False)
+    async def serve_upload(key: str) -> Response:
+        return await upload_storage.response(key)
 
 
-os.makedirs("/app/uploads", exist_ok=True)
-app.mount("/uploads", StaticFiles(directory="/app/uploads"), name="uploads")
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics() -> Response:
+    body, content_type = metrics.render_latest()
+    return Response(content=body, media_type=content_type)
 
 
 @app.get("/api/categories")
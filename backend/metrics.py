@@ -0,0 +1,256 @@
+"""
+Request-level performance instrumentation.
+
+Exposes Prometheus metrics (served on ``/metrics``) for per-route latency,
+request/response bytes, database connect/query time and the individual
+stages of image analysis. ``span()`` times a stage into the stage histogram
+and, when tracing is configured, records an OpenTelemetry span as well.
+
+Tracing is optional and needs ``opentelemetry-sdk``:
+
+* ``OTEL_EXPORTER_OTLP_ENDPOINT`` — export spans over OTLP/HTTP to a collector
+  (needs ``opentelemetry-exporter-otlp-proto-http``)
+* ``TRACE_EXPORT_FILE`` — append spans as JSON lines to a local file
+
+With several worker processes set ``PROMETHEUS_MULTIPROC_DIR`` so ``/metrics``
+aggregates across workers.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+
+REQUEST_LATENCY = Histogram(
+    "ecoexchange_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+)
+REQUEST_BYTES = Counter(
+    "ecoexchange_request_bytes_total", "Request body bytes received", ["route"]
+)
+RESPONSE_BYTES = Counter(
+    "ecoexchange_response_bytes_total", "Response body bytes sent", ["route"]
+)
+STAGE_LATENCY = Histogram(
+    "ecoexchange_stage_duration_seconds",
+    "Latency of explicitly timed stages (image decode, quality, CNN, storage, ...)",
+    ["stage"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+DB_CONNECT_LATENCY = Histogram(
+    "ecoexchange_db_connect_seconds", "Time to open a database connection", ["target"]
+)
+DB_QUERY_LATENCY = Histogram(
+    "ecoexchange_db_query_seconds", "Database query execution time", ["target"]
+)
+DB_READ_ROUTE = Counter(
+    "ecoexchange_db_read_route_total", "Read-only handlers served by primary vs replica", ["target"]
+)
+CNN_CASCADE = Counter(
+    "ecoexchange_cnn_cascade_total",
+    "Cascade check_category outcomes (accept/reject early, or escalate)",
+    ["outcome"],
+)
+CNN_CASCADE_AUDIT = Counter(
+    "ecoexchange_cnn_cascade_audit_total",
+    "Audited early exits that agree/disagree with the full pass",
+    ["result"],
+)
+ADMISSION_IN_FLIGHT = Gauge("ecoexchange_admission_in_flight", "Analyses currently running")
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "ecoexchange_admission_queue_depth", "Analyses waiting for a slot"
+)
+ADMISSION_QUEUED_PROGRAMS = Gauge(
+    "ecoexchange_admission_queued_programs", "Programs with analyses waiting for a slot"
+)
+ADMISSION_WAIT = Histogram(
+    "ecoexchange_admission_wait_seconds",
+    "Time an analysis waited for a slot",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+ADMISSION_REJECTED = Counter(
+    "ecoexchange_admission_rejected_total", "Analyses refused with 429 (queue full)"
+)
+CACHE_BUS_EVENTS = Counter(
+    "ecoexchange_cache_bus_events_total", "Cache invalidation events handled", ["topic"]
+)
+CACHE_BUS_PUBLISH_FAILURES = Counter(
+    "ecoexchange_cache_bus_publish_failures_total",
+    "Events that couldn't be sent after their change had committed",
+    ["topic"],
+)
+CACHE_BUS_LISTENING = Gauge(
+    "ecoexchange_cache_bus_listening", "1 while the cache invalidation listener is connected"
+)
+CHANGE_FEED_SUBSCRIBERS = Gauge(
+    "ecoexchange_change_feed_subscribers", "Open change-feed (SSE) streams"
+)
+CHANGE_FEED_BATCHES = Counter(
+    "ecoexchange_change_feed_batches_total", "Coalesced row batches fetched and fanned out"
+)
+CHANGE_FEED_DROPPED = Counter(
+    "ecoexchange_change_feed_dropped_total", "Subscribers dropped for falling behind"
+)
+REPLICA_HEALTHY = Gauge(
+    "ecoexchange_replica_healthy", "1 if the read replica passed its last health check", ["replica"]
+)
+REPLICA_LAG = Gauge(
+    "ecoexchange_replica_lag_seconds", "Replay lag of the read replica at its last check", ["replica"]
+)
+
+
+def _setup_tracing():
+    """Configure an OpenTelemetry tracer if requested and installed."""
+    endpoint = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
+    trace_file = os.getenv("TRACE_EXPORT_FILE")
+    if not endpoint and not trace_file:
+        return None
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    except ImportError:
+        return None
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "ecoexchange-api")})
+    )
+    if endpoint:
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+            provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        except ImportError:
+            pass
+    if trace_file:
+        out = open(trace_file, "a", buffering=1)
+        provider.add_span_processor(
+            BatchSpanProcessor(
+                ConsoleSpanExporter(
+                    out=out, formatter=lambda s: s.to_json(indent=None) + "\n"
+                )
+            )
+        )
+    trace.set_tracer_provider(provider)
+    return trace.get_tracer("ecoexchange")
+
+
+_tracer = _setup_tracing()
+
+
+@contextmanager
+def span(stage: str, **attributes):
+    """Time a stage into ``STAGE_LATENCY`` and, if tracing is on, a trace span."""
+    start = time.perf_counter()
+    if _tracer is None:
+        try:
+            yield
+        finally:
+            STAGE_LATENCY.labels(stage).observe(time.perf_counter() - start)
+        return
+    with _tracer.start_as_current_span(stage, attributes=attributes):
+        try:
+            yield
+        finally:
+            STAGE_LATENCY.labels(stage).observe(time.perf_counter() - start)
+
+
+def query_logger(target: str):
+    """Return an asyncpg query logger that records query time for *target*."""
+    histogram = DB_QUERY_LATENCY.labels(target)
+
+    def _log(record) -> None:
+        histogram.observe(record.elapsed)
+
+    return _log
+
+
+def instrument_engine(engine) -> None:
+    """Record query time for every statement run through a SQLAlchemy engine."""
+    from sqlalchemy import event
+
+    histogram = DB_QUERY_LATENCY.labels("main")
+
+    # The start time lives on the statement's execution context, so one that
+    # raises (and never reaches after_cursor_execute) leaves nothing behind
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._eco_query_start = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_eco_query_start", None)
+        if start is not None:
+            histogram.observe(time.perf_counter() - start)
+
+
+def render_latest() -> tuple[bytes, str]:
+    """Return the Prometheus exposition body and its content type."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and body sizes per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        bytes_in = 0
+        bytes_out = 0
+        status = 500
+
+        async def counting_receive():
+            nonlocal bytes_in
+            message = await receive()
+            if message["type"] == "http.request":
+                bytes_in += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            nonlocal bytes_out, status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                bytes_out += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            if _tracer is None:
+                await self.app(scope, counting_receive, counting_send)
+            else:
+                with _tracer.start_as_current_span(
+                    f"{scope['method']} {scope['path']}",
+                    attributes={"http.method": scope["method"], "http.target": scope["path"]},
+                ):
+                    await self.app(scope, counting_receive, counting_send)
+        finally:
+            # The router stores the matched route on the (shared) scope
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_LATENCY.labels(scope["method"], route, str(status)).observe(
+                time.perf_counter() - start
+            )
+            REQUEST_BYTES.labels(route).inc(bytes_in)
+            RESPONSE_BYTES.labels(route).inc(bytes_out)
@@ -0,0 +1,338 @@
+"""
+Move project databases into per-project schemas of the main database.
+
+For every project database (or just the ones named with ``--project``) this
+recreates each table under a schema named after the project — columns,
+defaults, constraints, partitioning, child partitions, comments and
+indexes — then streams the rows across with binary ``COPY`` and checks the
+row counts match. Partitions archived into the project's ``archive`` schema
+land in ``<project>_archive``.
+
+Each table is copied in its own transaction on the destination, so an
+interrupted run leaves no half-filled tables behind, and tables that
+already exist in the destination with a matching row count are skipped:
+re-running the tool is safe. Once every project is moved, start the API
+with ``PROJECT_STORAGE=schema``.
+
+Usage::
+
+    python -m backend.migrate_projects --dry-run
+    python -m backend.migrate_projects --project birds --project water
+    python -m backend.migrate_projects --drop-source   # drop each database once verified
+"""
+
+import argparse
+import asyncio
+import re
+import sys
+import time
+
+import asyncpg
+
+from backend import sync
+from backend.cold_storage import CATALOG_TABLE
+from backend.partitions import ARCHIVE_SCHEMA
+from backend.routes.dynamic_tables import (
+    _IDENTIFIER_RE,
+    _is_reserved_schema,
+    _parse_conn_params,
+    _project_dsn,
+)
+
+_SERIAL_TYPES = {"integer": "SERIAL", "bigint": "BIGSERIAL", "smallint": "SMALLSERIAL"}
+
+# COPY chunks buffered between the source and destination connections
+_COPY_QUEUE_SIZE = 64
+
+
+def _q(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+async def _list_projects(main: asyncpg.Connection) -> list[str]:
+    main_db = _parse_conn_params()["dsn"].rsplit("/", 1)[-1].split("?", 1)[0]
+    rows = await main.fetch(
+        """
+        SELECT datname FROM pg_database
+        WHERE NOT datistemplate AND datname NOT IN ('postgres', $1)
+        ORDER BY datname
+        """,
+        main_db,
+    )
+    return [r["datname"] for r in rows if _IDENTIFIER_RE.match(r["datname"])]
+
+
+async def _table_ddl(src: asyncpg.Connection, oid: int, name: str) -> tuple[list[str], list[str]]:
+    """Return ``(statements, serial_columns)`` recreating table *oid* unqualified."""
+    columns = await src.fetch(
+        """
+        SELECT a.attname, format_type(a.atttypid, a.atttypmod) AS type,
+               a.attnotnull, pg_get_expr(d.adbin, d.adrelid) AS default_expr
+        FROM pg_attribute a
+        LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+        WHERE a.attrelid = $1 AND a.attnum > 0 AND NOT a.attisdropped
+        ORDER BY a.attnum
+        """,
+        oid,
+    )
+    defs: list[str] = []
+    serials: list[str] = []
+    for c in columns:
+        default = c["default_expr"]
+        if default and default.startswith("nextval(") and c["type"] in _SERIAL_TYPES:
+            defs.append(f"{_q(c['attname'])} {_SERIAL_TYPES[c['type']]}")
+            serials.append(c["attname"])
+            continue
+        col = f"{_q(c['attname'])} {c['type']}"
+        if default:
+            col += f" DEFAULT {default}"
+        if c["attnotnull"]:
+            col += " NOT NULL"
+        defs.append(col)
+
+    for con in await src.fetch(
+        """
+        SELECT conname, pg_get_constraintdef(oid) AS def FROM pg_constraint
+        WHERE conrelid = $1 AND contype IN ('p', 'u', 'c', 'x')
+        ORDER BY conname
+        """,
+        oid,
+    ):
+        defs.append(f"CONSTRAINT {_q(con['conname'])} {con['def']}")
+
+    info = await src.fetchrow(
+        """
+        SELECT c.relkind, pg_get_partkeydef(c.oid) AS partkey,
+               obj_description(c.oid, 'pg_class') AS comment
+        FROM pg_class c WHERE c.oid = $1
+        """,
+        oid,
+    )
+    create = f"CREATE TABLE {_q(name)} ({', '.join(defs)})"
+    if info["relkind"] == "p":
+        create += f" PARTITION BY {info['partkey']}"
+    statements = [create]
+
+    for child in await src.fetch(
+        """
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) AS bound
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = $1
+        ORDER BY c.relname
+        """,
+        oid,
+    ):
+        statements.append(
+            f"CREATE TABLE {_q(child['relname'])} PARTITION OF {_q(name)} {child['bound']}"
+        )
+
+    # Indexes not backing a constraint; partitions inherit the parent's
+    for idx in await src.fetch(
+        """
+        SELECT pg_get_indexdef(i.indexrelid) AS def FROM pg_index i
+        WHERE i.indrelid = $1
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint k WHERE k.conindid = i.indexrelid)
+        """,
+        oid,
+    ):
+        # indexdef is always schema-qualified; run it against the search_path instead
+        stmt = re.sub(r" ON (ONLY )?\S+?\.", r" ON \1", idx["def"], count=1)
+        statements.append(stmt.replace("INDEX ", "INDEX IF NOT EXISTS ", 1))
+
+    if info["comment"] is not None:
+        comment = info["comment"].replace("'", "''")
+        statements.append(f"COMMENT ON TABLE {_q(name)} IS '{comment}'")
+    return statements, serials
+
+
+async def _copy_rows(
+    src: asyncpg.Connection, dst: asyncpg.Connection, src_schema: str, dst_schema: str, table: str
+) -> None:
+    """Stream *table* from *src* to *dst* in binary COPY format."""
+    queue: asyncio.Queue[bytes | None] = asyncio.Queue(maxsize=_COPY_QUEUE_SIZE)
+
+    async def produce() -> None:
+        try:
+            await src.copy_from_query(
+                f"SELECT * FROM {_q(src_schema)}.{_q(table)}",
+                output=queue.put,
+                format="binary",
+            )
+        finally:
+            await queue.put(None)
+
+    async def chunks():
+        while (chunk := await queue.get()) is not None:
+            yield chunk
+
+    producer = asyncio.create_task(produce())
+    try:
+        await dst.copy_to_table(table, schema_name=dst_schema, source=chunks(), format="binary")
+    finally:
+        if not producer.done():
+            producer.cancel()
+    await producer  # re-raise a source-side failure
+
+
+async def _migrate_schema(
+    src: asyncpg.Connection,
+    dst: asyncpg.Connection,
+    src_schema: str,
+    dst_schema: str,
+    dry_run: bool,
+) -> dict[str, int]:
+    tables = await src.fetch(
+        """
+        SELECT c.oid, c.relname FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = $1 AND c.relkind IN ('r', 'p') AND NOT c.relispartition
+        ORDER BY c.relname <> $2, c.relname
+        """,
+        src_schema,
+        sync.TOMBSTONE_TABLE,
+    )
+    # Tombstones go first: enabling sync on any other table creates an empty
+    # tombstone table, which the copy would then refuse as a partial migration
+    copied: dict[str, int] = {}
+    for t in tables:
+        name = t["relname"]
+        source_rows = await src.fetchval(f"SELECT COUNT(*) FROM {_q(src_schema)}.{_q(name)}")
+        statements, serials = await _table_ddl(src, t["oid"], name)
+        if dry_run:
+            print(f"-- {src_schema}.{name} -> {dst_schema}.{name} ({source_rows} rows)")
+            for stmt in statements:
+                print(f"{stmt};")
+            continue
+
+        exists = await dst.fetchval(
+            "SELECT to_regclass($1) IS NOT NULL", f"{_q(dst_schema)}.{_q(name)}"
+        )
+        if exists:
+            target_rows = await dst.fetchval(f"SELECT COUNT(*) FROM {_q(dst_schema)}.{_q(name)}")
+            if target_rows != source_rows:
+                raise RuntimeError(
+                    f"{dst_schema}.{name} already exists with {target_rows} rows "
+                    f"(source has {source_rows}); drop it and re-run"
+                )
+            print(f"  {name}: already migrated ({source_rows} rows)")
+            copied[name] = source_rows
+            continue
+
+        start = time.perf_counter()
+        async with dst.transaction():
+            await dst.execute(f"SET LOCAL search_path TO {_q(dst_schema)}")
+            for stmt in statements:
+                await dst.execute(stmt)
+            await _copy_rows(src, dst, src_schema, dst_schema, name)
+            for col in serials:
+                await dst.execute(
+                    f"""
+                    SELECT setval(
+                        pg_get_serial_sequence($1, $2),
+                        COALESCE((SELECT MAX({_q(col)}) FROM {_q(name)}), 0) + 1,
+                        false
+                    )
+                    """,
+                    f"{_q(dst_schema)}.{_q(name)}",
+                    col,
+                )
+            target_rows = await dst.fetchval(f"SELECT COUNT(*) FROM {_q(name)}")
+            if target_rows != source_rows:
+                raise RuntimeError(
+                    f"{dst_schema}.{name}: copied {target_rows} rows, expected {source_rows}"
+                )
+            # Triggers aren't part of the copied DDL; re-create the delta-sync ones
+            has_version = await dst.fetchval(
+                """
+                SELECT 1 FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = $1 AND column_name = $2
+                """,
+                name,
+                sync.VERSION_COLUMN,
+            )
+            if name == sync.TOMBSTONE_TABLE:
+                # Its indexes came with the DDL; the trigger functions didn't
+                await sync._install_functions(dst)
+            elif has_version and name != CATALOG_TABLE:
+                await sync.enable_sync(dst, name)
+        print(f"  {name}: {source_rows} rows in {time.perf_counter() - start:.1f}s")
+        copied[name] = source_rows
+    return copied
+
+
+async def _migrate_project(
+    main: asyncpg.Connection, project: str, dry_run: bool
+) -> dict[str, int]:
+    src = await asyncpg.connect(dsn=_project_dsn(project))
+    try:
+        if not dry_run:
+            await main.execute(f"CREATE SCHEMA IF NOT EXISTS {_q(project)}")
+        copied = await _migrate_schema(src, main, "public", project, dry_run)
+        has_archive = await src.fetchval(
+            "SELECT 1 FROM pg_namespace WHERE nspname = $1", ARCHIVE_SCHEMA
+        )
+        if has_archive:
+            archive = f"{project}_archive"
+            if not dry_run:
+                await main.execute(f"CREATE SCHEMA IF NOT EXISTS {_q(archive)}")
+            archived = await _migrate_schema(src, main, ARCHIVE_SCHEMA, archive, dry_run)
+            copied.update({f"{ARCHIVE_SCHEMA}.{k}": v for k, v in archived.items()})
+        return copied
+    finally:
+        await src.close()
+
+
+async def run(args: argparse.Namespace) -> int:
+    main = await asyncpg.connect(**_parse_conn_params())
+    try:
+        projects = await _list_projects(main)
+        if args.project:
+            wanted = {p.lower() for p in args.project}
+            missing = wanted - set(projects)
+            if missing:
+                print(f"No such project database: {', '.join(sorted(missing))}", file=sys.stderr)
+                return 1
+            projects = [p for p in projects if p in wanted]
+
+        failed = 0
+        for project in projects:
+            if _is_reserved_schema(project):
+                print(f"{project}: name is reserved in schema mode, skipping", file=sys.stderr)
+                failed += 1
+                continue
+            print(f"{project}:")
+            try:
+                copied = await _migrate_project(main, project, args.dry_run)
+            except (asyncpg.PostgresError, RuntimeError) as exc:
+                print(f"  failed: {exc}", file=sys.stderr)
+                failed += 1
+                continue
+            if args.drop_source and not args.dry_run:
+                await main.execute(f"DROP DATABASE {_q(project)}")
+                print(f"  dropped database {project} ({len(copied)} tables verified)")
+        return 1 if failed else 0
+    finally:
+        await main.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Move project databases into per-project schemas of the main database"
+    )
+    parser.add_argument(
+        "--project", action="append", help="Only migrate this project (repeatable)"
+    )
+    parser.add_argument(
+        "--drop-source",
+        action="store_true",
+        help="Drop each project database after its tables are copied and verified",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Print the DDL that would run and exit"
+    )
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Versioned schema migrations for the main database.
+
+``MIGRATIONS`` is an append-only list of numbered steps; the highest applied
+version is recorded in ``schema_migrations``. On startup every worker first
+reads that version on its own connection and, if the database is current,
+returns immediately — the common case costs one query.
+
+Otherwise the worker takes a transaction-scoped Postgres advisory lock,
+re-reads the version and applies the missing steps in that same transaction.
+Workers starting alongside it block on the lock, then find the database
+current and continue, so DDL never races. A failing step rolls the whole
+run back.
+
+To change the schema, append a new ``Migration`` with the next version number;
+never edit one that has shipped.
+"""
+
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from backend.database import Base
+from backend.db_models import TableProfileDB
+from backend.seed import seed
+from backend.tiles import geo_index_sql, point_expr
+
+# Arbitrary key identifying the migration lock (pg_advisory_xact_lock)
+MIGRATION_LOCK_KEY = 0x65636F6D6967  # "ecomig"
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    apply: Callable[[AsyncConnection], Awaitable[None]]
+
+
+async def _initial_schema(conn: AsyncConnection) -> None:
+    await conn.run_sync(Base.metadata.create_all)
+    # Databases created before these columns existed (no Alembic history)
+    for column, sql_type in (
+        ("contribution_spec", "JSONB"),
+        ("project_name", "VARCHAR"),
+        ("table_name", "VARCHAR"),
+        ("cnn_filter", "VARCHAR"),
+        ("table_cnn", "JSONB"),
+    ):
+        await conn.execute(
+            text(f"ALTER TABLE programs ADD COLUMN IF NOT EXISTS {column} {sql_type}")
+        )
+
+
+async def _table_profiles(conn: AsyncConnection) -> None:
+    await conn.run_sync(TableProfileDB.__table__.create, checkfirst=True)
+
+
+async def _submission_geo_index(conn: AsyncConnection) -> None:
+    # The expressions the map-tile query filters submissions on
+    await conn.execute(
+        text(
+            geo_index_sql(
+                "submissions",
+                point_expr("latitude", "varchar"),
+                point_expr("longitude", "varchar"),
+            )
+        )
+    )
+
+
+MIGRATIONS: list[Migration] = [
+    Migration(1, "initial schema", _initial_schema),
+    Migration(2, "seed programs and datasets", seed),
+    Migration(3, "table profiles", _table_profiles),
+    Migration(4, "submission tile index", _submission_geo_index),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+async def current_version(conn: AsyncConnection) -> int:
+    """Highest applied migration, 0 if the version table doesn't exist yet."""
+    try:
+        version = (
+            await conn.execute(text("SELECT max(version) FROM schema_migrations"))
+        ).scalar()
+    except ProgrammingError:
+        return 0
+    return version or 0
+
+
+async def run_migrations(engine: AsyncEngine) -> list[int]:
+    """Bring the database up to ``LATEST_VERSION``; returns the versions applied."""
+    async with engine.connect() as conn:
+        if await current_version(conn) >= LATEST_VERSION:
+            return []
+
+    applied: list[int] = []
+    async with engine.begin() as conn:
+        await conn.execute(
+            text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY}
+        )
+        await conn.execute(
+            text(
+                """
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    description VARCHAR NOT NULL,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+                """
+            )
+        )
+        version = await current_version(conn)
+        for migration in MIGRATIONS:
+            if migration.version <= version:
+                continue
+            await migration.apply(conn)
+            await conn.execute(
+                text(
+                    "INSERT INTO schema_migrations (version, description) "
+                    "VALUES (:version, :description)"
+                ),
+                {"version": migration.version, "description": migration.description},
+            )
+            applied.append(migration.version)
+    return applied
@@ -1,5 +1,6 @@
-from .program import Program, ProgramCreate
+from .program import Program, ProgramBootstrap, ProgramCreate
 from .dataset import Dataset
 from .submission import Submission, SubmissionResponse
-from .upload import FileInfo, UploadFilterResult, UploadResponse
-from .dynamic_table import FieldType, FieldDefinition, DynamicTableRequest
+from .upload import DuplicateMatch, FileInfo, UploadFilterResult, UploadResponse
+from .dynamic_table import FieldType, FieldDefinition, DynamicTableRequest, PartitionConfig
+from .species import SpeciesAutocomplete, SpeciesSuggestion
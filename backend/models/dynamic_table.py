@@ -1,6 +1,8 @@
+from datetime import date
 from enum import Enum
+from typing import Optional
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class FieldType(str, Enum):
@@ -31,6 +33,37 @@ class FieldDefinition(BaseModel):
     type: FieldType
 
 
+class PartitionInterval(str, Enum):
+    MONTH = "month"
+    YEAR = "year"
+
+
+class PartitionConfig(BaseModel):
+    column: str = Field(
+        default="created_at",
+        description="Partition key: 'created_at' or the name of a DATE field.",
+    )
+    interval: PartitionInterval = PartitionInterval.MONTH
+    premake: int = Field(
+        default=3,
+        ge=0,
+        le=24,
+        description="Number of upcoming partitions to keep created ahead of time.",
+    )
+
+
+class PartitionDetachRequest(BaseModel):
+    before: date = Field(description="Detach partitions whose range ends on or before this date.")
+    archive: bool = Field(
+        default=False,
+        description="Move detached partitions into the 'archive' schema.",
+    )
+
+
+class ColdArchiveRequest(BaseModel):
+    before: date = Field(description="Move rows created before this date into Parquet cold storage.")
+
+
 class DynamicTableRequest(BaseModel):
     model_config = ConfigDict(
         json_schema_extra={
@@ -53,3 +86,4 @@ class DynamicTableRequest(BaseModel):
     project_name: str
     table_name: str
     fields: list[FieldDefinition]
+    partition: Optional[PartitionConfig] = None
@@ -1,6 +1,8 @@
 from typing import Literal, Optional
 from pydantic import BaseModel
 
+from .form_config import FormConfigResponse
+
 
 class Program(BaseModel):
     id: str
@@ -34,3 +36,16 @@ class ProgramCreate(BaseModel):
     fields: list[dict] = []
     cnn_filter: Optional[str] = None
     table_cnn: Optional[dict] = None
+
+
+class TableColumn(BaseModel):
+    name: str
+    type: str
+    nullable: bool
+
+
+class ProgramBootstrap(BaseModel):
+    program: Program
+    form_config: Optional[FormConfigResponse] = None
+    tables: Optional[list[str]] = None
+    schemas: dict[str, list[TableColumn]] = {}
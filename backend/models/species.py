@@ -0,0 +1,14 @@
+from typing import Literal
+
+from pydantic import BaseModel
+
+
+class SpeciesSuggestion(BaseModel):
+    name: str
+    count: int
+    match: Literal["prefix", "fuzzy"]
+
+
+class SpeciesAutocomplete(BaseModel):
+    query: str
+    suggestions: list[SpeciesSuggestion]
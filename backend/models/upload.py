@@ -43,6 +43,37 @@ class CnnResult(BaseModel):
     message: str = Field(description="Human-readable CNN result message")
 
 
+class DuplicateMatch(BaseModel):
+    url: str = Field(description="Stored upload that looks like the same photo")
+    distance: int = Field(description="Hamming distance between perceptual hashes (0-64)")
+
+
+class VideoSampleInfo(BaseModel):
+    frames_sampled: int = Field(description="Frames decoded and analysed")
+    frames_total: int = Field(description="Frame count reported by the container (0 if unknown)")
+    duration: float = Field(description="Clip duration in seconds (0.0 if unknown)")
+    truncated: bool = Field(description="Sampling stopped early on the frame or time budget")
+
+
+class GpsPosition(BaseModel):
+    latitude: float
+    longitude: float
+    altitude: Optional[float] = None
+
+
+class ImageMetadata(BaseModel):
+    """Header and EXIF data read without decoding the image."""
+
+    format: Literal["jpeg", "png", "webp"]
+    width: int
+    height: int
+    orientation: Optional[int] = Field(default=None, description="EXIF orientation (1-8)")
+    make: Optional[str] = None
+    model: Optional[str] = None
+    taken_at: Optional[str] = Field(default=None, description="EXIF capture time as recorded")
+    gps: Optional[GpsPosition] = None
+
+
 class UploadFilterResult(BaseModel):
     """Result of AI filtering for a single file."""
 
@@ -52,11 +83,19 @@ class UploadFilterResult(BaseModel):
     accepted: bool
     reason: Optional[str] = None
     url: Optional[str] = None
+    upload_id: Optional[str] = None
     detected_label: Optional[str] = None
     quality: QualityScanResult = Field(default_factory=QualityScanResult)
     ai_tags: list[str] = []
     ai_confidence: Optional[float] = None
     cnn: Optional[CnnResult] = None
+    phash: Optional[str] = Field(default=None, description="64-bit perceptual hash, hex")
+    duplicates: list[DuplicateMatch] = Field(
+        default_factory=list,
+        description="Near-duplicates already stored for this program.",
+    )
+    image: Optional[ImageMetadata] = None
+    video: Optional[VideoSampleInfo] = None
 
 
 class UploadResponse(BaseModel):
@@ -0,0 +1,113 @@
+"""
+Minimal Mapbox Vector Tile (v2) encoder for point layers.
+
+Writes the protobuf wire format directly: a tile holds layers; a layer
+holds features plus the deduplicated key and value tables that feature
+tags index into. Only ``POINT`` geometry is produced, which is all the
+observation maps need, so no protobuf dependency is required.
+
+Spec: https://github.com/mapbox/vector-tile-spec/tree/master/2.1
+"""
+
+import struct
+
+EXTENT = 4096
+
+# Feature (x, y) in tile coordinates, properties, optional numeric id
+Feature = tuple[int, int, dict, int | None]
+
+_POINT = 1
+_MOVE_TO_ONE = (1 & 0x7) | (1 << 3)  # MoveTo command, count 1
+
+
+def _varint(value: int, out: bytearray) -> None:
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def _tag(field: int, wire_type: int, out: bytearray) -> None:
+    _varint((field << 3) | wire_type, out)
+
+
+def _length_delimited(field: int, payload: bytes | bytearray, out: bytearray) -> None:
+    _tag(field, 2, out)
+    _varint(len(payload), out)
+    out += payload
+
+
+def _packed(field: int, values: list[int], out: bytearray) -> None:
+    payload = bytearray()
+    for v in values:
+        _varint(v, payload)
+    _length_delimited(field, payload, out)
+
+
+def _value(value) -> bytes:
+    out = bytearray()
+    if isinstance(value, bool):
+        _tag(7, 0, out)
+        _varint(int(value), out)
+    elif isinstance(value, int):
+        if value >= 0:
+            _tag(5, 0, out)  # uint_value
+            _varint(value, out)
+        else:
+            _tag(6, 0, out)  # sint_value
+            _varint(_zigzag(value), out)
+    elif isinstance(value, float):
+        _tag(3, 1, out)  # double_value
+        out += struct.pack("<d", value)
+    else:
+        _length_delimited(1, str(value).encode(), out)  # string_value
+    return bytes(out)
+
+
+def encode_layer(name: str, features: list[Feature], extent: int = EXTENT) -> bytes:
+    keys: dict[str, int] = {}
+    values: dict[bytes, int] = {}
+    out = bytearray()
+    _tag(15, 0, out)  # version
+    _varint(2, out)
+    _length_delimited(1, name.encode(), out)
+
+    for x, y, properties, feature_id in features:
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            encoded = _value(value)
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault(encoded, len(values)))
+        feature = bytearray()
+        if feature_id is not None:
+            _tag(1, 0, feature)
+            _varint(feature_id, feature)
+        if tags:
+            _packed(2, tags, feature)
+        _tag(3, 0, feature)
+        _varint(_POINT, feature)
+        _packed(4, [_MOVE_TO_ONE, _zigzag(x), _zigzag(y)], feature)
+        _length_delimited(2, feature, out)
+
+    for key in keys:
+        _length_delimited(3, key.encode(), out)
+    for encoded in values:
+        _length_delimited(4, encoded, out)
+    _tag(5, 0, out)
+    _varint(extent, out)
+    return bytes(out)
+
+
+def encode_tile(layers: dict[str, list[Feature]], extent: int = EXTENT) -> bytes:
+    """Encode ``{layer name: features}``; empty layers are left out."""
+    out = bytearray()
+    for name, features in layers.items():
+        if features:
+            _length_delimited(3, encode_layer(name, features, extent), out)
+    return bytes(out)
@@ -0,0 +1,183 @@
+"""
+Declarative range partitioning helpers for dynamic tables.
+
+A partitioned dynamic table is a normal parent table declared with
+``PARTITION BY RANGE`` on ``created_at`` or a DATE field. Child partitions
+are named ``{table}_pYYYY_MM`` (monthly) or ``{table}_pYYYY`` (yearly), and a
+``{table}_default`` partition catches rows outside every range (including
+NULL partition keys), so inserts never fail for lack of a partition.
+Partitioned table names are capped at ``MAX_TABLE_NAME`` characters so the
+partition names stay within Postgres' identifier limit instead of being
+truncated into each other.
+
+The partition settings are stored as a JSON comment on the parent table so
+maintenance can run without any extra bookkeeping tables.
+"""
+
+import json
+import re
+from datetime import date
+
+import asyncpg
+
+ARCHIVE_SCHEMA = "archive"
+
+# Postgres truncates identifiers beyond 63 bytes (NAMEDATALEN - 1); leave room
+# for the longest partition suffix, "_pYYYY_MM"
+MAX_TABLE_NAME = 63 - len("_p0000_00")
+
+_BOUND_RE = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def period_start(day: date, interval: str) -> date:
+    if interval == "year":
+        return date(day.year, 1, 1)
+    return date(day.year, day.month, 1)
+
+
+def add_periods(start: date, interval: str, n: int) -> date:
+    if interval == "year":
+        return date(start.year + n, 1, 1)
+    months = start.year * 12 + (start.month - 1) + n
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def partition_name(table: str, start: date, interval: str) -> str:
+    if interval == "year":
+        return f"{table}_p{start.year:04d}"
+    return f"{table}_p{start.year:04d}_{start.month:02d}"
+
+
+def create_table_sql(table: str, column_defs: list[str], column: str) -> list[str]:
+    """Statements that create a partitioned parent plus its default partition.
+
+    The parent has no primary key: Postgres requires the partition key in
+    every unique constraint, which would force DATE partition columns to be
+    NOT NULL. ``id`` stays unique through its sequence and is indexed.
+    """
+    return [
+        f'CREATE TABLE IF NOT EXISTS "{table}" ({", ".join(column_defs)}) '
+        f'PARTITION BY RANGE ("{column}")',
+        f'CREATE INDEX IF NOT EXISTS "{table}_id_idx" ON "{table}" (id)',
+        f'CREATE TABLE IF NOT EXISTS "{table}_default" '
+        f'PARTITION OF "{table}" DEFAULT',
+    ]
+
+
+async def set_partition_config(
+    conn: asyncpg.Connection, table: str, column: str, interval: str, premake: int
+) -> None:
+    config = json.dumps({"column": column, "interval": interval, "premake": premake})
+    # COMMENT does not accept bind parameters; quote the literal ourselves
+    literal = config.replace("'", "''")
+    await conn.execute(f"COMMENT ON TABLE \"{table}\" IS '{literal}'")
+
+
+async def get_partition_config(conn: asyncpg.Connection, table: str) -> dict | None:
+    """Return the partition settings for *table*, or None if it is a heap table."""
+    row = await conn.fetchrow(
+        """
+        SELECT c.relkind, obj_description(c.oid, 'pg_class') AS config
+        FROM pg_class c
+        WHERE c.oid = to_regclass($1)
+        """,
+        f'"{table}"',
+    )
+    if row is None or row["relkind"] != "p" or not row["config"]:
+        return None
+    try:
+        return json.loads(row["config"])
+    except ValueError:
+        return None
+
+
+async def list_partitions(conn: asyncpg.Connection, table: str) -> list[dict]:
+    """List child partitions with their date range and estimated row count."""
+    rows = await conn.fetch(
+        """
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) AS bound,
+               c.reltuples::bigint AS estimated_rows
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass($1)
+        ORDER BY c.relname
+        """,
+        f'"{table}"',
+    )
+    partitions = []
+    for r in rows:
+        match = _BOUND_RE.search(r["bound"] or "")
+        partitions.append(
+            {
+                "name": r["relname"],
+                "from": match.group(1)[:10] if match else None,
+                "to": match.group(2)[:10] if match else None,
+                "default": match is None,
+                "estimated_rows": max(r["estimated_rows"], 0),
+            }
+        )
+    return partitions
+
+
+async def ensure_partitions(
+    conn: asyncpg.Connection, table: str, config: dict, today: date | None = None
+) -> list[str]:
+    """Create the current partition and ``premake`` upcoming ones if missing.
+
+    Returns the names of partitions that were created. A range that already
+    has rows sitting in the default partition is skipped rather than failing
+    the whole run; move those rows out before maintenance can claim it. So is
+    one whose name is taken, e.g. by a concurrent maintenance run.
+    """
+    interval = config.get("interval", "month")
+    premake = int(config.get("premake", 3))
+    start = period_start(today or date.today(), interval)
+
+    existing = {p["name"] for p in await list_partitions(conn, table)}
+    created: list[str] = []
+    for n in range(premake + 1):
+        lower = add_periods(start, interval, n)
+        upper = add_periods(lower, interval, 1)
+        name = partition_name(table, lower, interval)
+        if name in existing:
+            continue
+        try:
+            await conn.execute(
+                f'CREATE TABLE "{name}" PARTITION OF "{table}" '
+                f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+            )
+        except (asyncpg.CheckViolationError, asyncpg.DuplicateTableError):
+            continue
+        created.append(name)
+    return created
+
+
+async def detach_partitions(
+    conn: asyncpg.Connection,
+    table: str,
+    before: date,
+    archive: bool,
+    archive_schema: str = ARCHIVE_SCHEMA,
+) -> list[str]:
+    """Detach every range partition whose upper bound is on or before *before*.
+
+    Detached partitions become standalone tables. With ``archive`` they are
+    also moved into *archive_schema* so they drop out of the project's
+    table listing while remaining queryable.
+    """
+    detached: list[str] = []
+    async with conn.transaction():
+        if archive:
+            await conn.execute(f'CREATE SCHEMA IF NOT EXISTS "{archive_schema}"')
+        for p in await list_partitions(conn, table):
+            if p["default"] or p["to"] is None:
+                continue
+            if date.fromisoformat(p["to"]) > before:
+                continue
+            await conn.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{p["name"]}"')
+            if archive:
+                await conn.execute(
+                    f'ALTER TABLE "{p["name"]}" SET SCHEMA "{archive_schema}"'
+                )
+            detached.append(p["name"])
+    return detached
@@ -0,0 +1,240 @@
+"""
+Header-only probing of JPEG, PNG and WebP uploads.
+
+Reads just the container headers — never the pixel data — to get the
+format, dimensions and EXIF metadata (orientation, camera, capture time,
+GPS). The upload pipeline uses it to reject corrupt or tiny files before
+paying for a full decode.
+
+``probe_image`` returns None for formats it doesn't recognise (the caller
+falls back to a full decode) and raises ``ProbeError`` when a recognised
+header is truncated or malformed.
+"""
+
+import struct
+
+# JPEG start-of-frame markers carrying the frame dimensions
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# TIFF field type -> size in bytes
+_TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+
+_TAG_ORIENTATION = 0x0112
+_TAG_MAKE = 0x010F
+_TAG_MODEL = 0x0110
+_TAG_DATETIME = 0x0132
+_TAG_EXIF_IFD = 0x8769
+_TAG_GPS_IFD = 0x8825
+_TAG_DATETIME_ORIGINAL = 0x9003
+
+
+class ProbeError(ValueError):
+    """A recognised image header is truncated or malformed."""
+
+
+def _read_ifd(tiff: bytes, offset: int, endian: str) -> dict[int, object]:
+    """Parse one TIFF IFD into ``{tag: value}``; unknown types are skipped."""
+    if offset + 2 > len(tiff):
+        raise ProbeError("EXIF IFD offset out of range")
+    (count,) = struct.unpack_from(endian + "H", tiff, offset)
+    entries: dict[int, object] = {}
+    for i in range(count):
+        pos = offset + 2 + i * 12
+        if pos + 12 > len(tiff):
+            raise ProbeError("Truncated EXIF IFD")
+        tag, typ, n = struct.unpack_from(endian + "HHI", tiff, pos)
+        size = _TIFF_TYPE_SIZES.get(typ)
+        if size is None:
+            continue
+        total = size * n
+        data_pos = pos + 8 if total <= 4 else struct.unpack_from(endian + "I", tiff, pos + 8)[0]
+        if data_pos + total > len(tiff):
+            continue
+        if typ == 2:
+            entries[tag] = tiff[data_pos : data_pos + total].split(b"\0", 1)[0].decode(
+                "ascii", "replace"
+            ).strip()
+        elif typ in (5, 10):
+            fmt = "I" if typ == 5 else "i"
+            values = struct.unpack_from(endian + fmt * (2 * n), tiff, data_pos)
+            entries[tag] = [
+                values[j] / values[j + 1] if values[j + 1] else 0.0
+                for j in range(0, len(values), 2)
+            ]
+        elif typ in (3, 4, 9):
+            fmt = {3: "H", 4: "I", 9: "i"}[typ]
+            values = struct.unpack_from(endian + fmt * n, tiff, data_pos)
+            entries[tag] = values[0] if n == 1 else list(values)
+        else:
+            entries[tag] = tiff[data_pos : data_pos + total]
+    return entries
+
+
+def _gps_from_ifd(gps: dict[int, object]) -> dict | None:
+    def to_degrees(value, ref, negative: str) -> float | None:
+        if not isinstance(value, list) or len(value) != 3:
+            return None
+        degrees = value[0] + value[1] / 60 + value[2] / 3600
+        return round(-degrees if ref == negative else degrees, 7)
+
+    latitude = to_degrees(gps.get(2), gps.get(1), "S")
+    longitude = to_degrees(gps.get(4), gps.get(3), "W")
+    if latitude is None or longitude is None:
+        return None
+    result = {"latitude": latitude, "longitude": longitude}
+    altitude = gps.get(6)
+    if isinstance(altitude, list) and altitude:
+        below = gps.get(5) == b"\x01"
+        result["altitude"] = round(-altitude[0] if below else altitude[0], 2)
+    return result
+
+
+def parse_exif(tiff: bytes) -> dict:
+    """Extract orientation, camera, capture time and GPS from a TIFF/EXIF blob."""
+    if tiff.startswith(b"Exif\0\0"):
+        tiff = tiff[6:]
+    if len(tiff) < 8:
+        raise ProbeError("Truncated EXIF header")
+    if tiff[:2] == b"II":
+        endian = "<"
+    elif tiff[:2] == b"MM":
+        endian = ">"
+    else:
+        raise ProbeError("Bad EXIF byte order")
+    (ifd0_offset,) = struct.unpack_from(endian + "I", tiff, 4)
+    ifd0 = _read_ifd(tiff, ifd0_offset, endian)
+
+    exif: dict = {}
+    if isinstance(ifd0.get(_TAG_ORIENTATION), int):
+        exif["orientation"] = ifd0[_TAG_ORIENTATION]
+    for tag, key in ((_TAG_MAKE, "make"), (_TAG_MODEL, "model"), (_TAG_DATETIME, "datetime")):
+        if isinstance(ifd0.get(tag), str) and ifd0[tag]:
+            exif[key] = ifd0[tag]
+    if isinstance(ifd0.get(_TAG_EXIF_IFD), int):
+        sub = _read_ifd(tiff, ifd0[_TAG_EXIF_IFD], endian)
+        if isinstance(sub.get(_TAG_DATETIME_ORIGINAL), str):
+            exif["datetime_original"] = sub[_TAG_DATETIME_ORIGINAL]
+    if isinstance(ifd0.get(_TAG_GPS_IFD), int):
+        gps = _gps_from_ifd(_read_ifd(tiff, ifd0[_TAG_GPS_IFD], endian))
+        if gps:
+            exif["gps"] = gps
+    return exif
+
+
+def _probe_jpeg(data: bytes) -> dict:
+    pos = 2
+    width = height = None
+    exif: dict = {}
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            raise ProbeError("Corrupt JPEG marker stream")
+        marker = data[pos + 1]
+        if marker == 0xFF:  # fill byte
+            pos += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        (length,) = struct.unpack_from(">H", data, pos + 2)
+        segment = data[pos + 4 : pos + 2 + length]
+        if length < 2 or len(segment) != length - 2:
+            raise ProbeError("Truncated JPEG segment")
+        if marker == 0xE1 and segment.startswith(b"Exif\0\0") and not exif:
+            try:
+                exif = parse_exif(segment)
+            except (ProbeError, struct.error):
+                exif = {}  # broken EXIF shouldn't fail an otherwise valid JPEG
+        elif marker in _SOF_MARKERS:
+            if len(segment) < 5:
+                raise ProbeError("Truncated JPEG frame header")
+            height, width = struct.unpack_from(">HH", segment, 1)
+        elif marker == 0xDA:  # start of scan: pixel data follows
+            break
+        pos += 2 + length
+    if not width or not height:
+        raise ProbeError("JPEG has no frame header")
+    return {"format": "jpeg", "width": width, "height": height, "exif": exif}
+
+
+def _probe_png(data: bytes) -> dict:
+    if len(data) < 33 or data[12:16] != b"IHDR":
+        raise ProbeError("PNG missing IHDR")
+    width, height = struct.unpack_from(">II", data, 16)
+    exif: dict = {}
+    pos = 8
+    while pos + 8 <= len(data):
+        length, ctype = struct.unpack_from(">I4s", data, pos)
+        if ctype in (b"IDAT", b"IEND"):
+            break
+        if ctype == b"eXIf":
+            try:
+                exif = parse_exif(data[pos + 8 : pos + 8 + length])
+            except (ProbeError, struct.error):
+                exif = {}
+        pos += 12 + length
+    if not width or not height:
+        raise ProbeError("PNG has zero dimensions")
+    return {"format": "png", "width": width, "height": height, "exif": exif}
+
+
+def _probe_webp(data: bytes) -> dict:
+    width = height = None
+    exif: dict = {}
+    pos = 12
+    while pos + 8 <= len(data):
+        ctype, length = struct.unpack_from("<4sI", data, pos)
+        body = data[pos + 8 : pos + 8 + length]
+        if ctype == b"VP8 " and len(body) >= 10:
+            if body[3:6] != b"\x9d\x01\x2a":
+                raise ProbeError("Bad VP8 start code")
+            w, h = struct.unpack_from("<HH", body, 6)
+            width, height = w & 0x3FFF, h & 0x3FFF
+        elif ctype == b"VP8L" and len(body) >= 5:
+            if body[0] != 0x2F:
+                raise ProbeError("Bad VP8L signature")
+            (bits,) = struct.unpack_from("<I", body, 1)
+            width, height = (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        elif ctype == b"VP8X" and len(body) >= 10:
+            width = int.from_bytes(body[4:7], "little") + 1
+            height = int.from_bytes(body[7:10], "little") + 1
+        elif ctype == b"EXIF":
+            try:
+                exif = parse_exif(body)
+            except (ProbeError, struct.error):
+                exif = {}
+        pos += 8 + length + (length & 1)  # chunks are padded to even sizes
+    if not width or not height:
+        raise ProbeError("WebP has no image header")
+    return {"format": "webp", "width": width, "height": height, "exif": exif}
+
+
+def probe_image(data: bytes) -> dict | None:
+    """Read format, dimensions and EXIF from an image header without decoding.
+
+    Returns::
+
+        {
+            "format": "jpeg",        # jpeg | png | webp
+            "width": 4032,
+            "height": 3024,
+            "exif": {                # any of these keys may be missing
+                "orientation": 6,
+                "make": "...", "model": "...",
+                "datetime": "...", "datetime_original": "...",
+                "gps": {"latitude": 51.5, "longitude": -0.12, "altitude": 35.0},
+            },
+        }
+
+    Returns None if the format isn't recognised; raises ``ProbeError`` if a
+    recognised header is corrupt.
+    """
+    try:
+        if data[:3] == b"\xff\xd8\xff":
+            return _probe_jpeg(data)
+        if data[:8] == b"\x89PNG\r\n\x1a\n":
+            return _probe_png(data)
+        if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+            return _probe_webp(data)
+    except struct.error as exc:
+        raise ProbeError(f"Truncated image header ({exc})") from exc
+    return None
@@ -0,0 +1,440 @@
+"""
+Sampled data profiling of dynamic tables.
+
+A profile holds, per column, the null rate, a distinct-count estimate and,
+for numeric columns, min/max/mean/stddev, a histogram and the share of
+outliers. Outliers are values beyond 1.5 IQR of the quartiles. The
+profile also derives the ``records`` and ``quality_score`` shown on the
+datasets of the programs writing to the table.
+
+All of it is computed by Postgres over a temporary copy of at most
+``PROFILE_SAMPLE_ROWS`` rows, so cost doesn't grow with the table:
+
+* A table with up to that many rows is copied whole. A larger one is read
+  with ``TABLESAMPLE SYSTEM``, which reads only the sampled pages.
+* Distinct counts use a HyperLogLog sketch (2**12 registers, about 1.6%
+  error). Postgres hashes each value and returns one maximum per register.
+  On a sampled profile the estimate is of the distinct values in the
+  sample, a lower bound for the table.
+
+Later runs are incremental. Only rows with an id above the last one seen
+are read, and their counters, histogram counts and sketch registers are
+merged into the stored state. On a sampled profile the new rows are
+sampled at the same rate first, so they carry the same weight as the rows
+already counted. The histogram edges and outlier fences stay those of the
+last full pass. A full pass ("rebase") runs instead when
+there is no state yet, when more than ``PROFILE_SAMPLE_ROWS`` rows arrived
+since, when the columns or the table's cold-storage archive changed, or
+when the last rebase is older than ``PROFILE_MAX_AGE`` seconds, which is
+also when deletes are picked up.
+"""
+
+import base64
+import copy
+import math
+import os
+from datetime import date, datetime, timezone
+
+import asyncpg
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend import cold_storage
+from backend.db_models import DatasetDB, ProgramDB, TableProfileDB
+from backend.metrics import span
+from backend.row_validators import TableValidator
+
+PROFILE_SAMPLE_ROWS = int(os.getenv("PROFILE_SAMPLE_ROWS", "100000"))
+PROFILE_HISTOGRAM_BINS = int(os.getenv("PROFILE_HISTOGRAM_BINS", "20"))
+PROFILE_MAX_AGE = float(os.getenv("PROFILE_MAX_AGE", str(7 * 24 * 3600)))
+
+NUMERIC_TYPES = {"int2", "int4", "int8", "float4", "float8", "numeric"}
+
+# HyperLogLog: the first HLL_P bits of a value's 64-bit hash pick the register
+HLL_P = 12
+HLL_M = 1 << HLL_P
+
+_SAMPLE = "_profile_sample"
+
+# Weights of the quality score: share of filled cells, share of sane numbers
+_COMPLETENESS_WEIGHT = 0.7
+_VALIDITY_WEIGHT = 0.3
+
+
+def hll_estimate(registers: bytes) -> float:
+    alpha = 0.7213 / (1 + 1.079 / HLL_M)
+    estimate = alpha * HLL_M * HLL_M / sum(2.0**-r for r in registers)
+    zeros = registers.count(0)
+    if estimate <= 2.5 * HLL_M and zeros:
+        return HLL_M * math.log(HLL_M / zeros)  # linear counting for small sets
+    return estimate
+
+
+def _hll_merge(a: bytes, b: bytes) -> bytes:
+    return bytes(map(max, a, b))
+
+
+def _number(column: str) -> str:
+    # Infinities and NaN would poison sums and can't be stored in JSON
+    return (
+        f"""CASE WHEN "{column}"::float8 IN ('Infinity', '-Infinity', 'NaN') """
+        f'''THEN NULL ELSE "{column}"::float8 END'''
+    )
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+async def _estimated_rows(conn: asyncpg.Connection, table: str) -> int:
+    """Planner row estimate of *table*, partitions included."""
+    sql = """
+        SELECT sum(c.reltuples)::bigint, bool_or(c.reltuples < 0) FROM pg_class c
+        WHERE c.oid = $1::regclass
+           OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = $1::regclass)
+    """
+    estimate, unknown = await conn.fetchrow(sql, f'"{table}"')
+    if unknown:
+        # Never analyzed; ANALYZE reads a fixed-size sample, so this stays bounded
+        await conn.execute(f'ANALYZE "{table}"')
+        estimate, _ = await conn.fetchrow(sql, f'"{table}"')
+    return max(estimate or 0, 0)
+
+
+async def _bounds(
+    conn: asyncpg.Connection, numeric: list[str]
+) -> dict[str, dict]:
+    """Histogram edges and outlier fences of each numeric column of the sample."""
+    if not numeric:
+        return {}
+    aggregates = ", ".join(
+        f"min({_number(c)}), max({_number(c)}), "
+        f"percentile_cont(ARRAY[0.25, 0.75]) WITHIN GROUP (ORDER BY {_number(c)})"
+        for c in numeric
+    )
+    row = await conn.fetchrow(f"SELECT {aggregates} FROM {_SAMPLE}")
+    bounds = {}
+    for i, column in enumerate(numeric):
+        lo, hi, quartiles = row[3 * i], row[3 * i + 1], row[3 * i + 2]
+        if lo is None:
+            continue
+        q1, q3 = quartiles
+        spread = 1.5 * (q3 - q1)
+        bounds[column] = {
+            "edges": [lo, hi if hi > lo else lo + 1],
+            "fences": [q1 - spread, q3 + spread],
+        }
+    return bounds
+
+
+async def _sample_stats(
+    conn: asyncpg.Connection, columns: dict[str, str], bounds: dict[str, dict]
+) -> dict:
+    """Mergeable counters of the rows in the sample table.
+
+    *bounds* gives the histogram edges and outlier fences of each numeric
+    column that has them.
+    """
+    names = list(columns)
+    numeric = [c for c in names if c in bounds]
+    params: list = []
+
+    def param(value) -> str:
+        params.append(value)
+        return f"${len(params)}::float8"
+
+    aggregates = ["count(*)"] + [f'count("{c}")' for c in names]
+    for c in numeric:
+        x = _number(c)
+        lo, hi = bounds[c]["fences"]
+        aggregates += [
+            f"count({x})",
+            f"sum({x})",
+            f"sum({x} * {x})",
+            f"min({x})",
+            f"max({x})",
+            f"count(*) FILTER (WHERE {x} < {param(lo)} OR {x} > {param(hi)})",
+        ]
+    row = await conn.fetchrow(f"SELECT {', '.join(aggregates)} FROM {_SAMPLE}", *params)
+
+    stats = {"rows": row[0], "columns": {}}
+    for i, c in enumerate(names):
+        stats["columns"][c] = {"type": columns[c], "count": row[1 + i]}
+    offset = 1 + len(names)
+    for j, c in enumerate(numeric):
+        n, total, squares, lo, hi, outliers = row[offset + 6 * j: offset + 6 * j + 6]
+        stats["columns"][c].update(
+            {
+                "n": n,
+                "sum": total or 0.0,
+                "sumsq": squares or 0.0,
+                "min": lo,
+                "max": hi,
+                "outliers": outliers,
+                "hist": [0] * PROFILE_HISTOGRAM_BINS,
+                **bounds[c],
+            }
+        )
+
+    if numeric:
+        params[:] = [PROFILE_HISTOGRAM_BINS]
+        values = ", ".join(
+            f"({j}, {_number(c)}, {param(bounds[c]['edges'][0])}, {param(bounds[c]['edges'][1])})"
+            for j, c in enumerate(numeric)
+        )
+        records = await conn.fetch(
+            f"""
+            SELECT h.j, width_bucket(h.v, h.lo, h.hi, $1) AS bucket, count(*) AS n
+            FROM {_SAMPLE}, LATERAL (VALUES {values}) h(j, v, lo, hi)
+            WHERE h.v IS NOT NULL
+            GROUP BY 1, 2
+            """,
+            *params,
+        )
+        for r in records:
+            # Values on or past the edges (later inserts) go to the end bins
+            bucket = min(max(r["bucket"], 1), PROFILE_HISTOGRAM_BINS)
+            stats["columns"][numeric[r["j"]]]["hist"][bucket - 1] += r["n"]
+
+    registers = {c: bytearray(HLL_M) for c in names}
+    if names:
+        values = ", ".join(f'({i}, "{c}"::text)' for i, c in enumerate(names))
+        records = await conn.fetch(
+            f"""
+            SELECT s.i, substring(s.h FROM 1 FOR {HLL_P})::bit({HLL_P})::int AS register,
+                   max(coalesce(nullif(position(B'1' IN substring(s.h FROM {HLL_P + 1})), 0),
+                                {65 - HLL_P})) AS rank
+            FROM (
+                SELECT v.i, hashtextextended(v.value, 0)::bit(64) AS h
+                FROM {_SAMPLE}, LATERAL (VALUES {values}) v(i, value)
+                WHERE v.value IS NOT NULL
+            ) s
+            GROUP BY 1, 2
+            """
+        )
+        for r in records:
+            registers[names[r["i"]]][r["register"]] = r["rank"]
+    for c in names:
+        stats["columns"][c]["hll"] = base64.b64encode(registers[c]).decode()
+    return stats
+
+
+def _merge(state: dict, new: dict, added: int) -> dict:
+    """Fold the counters of a sample of *added* newly inserted rows into *state*."""
+    state["rows"] += new["rows"]
+    state["records"] += added
+    for name, col in state["columns"].items():
+        add = new["columns"][name]
+        col["count"] += add["count"]
+        col["hll"] = base64.b64encode(
+            _hll_merge(base64.b64decode(col["hll"]), base64.b64decode(add["hll"]))
+        ).decode()
+        if "hist" in col:
+            for key in ("n", "sum", "sumsq", "outliers"):
+                col[key] += add[key]
+            for key, pick in (("min", min), ("max", max)):
+                values = [v for v in (col[key], add[key]) if v is not None]
+                col[key] = pick(values) if values else None
+            col["hist"] = [a + b for a, b in zip(col["hist"], add["hist"])]
+    return state
+
+
+def summarize(state: dict) -> dict:
+    """The published profile derived from the stored counters."""
+    rows = state["rows"]
+    columns = {}
+    null_rates, outlier_rates = [], []
+    for name, col in state["columns"].items():
+        summary = {
+            "type": col["type"],
+            "null_rate": round(1 - col["count"] / rows, 4) if rows else None,
+            "distinct": min(round(hll_estimate(base64.b64decode(col["hll"]))), col["count"]),
+        }
+        if summary["null_rate"] is not None:
+            null_rates.append(summary["null_rate"])
+        if col.get("n"):
+            n = col["n"]
+            mean = col["sum"] / n
+            lo, hi = col["edges"]
+            width = (hi - lo) / PROFILE_HISTOGRAM_BINS
+            summary.update(
+                {
+                    "min": col["min"],
+                    "max": col["max"],
+                    "mean": mean,
+                    "stddev": math.sqrt(max(col["sumsq"] / n - mean * mean, 0.0)),
+                    "histogram": {
+                        "edges": [lo + i * width for i in range(PROFILE_HISTOGRAM_BINS + 1)],
+                        "counts": col["hist"],
+                    },
+                    "outlier_rate": round(col["outliers"] / n, 4),
+                }
+            )
+            outlier_rates.append(summary["outlier_rate"])
+        columns[name] = summary
+
+    quality = None
+    if rows:
+        completeness = 1 - sum(null_rates) / len(null_rates) if null_rates else 1.0
+        validity = 1 - sum(outlier_rates) / len(outlier_rates) if outlier_rates else 1.0
+        quality = round(100 * (_COMPLETENESS_WEIGHT * completeness + _VALIDITY_WEIGHT * validity))
+    return {
+        "records": state["records"] + state["cold_rows"],
+        "profiled_rows": rows,
+        "sampled": state["sampled"],
+        "quality_score": quality,
+        "last_insert": state["last_insert"],
+        "columns": columns,
+    }
+
+
+async def _rebase(
+    conn: asyncpg.Connection, table: str, columns: dict[str, str], cold_rows: int
+) -> dict:
+    select_list = ", ".join(f'"{c}"' for c in columns) or "1"
+    limit = PROFILE_SAMPLE_ROWS
+    small = await conn.fetchval(
+        f'SELECT count(*) FROM (SELECT 1 FROM "{table}" LIMIT $1) t', limit + 1
+    )
+    if small <= limit:
+        source, records, sampled = f'"{table}"', small, False
+    else:
+        records = await _estimated_rows(conn, table)
+        percent = min(100.0, 100.0 * limit / max(records, 1))
+        source, sampled = f'"{table}" TABLESAMPLE SYSTEM ({percent:.6f})', True
+    last_id = await conn.fetchval(f'SELECT max(id) FROM "{table}"')
+    await conn.execute(
+        f"CREATE TEMP TABLE {_SAMPLE} ON COMMIT DROP AS "
+        f"SELECT {select_list} FROM {source} LIMIT {limit}"
+    )
+    numeric = [c for c, t in columns.items() if t in NUMERIC_TYPES]
+    state = await _sample_stats(conn, columns, await _bounds(conn, numeric))
+    state.update(
+        {
+            "records": max(records, state["rows"]),
+            "sampled": sampled,
+            "sample_rate": state["rows"] / records if sampled and records else 1.0,
+            "last_id": last_id or 0,
+            "cold_rows": cold_rows,
+            "rebased_at": _now(),
+        }
+    )
+    return state
+
+
+async def _increment(
+    conn: asyncpg.Connection, table: str, columns: dict[str, str], state: dict
+) -> dict | None:
+    """Merge rows inserted since *state* was taken; None if a rebase is due instead."""
+    limit = PROFILE_SAMPLE_ROWS
+    select_list = ", ".join(["id", *(f'"{c}"' for c in columns)])
+    await conn.execute(
+        f"CREATE TEMP TABLE {_SAMPLE} ON COMMIT DROP AS "
+        f'SELECT {select_list} FROM "{table}" WHERE id > $1 ORDER BY id LIMIT {limit + 1}',
+        state["last_id"],
+    )
+    added, last_id = await conn.fetchrow(f"SELECT count(*), max(id) FROM {_SAMPLE}")
+    if added > limit:
+        await conn.execute(f"DROP TABLE {_SAMPLE}")
+        return None
+    # Older states predate sample_rate; their rows/records ratio is the same
+    rate = state.get("sample_rate", state["rows"] / max(state["records"], 1))
+    if state["sampled"] and rate < 1:
+        await conn.execute(f"DELETE FROM {_SAMPLE} WHERE random() >= $1", rate)
+    if added:
+        bounds = {
+            c: {"edges": col["edges"], "fences": col["fences"]}
+            for c, col in state["columns"].items()
+            if "edges" in col
+        }
+        _merge(state, await _sample_stats(conn, columns, bounds), added)
+        state["last_id"] = last_id
+    return state
+
+
+async def profile_table(
+    conn: asyncpg.Connection,
+    db: AsyncSession,
+    project: str,
+    table: str,
+    validator: TableValidator,
+    full: bool = False,
+) -> dict:
+    """Profile *table* (incrementally if possible) and store the result.
+
+    *conn* is a primary connection to the project, *db* a main-database
+    session; the caller commits it. Returns the stored profile row as a dict.
+    """
+    columns = {c.name: c.sql_type for c in validator.columns.values()}
+    cold_rows = sum(f["rows"] for f in await cold_storage.cold_files(conn, table))
+    stored = (
+        await db.execute(
+            select(TableProfileDB).where(
+                TableProfileDB.project_name == project, TableProfileDB.table_name == table
+            )
+        )
+    ).scalar_one_or_none()
+
+    state = copy.deepcopy(stored.state) if stored is not None else None
+    if state is not None and not full:
+        age = datetime.now(timezone.utc) - datetime.fromisoformat(state["rebased_at"])
+        if (
+            age.total_seconds() > PROFILE_MAX_AGE
+            or state["cold_rows"] != cold_rows
+            or {c: col["type"] for c, col in state["columns"].items()} != columns
+        ):
+            state = None
+
+    # One snapshot for the sample, the last id and the latest row
+    async with conn.transaction(isolation="repeatable_read"):
+        with span("profiling.table", table=table):
+            if state is not None:
+                state = await _increment(conn, table, columns, state)
+            if state is None:
+                state = await _rebase(conn, table, columns, cold_rows)
+        state["last_insert"] = await conn.fetchval(
+            f'SELECT created_at::date::text FROM "{table}" ORDER BY id DESC LIMIT 1'
+        )
+
+    profile = summarize(state)
+    row = {
+        "project_name": project,
+        "table_name": table,
+        "profile": profile,
+        "state": state,
+        "profiled_at": _now(),
+    }
+    stmt = insert(TableProfileDB).values(row)
+    await db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[TableProfileDB.project_name, TableProfileDB.table_name],
+            set_={k: stmt.excluded[k] for k in ("profile", "state", "profiled_at")},
+        )
+    )
+    await _update_datasets(db, project, table, profile)
+    return row
+
+
+async def _update_datasets(db: AsyncSession, project: str, table: str, profile: dict) -> None:
+    """Copy the profile's figures onto the datasets of programs writing to *table*."""
+    programs = (
+        await db.execute(
+            select(ProgramDB.id, ProgramDB.title).where(
+                func.lower(ProgramDB.project_name) == project,
+                func.lower(ProgramDB.table_name) == table,
+            )
+        )
+    ).all()
+    if not programs:
+        return
+    values = {
+        "records": profile["records"],
+        "last_updated": profile["last_insert"] or date.today().isoformat(),
+    }
+    if profile["quality_score"] is not None:
+        values["quality_score"] = profile["quality_score"]
+    keys = [p.id for p in programs] + [p.title for p in programs]
+    await db.execute(
+        update(DatasetDB).where(DatasetDB.program.in_(keys)).values(**values)
+    )
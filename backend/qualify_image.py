@@ -7,6 +7,8 @@ Each check returns a (passed: bool, reason: str) tuple.
 import cv2
 import numpy as np
 
+from backend.metrics import span
+
 
 def _check_blur(gray: np.ndarray) -> tuple[bool, str]:
     variance = cv2.Laplacian(gray, cv2.CV_64F).var()
@@ -49,9 +51,19 @@ def _check_resolution(gray: np.ndarray, min_w: int = 640, min_h: int = 480) -> t
     return True, ""
 
 
-def check_quality(image_bytes: bytes) -> dict:
+def decode_gray(image_bytes: bytes) -> np.ndarray | None:
+    """Decode raw image bytes to a grayscale array, or None if undecodable."""
+    with span("image.decode"):
+        arr = np.frombuffer(image_bytes, dtype=np.uint8)
+        return cv2.imdecode(arr, cv2.IMREAD_GRAYSCALE)
+
+
+def check_quality(image_bytes: bytes, gray: np.ndarray | None = None) -> dict:
     """Run all quality checks on raw image bytes.
 
+    Pass ``gray`` (from ``decode_gray``) to reuse an image that was already
+    decoded instead of decoding ``image_bytes`` again.
+
     Returns::
 
         {
@@ -62,8 +74,7 @@ def check_quality(image_bytes: bytes) -> dict:
             ],
         }
     """
-    arr = np.frombuffer(image_bytes, dtype=np.uint8)
-    img = cv2.imdecode(arr, cv2.IMREAD_GRAYSCALE)
+    img = gray if gray is not None else decode_gray(image_bytes)
 
     if img is None:
         return {
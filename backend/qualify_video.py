@@ -0,0 +1,198 @@
+"""
+Sampled-frame analysis for video uploads using OpenCV.
+
+The clip is never held in memory as pixels: the capture seeks straight to
+each sampled frame, so even a clip cut short by the time budget is sampled
+across its whole length. Where the container can't seek, frames are
+``grab()``-bed one by one and only every Nth is ``retrieve()``-d. Sampled
+frames go through the image quality checks and, if a CNN category is
+configured, one batched ``classify_images`` pass per ``VIDEO_CNN_BATCH``
+frames. Per-frame results are aggregated into a single verdict for the
+video; a CNN failure leaves the verdict without a CNN result.
+
+Both a frame budget (``VIDEO_MAX_FRAMES``) and a wall-clock budget
+(``VIDEO_TIME_BUDGET`` seconds) cap the work, so a long clip can't hold a
+worker indefinitely; the result reports whether sampling was truncated.
+"""
+
+import os
+import statistics
+import tempfile
+import time
+from collections import Counter
+
+import cv2
+
+from backend.metrics import span
+from backend.qualify_image import check_quality
+
+# Sample every Nth frame; 0 spreads VIDEO_MAX_FRAMES evenly over the clip
+VIDEO_FRAME_STEP = int(os.getenv("VIDEO_FRAME_STEP", "0"))
+VIDEO_MAX_FRAMES = int(os.getenv("VIDEO_MAX_FRAMES", "16"))
+VIDEO_TIME_BUDGET = float(os.getenv("VIDEO_TIME_BUDGET", "10"))
+VIDEO_CNN_BATCH = int(os.getenv("VIDEO_CNN_BATCH", "8"))
+
+
+def _sample_frames(path: str, deadline: float) -> tuple[list, dict]:
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        return [], {"frames_total": 0, "fps": 0.0, "truncated": False}
+    try:
+        frames_total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or 0
+        fps = float(cap.get(cv2.CAP_PROP_FPS)) or 0.0
+        step = VIDEO_FRAME_STEP or max(1, frames_total // VIDEO_MAX_FRAMES)
+
+        frames = []
+        truncated = False
+        index = 0
+        sequential = not frames_total or step == 1
+        if not sequential:
+            for target in range(0, frames_total, step):
+                if len(frames) >= VIDEO_MAX_FRAMES or time.perf_counter() > deadline:
+                    truncated = True
+                    break
+                if target != index and not cap.set(cv2.CAP_PROP_POS_FRAMES, target):
+                    # Not seekable: read on from here instead
+                    sequential = True
+                    break
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                frames.append((target, frame))
+                index = target + 1
+        if sequential:
+            while len(frames) < VIDEO_MAX_FRAMES:
+                if time.perf_counter() > deadline:
+                    truncated = True
+                    break
+                if not cap.grab():
+                    break
+                if index % step == 0:
+                    ok, frame = cap.retrieve()
+                    if ok:
+                        frames.append((index, frame))
+                index += 1
+            else:
+                truncated = frames_total > index
+    finally:
+        cap.release()
+    return frames, {"frames_total": frames_total, "fps": fps, "truncated": truncated}
+
+
+def _aggregate_quality(per_frame: list[dict]) -> dict:
+    """Median score; a warning is kept when it fires on at least half the frames."""
+    counts: Counter[str] = Counter()
+    messages: dict[str, str] = {}
+    for result in per_frame:
+        for w in result["warnings"]:
+            counts[w["check"]] += 1
+            messages.setdefault(w["check"], w["message"])
+    warnings = [
+        {
+            "check": check,
+            "message": f"{messages[check]} (in {n} of {len(per_frame)} sampled frames)",
+        }
+        for check, n in counts.items()
+        if n * 2 >= len(per_frame)
+    ]
+    return {
+        "score": float(statistics.median(r["score"] for r in per_frame)),
+        "passed": True,  # always allow upload, warnings are informational
+        "warnings": warnings,
+    }
+
+
+def _aggregate_cnn(per_frame: list[dict], expected_category: str) -> dict:
+    """The clip matches if any sampled frame matches the expected category."""
+    matching = [r for r in per_frame if r["matches"]]
+    if matching:
+        best = max(matching, key=lambda r: r["confidence"])
+        message = (
+            f"CNN detected: {best['label']} ({best['confidence']:.0%} confidence) "
+            f"in {len(matching)} of {len(per_frame)} sampled frames"
+        )
+    else:
+        labels = Counter(r["label"] for r in per_frame)
+        top_label = labels.most_common(1)[0][0]
+        best = max(
+            (r for r in per_frame if r["label"] == top_label), key=lambda r: r["confidence"]
+        )
+        message = (
+            f"CNN detected: {best['label']} ({best['confidence']:.0%}) in "
+            f"{labels[top_label]} of {len(per_frame)} sampled frames — expected {expected_category}"
+        )
+    return {
+        "label": best["label"],
+        "confidence": best["confidence"],
+        "matches": bool(matching),
+        "expected_category": expected_category,
+        "message": message,
+    }
+
+
+def analyze_video(video_bytes: bytes, expected_category: str | None = None) -> dict:
+    """Sample frames from a video and aggregate quality (and CNN) results.
+
+    Returns::
+
+        {
+            "quality": {...},          # check_quality-shaped aggregate
+            "cnn": {...} | None,       # check_category-shaped aggregate
+            "frames_sampled": 12,
+            "frames_total": 900,
+            "duration": 30.0,          # seconds, 0.0 if unknown
+            "truncated": False,        # a frame/time budget cut sampling short
+        }
+    """
+    deadline = time.perf_counter() + VIDEO_TIME_BUDGET
+    with tempfile.NamedTemporaryFile(suffix=".video") as tmp:
+        tmp.write(video_bytes)
+        tmp.flush()
+        with span("video.decode"):
+            frames, info = _sample_frames(tmp.name, deadline)
+
+    summary = {
+        "frames_sampled": len(frames),
+        "frames_total": info["frames_total"],
+        "duration": round(info["frames_total"] / info["fps"], 2) if info["fps"] else 0.0,
+        "truncated": info["truncated"],
+    }
+    if not frames:
+        return {
+            "quality": {
+                "score": 0.0,
+                "passed": False,
+                "warnings": [{"check": "decode", "message": "Could not decode video file"}],
+            },
+            "cnn": None,
+            **summary,
+        }
+
+    with span("video.quality"):
+        per_frame_quality = [
+            check_quality(b"", gray=cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+            for _, frame in frames
+        ]
+
+    cnn = None
+    if expected_category:
+        try:
+            from PIL import Image
+
+            from backend.classify_image import classify_images, match_category
+
+            per_frame_cnn = []
+            with span("video.cnn"):
+                for start in range(0, len(frames), VIDEO_CNN_BATCH):
+                    batch = [
+                        Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                        for _, frame in frames[start : start + VIDEO_CNN_BATCH]
+                    ]
+                    per_frame_cnn.extend(
+                        match_category(r, expected_category) for r in classify_images(batch)
+                    )
+            cnn = _aggregate_cnn(per_frame_cnn, expected_category)
+        except Exception:
+            pass  # CNN failure shouldn't block upload
+
+    return {"quality": _aggregate_quality(per_frame_quality), "cnn": cnn, **summary}
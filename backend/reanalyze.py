@@ -0,0 +1,260 @@
+"""
+Offline bulk re-analysis of stored uploads.
+
+Walks the upload store (local directory or S3 bucket, see ``backend.storage``)
+and re-runs the quality checks and CNN classification on every stored image,
+writing the results to the ``upload_analyses`` table. Use it after changing thresholds in
+``qualify_image`` or the model in ``classify_image``.
+
+Work is spread over a process pool; each task is a batch of images that goes
+through the CNN in a single forward pass. Completed paths are appended to a
+checkpoint file after every database flush, so an interrupted run picks up
+where it left off.
+
+Usage::
+
+    python -m backend.reanalyze --workers 4 --batch-size 32
+    python -m backend.reanalyze --program <program_id> --checkpoint /tmp/rescore.ckpt
+    python -m backend.reanalyze --restart   # ignore the checkpoint, re-score everything
+    python -m backend.reanalyze --train-index   # only rebuild the similarity index
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from backend.database import async_session, engine
+from backend.db_models import ProgramDB, UploadAnalysisDB
+from backend.migrations import run_migrations
+from backend.storage import LocalStorage, S3Storage, upload_storage
+
+IMAGE_EXTENSIONS = {"jpg", "jpeg", "png", "webp"}
+
+
+def _init_worker(torch_threads: int, run_cnn: bool) -> None:
+    if run_cnn:
+        import torch
+
+        from backend.classify_image import _get_model
+
+        torch.set_num_threads(torch_threads)
+        _get_model()
+
+
+def _analyze_batch(
+    storage: LocalStorage | S3Storage, items: list[tuple[str, str | None]], run_cnn: bool
+) -> list[dict]:
+    """Score one batch of stored images; runs inside a pool worker."""
+    from PIL import Image
+
+    from backend.qualify_image import check_quality
+
+    analyzed_at = datetime.now(timezone.utc).isoformat()
+    rows: list[dict] = []
+    to_classify: list[tuple[dict, Image.Image, str | None]] = []
+
+    for rel_path, expected in items:
+        row = {
+            "path": rel_path,
+            "program_id": rel_path.split("/", 1)[0],
+            "quality_score": None,
+            "quality_warnings": None,
+            "label": None,
+            "confidence": None,
+            "top5": None,
+            "expected_category": expected,
+            "matches": None,
+            "error": None,
+            "analyzed_at": analyzed_at,
+        }
+        rows.append(row)
+        try:
+            contents = storage.read(rel_path)
+            quality = check_quality(contents)
+            row["quality_score"] = quality["score"]
+            row["quality_warnings"] = quality["warnings"]
+            if run_cnn:
+                img = Image.open(io.BytesIO(contents)).convert("RGB")
+                to_classify.append((row, img, expected))
+        except Exception as exc:
+            row["error"] = f"{type(exc).__name__}: {exc}"
+
+    if to_classify:
+        from backend.classify_image import classify_images, match_category
+
+        results = classify_images([img for _, img, _ in to_classify])
+        for (row, _, expected), result in zip(to_classify, results):
+            row["label"] = result["label"]
+            row["confidence"] = result["confidence"]
+            row["top5"] = result["top5"]
+            if expected:
+                row["matches"] = match_category(result, expected)["matches"]
+
+    return rows
+
+
+def _walk_uploads(
+    storage: LocalStorage | S3Storage, programs: list[str] | None
+) -> list[str]:
+    """Return stored image keys (``<program_id>/<name>``), in a stable order."""
+    keys = []
+    for prefix in sorted(programs) if programs else [""]:
+        for key in storage.list_keys(prefix):
+            ext = key.rsplit(".", 1)[-1].lower() if "." in key else ""
+            if "/" in key and ext in IMAGE_EXTENSIONS:
+                keys.append(key)
+    return keys
+
+
+def _load_checkpoint(path: str) -> set[str]:
+    if not os.path.exists(path):
+        return set()
+    with open(path) as fp:
+        return {line.strip() for line in fp if line.strip()}
+
+
+async def _program_filters() -> dict[str, str | None]:
+    """Map upload directory names (program id or project name) to cnn_filter."""
+    async with async_session() as session:
+        result = await session.execute(
+            select(ProgramDB.id, ProgramDB.project_name, ProgramDB.cnn_filter)
+        )
+        filters: dict[str, str | None] = {}
+        for program_id, project_name, cnn_filter in result.all():
+            filters[program_id] = cnn_filter
+            if project_name:
+                filters.setdefault(project_name, cnn_filter)
+        return filters
+
+
+async def _flush(rows: list[dict], checkpoint) -> None:
+    stmt = insert(UploadAnalysisDB)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UploadAnalysisDB.path],
+        set_={c: stmt.excluded[c] for c in rows[0] if c != "path"},
+    )
+    async with async_session() as session:
+        await session.execute(stmt, rows)
+        await session.commit()
+    # Only checkpoint once the rows are durable in Postgres
+    checkpoint.write("".join(f"{r['path']}\n" for r in rows))
+    checkpoint.flush()
+    os.fsync(checkpoint.fileno())
+
+
+async def run(args: argparse.Namespace) -> int:
+    await run_migrations(engine)
+
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    done = _load_checkpoint(args.checkpoint)
+    storage = LocalStorage(args.upload_dir) if args.upload_dir else upload_storage
+    filters = await _program_filters() if not args.no_cnn else {}
+
+    items = [
+        (p, filters.get(p.split("/", 1)[0]))
+        for p in _walk_uploads(storage, args.program)
+        if p not in done
+    ]
+    total = len(items)
+    print(f"{total} images to analyse ({len(done)} already checkpointed)", file=sys.stderr)
+    if not items:
+        return 0
+
+    batches = iter(
+        items[i : i + args.batch_size] for i in range(0, total, args.batch_size)
+    )
+    loop = asyncio.get_running_loop()
+    processed = 0
+    failed = 0
+    buffer: list[dict] = []
+    start = time.perf_counter()
+
+    with (
+        open(args.checkpoint, "a") as checkpoint,
+        ProcessPoolExecutor(
+            max_workers=args.workers,
+            initializer=_init_worker,
+            initargs=(args.torch_threads, not args.no_cnn),
+        ) as pool,
+    ):
+
+        def submit() -> asyncio.Future | None:
+            batch = next(batches, None)
+            if batch is None:
+                return None
+            return loop.run_in_executor(
+                pool, _analyze_batch, storage, batch, not args.no_cnn
+            )
+
+        # Keep every worker busy with one batch queued behind it
+        pending = {f for f in (submit() for _ in range(args.workers * 2)) if f}
+        while pending:
+            finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for fut in finished:
+                rows = fut.result()
+                buffer.extend(rows)
+                processed += len(rows)
+                failed += sum(1 for r in rows if r["error"])
+                nxt = submit()
+                if nxt is not None:
+                    pending.add(nxt)
+
+            if buffer and (len(buffer) >= args.flush_every or not pending):
+                await _flush(buffer, checkpoint)
+                buffer = []
+                elapsed = time.perf_counter() - start
+                print(
+                    f"{processed}/{total} images, {failed} failed, "
+                    f"{processed / elapsed:.1f} images/sec",
+                    file=sys.stderr,
+                )
+
+    await engine.dispose()
+    return 1 if failed else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Re-run quality and CNN checks on stored uploads")
+    parser.add_argument(
+        "--upload-dir", help="Read a local upload directory instead of the configured storage"
+    )
+    parser.add_argument(
+        "--program", action="append", help="Only re-analyse this program directory (repeatable)"
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument(
+        "--torch-threads", type=int, default=1, help="Intra-op threads per worker"
+    )
+    parser.add_argument("--batch-size", type=int, default=32, help="Images per CNN forward pass")
+    parser.add_argument(
+        "--flush-every", type=int, default=500, help="Rows buffered per bulk database write"
+    )
+    parser.add_argument("--checkpoint", default="reanalyze.checkpoint")
+    parser.add_argument("--restart", action="store_true", help="Discard the checkpoint first")
+    parser.add_argument("--no-cnn", action="store_true", help="Only re-run quality checks")
+    parser.add_argument(
+        "--train-index",
+        action="store_true",
+        help="Rebuild the embedding store's IVF similarity index and exit",
+    )
+    args = parser.parse_args()
+    if args.train_index:
+        from backend.embedding_store import embedding_store
+
+        rows = embedding_store.train_index()
+        print(f"IVF index trained over {rows} embeddings", file=sys.stderr)
+        sys.exit(0)
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
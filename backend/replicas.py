@@ -0,0 +1,198 @@
+"""
+Read-replica routing.
+
+``READ_REPLICA_URLS`` lists streaming replicas of the primary as
+comma-separated SQLAlchemy URLs. Read-only handlers take ``get_read_db``
+(dynamic-table reads use ``_project_conn(..., read=True)``) and are spread
+round-robin over the healthy replicas. With no replicas configured, or none
+healthy, reads go to the primary.
+
+A background loop checks every ``REPLICA_HEALTH_INTERVAL`` seconds that each
+replica is reachable and no more than ``REPLICA_MAX_LAG`` seconds behind. A
+replica that refuses a connection mid-request is also taken out of rotation
+until its next successful check.
+
+Read-your-writes: ``ReadYourWritesMiddleware`` stamps a cookie on every
+successful write request. For ``READ_YOUR_WRITES_SECONDS`` afterwards that
+client's reads stay on the primary, so it sees its own inserts even while the
+replicas catch up. The window is never shorter than the lag a replica may
+have while still in rotation (``REPLICA_MAX_LAG`` plus one health-check
+interval), so an unpinned read can't land on a replica missing the write.
+The frontend calls the API cross-origin, so its fetches send credentials
+(``credentials: "include"``) for the cookie to come back.
+"""
+
+import asyncio
+import itertools
+import math
+import os
+import time
+from collections.abc import AsyncGenerator
+from contextvars import ContextVar
+from http.cookies import SimpleCookie
+from urllib.parse import urlsplit
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from backend import metrics
+from backend.database import async_session
+
+READ_REPLICA_URLS = [
+    url.strip() for url in os.getenv("READ_REPLICA_URLS", "").split(",") if url.strip()
+]
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "30"))
+REPLICA_HEALTH_INTERVAL = float(os.getenv("REPLICA_HEALTH_INTERVAL", "5"))
+READ_YOUR_WRITES_SECONDS = max(
+    float(os.getenv("READ_YOUR_WRITES_SECONDS", "5")),
+    REPLICA_MAX_LAG + REPLICA_HEALTH_INTERVAL,
+)
+
+WRITE_COOKIE = "eco_last_write"
+_SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# Set per request by the middleware: this client wrote recently
+_pin_primary: ContextVar[bool] = ContextVar("pin_primary", default=False)
+
+# Lag is 0 while the replica has replayed everything it received; otherwise
+# the age of the last replayed transaction. NULL on a server not in recovery.
+_LAG_SQL = text(
+    """
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+    """
+)
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = url
+        self.name = urlsplit(url).hostname or url
+        # Plain libpq DSN for the asyncpg connections of the dynamic-table routes
+        self.dsn = url.replace("postgresql+asyncpg://", "postgresql://")
+        self.engine = create_async_engine(url)
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.healthy = True
+        self.lag: float | None = None
+
+
+class ReplicaSet:
+    def __init__(self, urls: list[str]):
+        self.replicas = [Replica(url) for url in urls]
+        self._turn = itertools.count()
+
+    def pick(self) -> Replica | None:
+        """Next healthy replica in rotation, or None to read from the primary."""
+        if not self.replicas or _pin_primary.get():
+            metrics.DB_READ_ROUTE.labels("primary").inc()
+            return None
+        healthy = [r for r in self.replicas if r.healthy]
+        if not healthy:
+            metrics.DB_READ_ROUTE.labels("primary").inc()
+            return None
+        metrics.DB_READ_ROUTE.labels("replica").inc()
+        return healthy[next(self._turn) % len(healthy)]
+
+    def mark_down(self, replica: Replica) -> None:
+        replica.healthy = False
+        metrics.REPLICA_HEALTHY.labels(replica.name).set(0)
+
+    async def check(self, replica: Replica) -> bool:
+        try:
+            async with asyncio.timeout(REPLICA_HEALTH_INTERVAL):
+                async with replica.engine.connect() as conn:
+                    lag = (await conn.execute(_LAG_SQL)).scalar()
+        except (OSError, SQLAlchemyError, TimeoutError):
+            self.mark_down(replica)
+            return False
+        replica.lag = float(lag or 0.0)
+        replica.healthy = replica.lag <= REPLICA_MAX_LAG
+        metrics.REPLICA_LAG.labels(replica.name).set(replica.lag)
+        metrics.REPLICA_HEALTHY.labels(replica.name).set(int(replica.healthy))
+        return replica.healthy
+
+    async def check_all(self) -> None:
+        await asyncio.gather(*(self.check(r) for r in self.replicas))
+
+    async def health_loop(self) -> None:
+        while True:
+            await self.check_all()
+            await asyncio.sleep(REPLICA_HEALTH_INTERVAL)
+
+    async def dispose(self) -> None:
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+
+replica_set = ReplicaSet(READ_REPLICA_URLS)
+
+
+async def get_read_db() -> AsyncGenerator[AsyncSession]:
+    """Session for read-only handlers: a replica if one is usable, else the primary."""
+    replica = replica_set.pick()
+    if replica is not None:
+        session = replica.sessionmaker()
+        try:
+            # Connect up front so an unreachable replica falls back here
+            await session.connection()
+        except (OSError, SQLAlchemyError):
+            await session.close()
+            replica_set.mark_down(replica)
+        else:
+            async with session:
+                yield session
+            return
+    async with async_session() as session:
+        yield session
+
+
+def _last_write(scope) -> float | None:
+    for name, value in scope.get("headers", []):
+        if name == b"cookie":
+            morsel = SimpleCookie(value.decode("latin-1")).get(WRITE_COOKIE)
+            if morsel is not None:
+                try:
+                    return float(morsel.value)
+                except ValueError:
+                    return None
+    return None
+
+
+class ReadYourWritesMiddleware:
+    """Pin a client's reads to the primary for a short window after it writes."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not replica_set.replicas:
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] in _SAFE_METHODS:
+            last = _last_write(scope)
+            recent = last is not None and time.time() - last < READ_YOUR_WRITES_SECONDS
+            token = _pin_primary.set(recent)
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                _pin_primary.reset(token)
+            return
+
+        cookie = (
+            f"{WRITE_COOKIE}={time.time():.3f}; Max-Age={math.ceil(READ_YOUR_WRITES_SECONDS)}; "
+            "Path=/; HttpOnly; SameSite=Lax"
+        ).encode("latin-1")
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                message = {
+                    **message,
+                    "headers": [*message.get("headers", []), (b"set-cookie", cookie)],
+                }
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
@@ -0,0 +1,132 @@
+"""
+Fast JSON responses for row-heavy endpoints.
+
+Rows are rendered to JSON by Postgres itself (``json_agg``) and the resulting
+text is spliced into the response body untouched, so neither Python-level
+row conversion nor FastAPI's ``jsonable_encoder`` ever walks the rows.
+Small envelopes are encoded with orjson, which handles date/datetime/UUID
+natively.
+"""
+
+import asyncio
+import gzip
+import hashlib
+
+import orjson
+from fastapi import Request, Response
+from pydantic import BaseModel
+from sqlalchemy import Select, Text, cast, func, literal_column, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+JSON_MEDIA_TYPE = "application/json"
+
+# Bodies smaller than this aren't worth compressing
+GZIP_MIN_SIZE = 1024
+
+
+def json_array_response(array_json: str | bytes) -> Response:
+    """Return a pre-rendered JSON array as the response body."""
+    body = array_json.encode() if isinstance(array_json, str) else array_json
+    return Response(content=body, media_type=JSON_MEDIA_TYPE)
+
+
+def json_object_response(envelope: dict, **raw_fields: str | bytes) -> Response:
+    """Encode *envelope* with orjson and append pre-rendered JSON fields.
+
+    ``json_object_response({"total": 3}, rows='[...]')`` produces
+    ``{"total":3,"rows":[...]}`` without re-parsing the rows.
+    """
+    body = bytearray(orjson.dumps(envelope))
+    body.pop()  # drop the closing brace
+    for key, raw in raw_fields.items():
+        if len(body) > 1:
+            body += b","
+        body += orjson.dumps(key) + b":"
+        body += raw.encode() if isinstance(raw, str) else raw
+    body += b"}"
+    return Response(content=bytes(body), media_type=JSON_MEDIA_TYPE)
+
+
+def concat_json_arrays(*arrays: str | bytes) -> bytes:
+    """Join pre-rendered JSON arrays into one without parsing them."""
+    items = []
+    for array in arrays:
+        raw = (array.encode() if isinstance(array, str) else array).strip()
+        if raw != b"[]":
+            items.append(raw[1:-1])
+    return b"[" + b",".join(items) + b"]"
+
+
+def model_columns(entity, model: type[BaseModel]) -> list:
+    """The columns of *entity* behind *model*'s fields, labelled as they serialise.
+
+    ``fetch_json_array`` output bypasses FastAPI's ``response_model``
+    filtering, so select exactly these columns to expose only the model's
+    fields, under their aliases.
+    """
+    return [
+        getattr(entity, name).label(field.alias or name)
+        for name, field in model.model_fields.items()
+    ]
+
+
+async def fetch_json_array(db: AsyncSession, stmt: Select) -> str:
+    """Run *stmt* wrapped in ``json_agg`` and return the JSON array text.
+
+    Each element is the row as Postgres' ``row_to_json`` renders it, keyed by
+    column name. Postgres aggregates a plain ordered subquery in order, so
+    any ``ORDER BY`` on *stmt* carries through.
+    """
+    page = stmt.subquery("page")
+    agg = select(
+        cast(
+            func.coalesce(func.json_agg(literal_column("page")), literal_column("'[]'::json")),
+            Text,
+        )
+    ).select_from(page)
+    return (await db.execute(agg)).scalar_one()
+
+
+async def gzip_response(request: Request, response: Response) -> Response:
+    """Gzip *response*'s body in place if the client accepts it.
+
+    Used per route rather than as middleware so streaming responses (the
+    SSE change feed) are never buffered by a compressor.
+    """
+    response.headers["Vary"] = "Accept-Encoding"
+    if (
+        len(response.body) < GZIP_MIN_SIZE
+        or "gzip" not in request.headers.get("accept-encoding", "")
+    ):
+        return response
+    body = response.body
+    if len(body) > 256 * 1024:
+        body = await asyncio.to_thread(gzip.compress, body, 6)
+    else:
+        body = gzip.compress(body, 6)
+    response.body = body
+    response.headers["Content-Encoding"] = "gzip"
+    response.headers["Content-Length"] = str(len(body))
+    return response
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match compares weakly: W/"x" and "x" are the same tag
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+def conditional_response(
+    request: Request, response: Response, cache_control: str
+) -> Response:
+    """Tag *response* with an ETag of its body; 304 if the client has it already.
+
+    The tag is weak because it is computed before ``gzip_response`` may
+    re-encode the body.
+    """
+    etag = f'W/"{hashlib.blake2b(response.body, digest_size=16).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return response
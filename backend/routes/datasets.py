@@ -1,12 +1,13 @@
 from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
+from sqlalchemy import func, or_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from backend.database import get_db
 from backend.db_models import DatasetDB
 from backend.models import Dataset
+from backend.replicas import get_read_db
+from backend.responses import fetch_json_array, json_array_response, model_columns
 
 router = APIRouter(prefix="/api/datasets", tags=["datasets"])
 
@@ -17,9 +18,9 @@ async def list_datasets(
     search: Optional[str] = None,
     sort_by: Optional[str] = None,
     sort_dir: Optional[str] = "desc",
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
-    stmt = select(DatasetDB)
+    stmt = select(*model_columns(DatasetDB, Dataset))
     if category:
         stmt = stmt.where(DatasetDB.category == category)
 
@@ -27,23 +28,20 @@ async def list_datasets(
         col = getattr(DatasetDB, sort_by)
         stmt = stmt.order_by(col.asc() if sort_dir == "asc" else col.desc())
 
-    result = await db.execute(stmt)
-    rows = result.scalars().all()
-
     if search:
         q = search.lower()
-        rows = [
-            r
-            for r in rows
-            if q in r.title.lower()
-            or q in r.organization.lower()
-            or q in r.description.lower()
-        ]
-    return rows
+        stmt = stmt.where(
+            or_(
+                func.strpos(func.lower(DatasetDB.title), q) > 0,
+                func.strpos(func.lower(DatasetDB.organization), q) > 0,
+                func.strpos(func.lower(DatasetDB.description), q) > 0,
+            )
+        )
+    return json_array_response(await fetch_json_array(db, stmt))
 
 
 @router.get("/{dataset_id}", response_model=Dataset)
-async def get_dataset(dataset_id: str, db: AsyncSession = Depends(get_db)):
+async def get_dataset(dataset_id: str, db: AsyncSession = Depends(get_read_db)):
     result = await db.execute(select(DatasetDB).where(DatasetDB.id == dataset_id))
     dataset = result.scalars().first()
     if not dataset:
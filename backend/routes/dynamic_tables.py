@@ -1,14 +1,39 @@
+import asyncio
+import heapq
+import itertools
 import os
 
 import re
+import time
+from bisect import bisect_right
+from collections.abc import Awaitable, Callable
+from contextlib import asynccontextmanager, suppress
 from datetime import date, datetime
 
 import asyncpg
-from fastapi import APIRouter, HTTPException
+import orjson
+from fastapi import APIRouter, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 
 from pydantic import BaseModel
-
-from backend.models.dynamic_table import DynamicTableRequest
+from sqlalchemy import func, select, text
+
+from backend import cold_storage, metrics, partitions, profiling, sync
+from backend.cache_bus import cache_bus
+from backend.database import async_session
+from backend.db_models import ProgramDB, TableProfileDB
+from backend.change_feed import CHANGE_FEED_HEARTBEAT, change_feed, id_runs, sse_event
+from backend.models.dynamic_table import (
+    ColdArchiveRequest,
+    DynamicTableRequest,
+    FieldType,
+    PartitionDetachRequest,
+)
+from backend.replicas import replica_set
+from backend.row_validators import RowValidationError, row_validators
+from backend.species_index import announcement, species_column
+from backend.tiles import geo_columns, points_bbox
+from backend.responses import concat_json_arrays, gzip_response, json_object_response
 
 router = APIRouter(prefix="/api", tags=["dynamic-tables"])
 
@@ -20,6 +45,28 @@ _DB_URL = os.getenv(
 )
 
 
+# "database": one Postgres database per project (the original layout).
+# "schema": one schema per project inside the main database, served from a
+# shared connection pool. Move existing projects with backend.migrate_projects.
+PROJECT_STORAGE = os.getenv("PROJECT_STORAGE", "database")
+PROJECT_POOL_SIZE = int(os.getenv("PROJECT_POOL_SIZE", "20"))
+
+# Schemas a project may not be named after in schema mode
+_RESERVED_SCHEMAS = {"public", "information_schema", partitions.ARCHIVE_SCHEMA}
+
+# Schema-mode pools, keyed by server DSN (primary and any read replicas)
+_pools: dict[str, asyncpg.Pool] = {}
+_pool_lock = asyncio.Lock()
+
+# Replica connections that fail this way fall back to the primary
+_REPLICA_CONNECT_ERRORS = (
+    OSError,
+    TimeoutError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.CannotConnectNowError,
+)
+
+
 def _parse_conn_params() -> dict:
     """Extract host, port, user, password from the SQLAlchemy DATABASE_URL."""
     # Strip the sqlalchemy driver prefix to get a plain postgres URL
@@ -28,11 +75,142 @@ def _parse_conn_params() -> dict:
     return {"dsn": raw}
 
 
-def _project_dsn(project: str) -> str:
-    base_dsn = _parse_conn_params()["dsn"]
+def _project_dsn(project: str, base_dsn: str | None = None) -> str:
+    base_dsn = base_dsn or _parse_conn_params()["dsn"]
     return "/".join(base_dsn.rsplit("/", 1)[:-1]) + f"/{project}"
 
 
+async def _connect(target: str, **params) -> asyncpg.Connection:
+    """Open a connection, recording connect and per-query timings for *target*."""
+    with metrics.span("db.connect", target=target):
+        start = time.perf_counter()
+        conn = await asyncpg.connect(**params)
+        metrics.DB_CONNECT_LATENCY.labels(target).observe(time.perf_counter() - start)
+    conn.add_query_logger(metrics.query_logger(target))
+    return conn
+
+
+async def _connect_project(
+    project: str, base_dsn: str | None = None, target: str = "project"
+) -> asyncpg.Connection:
+    """Connect to a project database, or 404 if it doesn't exist."""
+    try:
+        return await _connect(target, dsn=_project_dsn(project, base_dsn))
+    except asyncpg.InvalidCatalogNameError:
+        raise HTTPException(404, f"Project database '{project}' not found")
+
+
+async def _get_pool(dsn: str | None = None, target: str = "project") -> asyncpg.Pool:
+    """Shared pool on the main database (or a replica), used in schema storage mode."""
+    dsn = dsn or _parse_conn_params()["dsn"]
+    pool = _pools.get(dsn)
+    if pool is None:
+        async with _pool_lock:
+            pool = _pools.get(dsn)
+            if pool is None:
+
+                async def init(conn: asyncpg.Connection) -> None:
+                    conn.add_query_logger(metrics.query_logger(target))
+
+                # No prepared-statement cache: a pooled connection moves between
+                # project schemas, where the same table name can have other columns
+                pool = _pools[dsn] = await asyncpg.create_pool(
+                    dsn,
+                    min_size=0,
+                    max_size=PROJECT_POOL_SIZE,
+                    init=init,
+                    statement_cache_size=0,
+                )
+    return pool
+
+
+async def close_pool() -> None:
+    for pool in _pools.values():
+        await pool.close()
+    _pools.clear()
+
+
+async def _open_project_conn(
+    project: str, base_dsn: str | None, target: str
+) -> tuple[asyncpg.Connection, Callable[[], Awaitable[None]]]:
+    """Open a connection scoped to *project*; returns it with its release callback."""
+    if PROJECT_STORAGE != "schema":
+        conn = await _connect_project(project, base_dsn, target)
+        return conn, conn.close
+
+    pool = await _get_pool(base_dsn, target)
+    with metrics.span("db.connect", target=target):
+        start = time.perf_counter()
+        conn = await pool.acquire()
+        metrics.DB_CONNECT_LATENCY.labels(target).observe(time.perf_counter() - start)
+
+    async def release() -> None:
+        # RESET before release so the next borrower starts on public
+        with suppress(asyncpg.PostgresError, asyncpg.InterfaceError):
+            await conn.execute("RESET search_path")
+        await pool.release(conn)
+
+    try:
+        exists = await conn.fetchval(
+            "SELECT 1 FROM pg_namespace WHERE nspname = $1", project
+        )
+        if not exists:
+            raise HTTPException(404, f"Project schema '{project}' not found")
+        await conn.execute(f'SET search_path TO "{project}"')
+    except BaseException:
+        await release()
+        raise
+    return conn, release
+
+
+@asynccontextmanager
+async def _project_conn(project: str, read: bool = False):
+    """Yield a connection whose ``current_schema()`` holds *project*'s tables.
+
+    In ``database`` mode this is a fresh connection to the project database;
+    in ``schema`` mode it is a pooled connection to the main database with
+    ``search_path`` pointed at the project schema. 404s if the project is
+    missing either way. With ``read`` the connection may go to a read
+    replica (see ``backend.replicas``).
+    """
+    opened = None
+    replica = replica_set.pick() if read else None
+    if replica is not None:
+        try:
+            opened = await _open_project_conn(project, replica.dsn, "replica")
+        except _REPLICA_CONNECT_ERRORS:
+            replica_set.mark_down(replica)
+    if opened is None:
+        opened = await _open_project_conn(project, None, "project")
+
+    conn, release = opened
+    try:
+        yield conn
+    finally:
+        await release()
+
+
+def _is_reserved_schema(project: str) -> bool:
+    """True if *project* would collide with a system or archive schema."""
+    return (
+        project in _RESERVED_SCHEMAS
+        or project.startswith("pg_")
+        or project.endswith("_archive")
+    )
+
+
+def _check_schema_name(project: str) -> None:
+    if _is_reserved_schema(project):
+        raise HTTPException(400, f"'{project}' is reserved and can't be used as a project name")
+
+
+def _archive_schema(project: str) -> str:
+    """Schema that detached partitions of *project* are archived into."""
+    if PROJECT_STORAGE == "schema":
+        return f"{project}_archive"
+    return partitions.ARCHIVE_SCHEMA
+
+
 def _validate_identifier(name: str, label: str) -> None:
     if not _IDENTIFIER_RE.match(name):
         raise HTTPException(
@@ -70,37 +248,77 @@ async def create_dynamic_table(req: DynamicTableRequest):
             unique_fields.append(field)
     req_fields = unique_fields
 
-    conn_params = _parse_conn_params()
-
-    # --- 1. Create the project database if it doesn't exist -----------------
-    sys_conn = await asyncpg.connect(**conn_params)
-    try:
-        exists = await sys_conn.fetchval(
-            "SELECT 1 FROM pg_database WHERE datname = $1", db_name
-        )
-        if not exists:
-            # CREATE DATABASE cannot run inside a transaction
-            await sys_conn.execute(f'CREATE DATABASE "{db_name}"')
-    finally:
-        await sys_conn.close()
-
-    # --- 2. Connect to the new database and create the table ----------------
-    project_conn = await asyncpg.connect(dsn=_project_dsn(db_name))
-    try:
-        column_defs = ["id SERIAL PRIMARY KEY"]
+    partition = req.partition
+    if partition is not None:
+        date_fields = {f.name.lower(): f.name for f in req_fields if f.type == FieldType.DATE}
+        date_fields["created_at"] = "created_at"
+        if partition.column.lower() not in date_fields:
+            raise HTTPException(
+                400,
+                f"Partition column must be 'created_at' or a DATE field, "
+                f"got '{partition.column}'",
+            )
+        partition.column = date_fields[partition.column.lower()]
+        if len(table_name) > partitions.MAX_TABLE_NAME:
+            raise HTTPException(
+                400,
+                f"Partitioned table names are limited to "
+                f"{partitions.MAX_TABLE_NAME} characters",
+            )
+
+    if PROJECT_STORAGE == "schema":
+        _check_schema_name(db_name)
+        # --- 1. Create the project schema if it doesn't exist -----------------
+        pool = await _get_pool()
+        async with pool.acquire() as sys_conn:
+            await sys_conn.execute(f'CREATE SCHEMA IF NOT EXISTS "{db_name}"')
+    else:
+        # --- 1. Create the project database if it doesn't exist ---------------
+        sys_conn = await _connect("main", **_parse_conn_params())
+        try:
+            exists = await sys_conn.fetchval(
+                "SELECT 1 FROM pg_database WHERE datname = $1", db_name
+            )
+            if not exists:
+                # CREATE DATABASE cannot run inside a transaction
+                await sys_conn.execute(f'CREATE DATABASE "{db_name}"')
+        finally:
+            await sys_conn.close()
+
+    # --- 2. Connect to the project and create the table ----------------------
+    async with _project_conn(db_name) as project_conn:
+        column_defs = ["id SERIAL PRIMARY KEY" if partition is None else "id SERIAL"]
         for field in req_fields:
             column_defs.append(f'"{field.name}" {field.type.sql_type}')
         column_defs.append("created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
 
-        create_sql = (
-            f'CREATE TABLE IF NOT EXISTS "{table_name}" ({", ".join(column_defs)})'
-        )
-        await project_conn.execute(create_sql)
-    finally:
-        await project_conn.close()
+        if partition is None:
+            create_sql = (
+                f'CREATE TABLE IF NOT EXISTS "{table_name}" ({", ".join(column_defs)})'
+            )
+            await project_conn.execute(create_sql)
+        else:
+            async with project_conn.transaction():
+                for stmt in partitions.create_table_sql(
+                    table_name, column_defs, partition.column
+                ):
+                    await project_conn.execute(stmt)
+                await partitions.set_partition_config(
+                    project_conn,
+                    table_name,
+                    partition.column,
+                    partition.interval.value,
+                    partition.premake,
+                )
+            await partitions.ensure_partitions(
+                project_conn, table_name, partition.model_dump(mode="json")
+            )
+        await sync.enable_sync(project_conn, table_name)
+
+    await cache_bus.publish("table", {"project": db_name, "table": table_name})
 
     columns = (
-        ["id (SERIAL PRIMARY KEY)"]
+        ["id (SERIAL PRIMARY KEY)" if partition is None else "id (SERIAL)"]
         + [f"{f.name} ({f.type.sql_type})" for f in req_fields]
         + ["created_at (TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"]
     )
@@ -110,6 +328,7 @@ async def create_dynamic_table(req: DynamicTableRequest):
         "database": db_name,
         "table": table_name,
         "columns": columns,
+        "partition": partition.model_dump(mode="json") if partition else None,
     }
 
 
@@ -121,23 +340,19 @@ async def get_table_schema(project: str, table: str):
     _validate_identifier(project, "project_name")
     _validate_identifier(table, "table_name")
 
-    try:
-        conn = await asyncpg.connect(dsn=_project_dsn(project))
-    except asyncpg.InvalidCatalogNameError:
-        raise HTTPException(404, f"Project database '{project}' not found")
-
-    try:
+    async with _project_conn(project, read=True) as conn:
         rows = await conn.fetch(
             """
             SELECT column_name, data_type, is_nullable
             FROM information_schema.columns
-            WHERE table_name = $1
+            WHERE table_name = $1 AND table_schema = current_schema()
             ORDER BY ordinal_position
             """,
             table,
         )
         if not rows:
             raise HTTPException(404, f"Table '{table}' not found in '{project}'")
+        rows = [r for r in rows if r["column_name"] != sync.VERSION_COLUMN]
 
         columns = [
             {
@@ -147,12 +362,53 @@ async def get_table_schema(project: str, table: str):
             }
             for r in rows
         ]
-    finally:
-        await conn.close()
 
     return {"project": project, "table": table, "columns": columns}
 
 
+async def _hot_page(conn: asyncpg.Connection, table: str, limit: int, offset: int) -> str:
+    if limit <= 0:
+        return "[]"
+    # Let Postgres render the page as JSON; the text is passed through as-is
+    return await conn.fetchval(
+        f"""
+        SELECT COALESCE(json_agg(page ORDER BY page.id), '[]')::text
+        FROM (SELECT * FROM "{table}" ORDER BY id LIMIT $1 OFFSET $2) page
+        """,
+        limit,
+        offset,
+    )
+
+
+async def _federated_page(
+    conn: asyncpg.Connection, table: str, archived: list, limit: int, offset: int
+) -> bytes:
+    """A page of archived and hot rows of *table* together, ordered by id."""
+    cold_rows = sum(f["rows"] for f in archived)
+    hot_min = await conn.fetchval(f'SELECT min(id) FROM "{table}"')
+    if hot_min is None or max(f["max_id"] for f in archived) < hot_min:
+        # The usual case: every archived row comes before every hot one
+        cold = await cold_storage.read_rows(archived, min(limit, cold_rows - offset), offset)
+        hot = await _hot_page(conn, table, limit - len(cold), max(offset - cold_rows, 0))
+        return concat_json_arrays(orjson.dumps(cold), hot)
+
+    # Rows were inserted with ids below the archived ones: merge both sides
+    window = offset + limit
+    cold = [(r["id"], orjson.dumps(r)) for r in await cold_storage.read_rows(archived, window)]
+    hot = [
+        (r["id"], r["row"].encode())
+        for r in await conn.fetch(
+            f"""
+            SELECT page.id, row_to_json(page)::text AS row
+            FROM (SELECT * FROM "{table}" ORDER BY id LIMIT $1) page
+            """,
+            window,
+        )
+    ]
+    page = itertools.islice(heapq.merge(cold, hot), offset, window)
+    return b"[" + b",".join(row for _, row in page) + b"]"
+
+
 @router.get("/tables/{project}/{table}/rows")
 async def get_table_rows(project: str, table: str, limit: int = 100, offset: int = 0):
     """Return rows from a dynamic table."""
@@ -161,17 +417,12 @@ async def get_table_rows(project: str, table: str, limit: int = 100, offset: int
     _validate_identifier(project, "project_name")
     _validate_identifier(table, "table_name")
 
-    try:
-        conn = await asyncpg.connect(dsn=_project_dsn(project))
-    except asyncpg.InvalidCatalogNameError:
-        raise HTTPException(404, f"Project database '{project}' not found")
-
-    try:
+    async with _project_conn(project, read=True) as conn:
         # Verify table exists
         exists = await conn.fetchval(
             """
             SELECT 1 FROM information_schema.tables
-            WHERE table_name = $1 AND table_schema = 'public'
+            WHERE table_name = $1 AND table_schema = current_schema()
             """,
             table,
         )
@@ -179,23 +430,234 @@ async def get_table_rows(project: str, table: str, limit: int = 100, offset: int
             raise HTTPException(404, f"Table '{table}' not found in '{project}'")
 
         total = await conn.fetchval(f'SELECT COUNT(*) FROM "{table}"')
+        archived = await cold_storage.cold_files(conn, table)
+        if archived:
+            total += sum(f["rows"] for f in archived)
+            rows_json = await _federated_page(conn, table, archived, limit, offset)
+        else:
+            rows_json = await _hot_page(conn, table, limit, offset)
+
+    return json_object_response(
+        {
+            "project": project,
+            "table": table,
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+        },
+        rows=rows_json,
+    )
+
+
+@router.get("/tables/{project}/{table}/sync")
+async def sync_table(
+    request: Request,
+    project: str,
+    table: str,
+    since: int = Query(0, ge=0),
+    cursor: str | None = None,
+    limit: int = Query(5000, ge=1, le=50000),
+):
+    """Rows written and deleted since a watermark, for offline clients.
+
+    Start with ``since=0`` (everything) and store the returned
+    ``watermark``; pass it as ``since`` next time. Rows come as arrays in
+    ``columns`` order under ``upserts``; ``deletes`` lists removed ids. A
+    page that has a ``cursor`` instead of a ``watermark`` is not the last:
+    repeat the request with the same ``since`` and that ``cursor``.
+    """
+    project = project.lower()
+    table = table.lower()
+    _validate_identifier(project, "project_name")
+    _validate_identifier(table, "table_name")
+
+    after = None
+    if cursor is not None:
+        try:
+            watermark, version, row_id = (int(part) for part in cursor.split("."))
+        except ValueError:
+            raise HTTPException(400, "Invalid cursor")
+        after = (version, row_id)
+
+    # Primary only: the watermark must come from the server the rows do
+    async with _project_conn(project) as conn:
         records = await conn.fetch(
-            f'SELECT * FROM "{table}" ORDER BY id LIMIT $1 OFFSET $2',
-            limit,
-            offset,
+            """
+            SELECT column_name FROM information_schema.columns
+            WHERE table_name = $1 AND table_schema = current_schema()
+            ORDER BY ordinal_position
+            """,
+            table,
         )
-        rows = [_serialize_row(r) for r in records]
-    finally:
-        await conn.close()
+        if not records:
+            raise HTTPException(404, f"Table '{table}' not found in '{project}'")
+        columns = [r["column_name"] for r in records if r["column_name"] != sync.VERSION_COLUMN]
+        if not await sync.sync_enabled(conn, table):
+            await sync.enable_sync(conn, table)
+
+        if cursor is None:
+            # Taken before reading, so anything the reads miss is at or above it
+            watermark = await sync.snapshot_watermark(conn)
+        rows_json, count, last = await sync.changes_since(
+            conn, table, columns, since, after, limit
+        )
+        deletes = await sync.deletes_since(conn, table, since) if cursor is None else []
 
-    return {
+    envelope = {
         "project": project,
         "table": table,
-        "total": total,
-        "limit": limit,
-        "offset": offset,
-        "rows": rows,
+        "since": since,
+        "watermark": None if last else watermark,
+        "cursor": f"{watermark}.{last[0]}.{last[1]}" if last else None,
+        "columns": columns,
+        "count": count,
+        "deletes": deletes,
     }
+    return await gzip_response(request, json_object_response(envelope, upserts=rows_json))
+
+
+# Rows per event while replaying from since_id / Last-Event-ID
+_CHANGES_REPLAY_PAGE = 1000
+
+
+def _listen_dsn(project: str) -> str:
+    """Database whose NOTIFYs carry inserts into *project*'s tables."""
+    if PROJECT_STORAGE == "schema":
+        return _parse_conn_params()["dsn"]
+    return _project_dsn(project)
+
+
+def _changed_rows_fetcher(project: str, table: str):
+    async def fetch(runs: list[tuple[int, int]]) -> str:
+        async with _project_conn(project) as conn:
+            return await conn.fetchval(
+                f"""
+                SELECT COALESCE(json_agg(changed ORDER BY changed.id), '[]')::text
+                FROM "{table}" changed
+                JOIN unnest($1::int[], $2::int[]) AS run(lo, hi)
+                  ON changed.id BETWEEN run.lo AND run.hi
+                """,
+                [lo for lo, _ in runs],
+                [hi for _, hi in runs],
+            )
+
+    return fetch
+
+
+def _unsent_rows(rows_json: str, sent: list[tuple[int, int]]) -> tuple[int, str] | None:
+    """The rows of a live batch whose ids aren't in the *sent* runs.
+
+    Returns ``(highest id, rows JSON)``, or None if every row was sent.
+    """
+    starts = [lo for lo, _ in sent]
+
+    def was_sent(row_id: int) -> bool:
+        i = bisect_right(starts, row_id) - 1
+        return i >= 0 and row_id <= sent[i][1]
+
+    rows = [r for r in orjson.loads(rows_json) if not was_sent(r["id"])]
+    if not rows:
+        return None
+    return rows[-1]["id"], orjson.dumps(rows).decode()
+
+
+@router.get("/tables/{project}/{table}/changes")
+async def stream_table_changes(
+    project: str,
+    table: str,
+    since_id: int | None = None,
+    last_event_id: str | None = Header(None),
+):
+    """Server-sent events for rows inserted into a dynamic table.
+
+    Each ``rows`` event carries a JSON array of new rows and has the highest
+    row id in it as its event id. With ``since_id`` (or ``Last-Event-ID`` on
+    reconnect) the rows after that id are replayed first; a row may then
+    arrive twice, so dedupe on ``id``. A ``resync`` event means this stream
+    fell behind or lost its listener: reconnect with the last id seen.
+    """
+    project = project.lower()
+    table = table.lower()
+    _validate_identifier(project, "project_name")
+    _validate_identifier(table, "table_name")
+    if last_event_id and last_event_id.isdigit():
+        since_id = int(last_event_id)
+
+    async with _project_conn(project, read=True) as conn:
+        exists = await conn.fetchval(
+            """
+            SELECT 1 FROM information_schema.tables
+            WHERE table_name = $1 AND table_schema = current_schema()
+            """,
+            table,
+        )
+    if not exists:
+        raise HTTPException(404, f"Table '{table}' not found in '{project}'")
+
+    async def events():
+        last_id = since_id
+        # Id runs sent by the replay. Ids are allocated before commit, so a
+        # live batch may hold rows below the replay's highest id that the
+        # replay never saw; only rows it did send are dropped from live batches.
+        sent: list[tuple[int, int]] = []
+        async with change_feed.subscribe(
+            _listen_dsn(project), project, table, _changed_rows_fetcher(project, table)
+        ) as queue:
+            yield ": connected\n\n"
+            # Subscribed first, so nothing inserted during the replay is lost
+            while last_id is not None:
+                async with _project_conn(project) as conn:
+                    page = await conn.fetchrow(
+                        f"""
+                        SELECT COALESCE(json_agg(page ORDER BY page.id), '[]')::text AS rows,
+                               max(page.id) AS top, array_agg(page.id) AS ids
+                        FROM (
+                            SELECT * FROM "{table}" WHERE id > $1 ORDER BY id LIMIT $2
+                        ) page
+                        """,
+                        last_id,
+                        _CHANGES_REPLAY_PAGE,
+                    )
+                if page["top"] is None:
+                    break
+                yield sse_event("rows", page["rows"], page["top"])
+                last_id = page["top"]
+                sent += id_runs(page["ids"])  # pages ascend, so this stays sorted
+
+            while True:
+                try:
+                    async with asyncio.timeout(CHANGE_FEED_HEARTBEAT):
+                        batch = await queue.get()
+                except TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if batch is None:
+                    yield sse_event("resync", "{}")
+                    return
+                low, top, rows_json = batch
+                if sent and low <= sent[-1][1]:
+                    unsent = _unsent_rows(rows_json, sent)
+                    if unsent is None:
+                        continue
+                    top, rows_json = unsent
+                yield sse_event("rows", rows_json, top)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# The project's own tables. Partitions and the sync and cold-storage
+# bookkeeping tables are implementation details; hide them.
+_VISIBLE_TABLES_SQL = """
+    SELECT t.table_name FROM information_schema.tables t
+    JOIN pg_class c
+      ON c.relname = t.table_name AND c.relnamespace = current_schema()::regnamespace
+    WHERE t.table_schema = current_schema() AND t.table_type = 'BASE TABLE'
+      AND NOT c.relispartition AND t.table_name NOT IN ($1, $2)
+"""
 
 
 @router.get("/tables/{project}")
@@ -204,25 +666,54 @@ async def list_project_tables(project: str):
     project = project.lower()
     _validate_identifier(project, "project_name")
 
-    try:
-        conn = await asyncpg.connect(dsn=_project_dsn(project))
-    except asyncpg.InvalidCatalogNameError:
-        raise HTTPException(404, f"Project database '{project}' not found")
-
-    try:
+    async with _project_conn(project, read=True) as conn:
         rows = await conn.fetch(
-            """
-            SELECT table_name FROM information_schema.tables
-            WHERE table_schema = 'public' AND table_type = 'BASE TABLE'
-            ORDER BY table_name
-            """
+            f"{_VISIBLE_TABLES_SQL} ORDER BY t.table_name",
+            sync.TOMBSTONE_TABLE,
+            cold_storage.CATALOG_TABLE,
         )
-    finally:
-        await conn.close()
 
     return {"project": project, "tables": [r["table_name"] for r in rows]}
 
 
+async def project_catalog(conn: asyncpg.Connection) -> asyncpg.Record:
+    """The project's table names and every table's columns in one round trip.
+
+    Returns ``tables`` (a JSON array, as ``GET /tables/{project}`` lists
+    them) and ``schemas`` (a JSON object of table name to the columns
+    ``GET /tables/{project}/{table}/schema`` returns), both rendered by
+    Postgres.
+    """
+    return await conn.fetchrow(
+        f"""
+        WITH visible AS ({_VISIBLE_TABLES_SQL}),
+        cols AS (
+            SELECT v.table_name,
+                   json_agg(
+                       json_build_object(
+                           'name', col.column_name,
+                           'type', col.data_type,
+                           'nullable', col.is_nullable = 'YES'
+                       ) ORDER BY col.ordinal_position
+                   ) AS columns
+            FROM visible v
+            JOIN information_schema.columns col
+              ON col.table_schema = current_schema() AND col.table_name = v.table_name
+            WHERE col.column_name <> $3
+            GROUP BY v.table_name
+        )
+        SELECT
+            (SELECT coalesce(json_agg(table_name::text ORDER BY table_name), '[]')
+             FROM visible)::text AS tables,
+            (SELECT coalesce(json_object_agg(table_name::text, columns ORDER BY table_name), '{{}}')
+             FROM cols)::text AS schemas
+        """,
+        sync.TOMBSTONE_TABLE,
+        cold_storage.CATALOG_TABLE,
+        sync.VERSION_COLUMN,
+    )
+
+
 class _SingleRowBody(BaseModel):
     data: dict
 
@@ -231,38 +722,73 @@ class _BatchRowsBody(BaseModel):
     rows: list[dict]
 
 
-async def _get_table_columns(conn: asyncpg.Connection, table: str) -> set[str]:
-    """Return the set of user-defined column names (excludes id and created_at)."""
-    records = await conn.fetch(
-        """
-        SELECT column_name FROM information_schema.columns
-        WHERE table_name = $1 AND table_schema = 'public'
-        """,
-        table,
+async def _validate_rows(
+    conn: asyncpg.Connection, project: str, table: str, rows: list[dict], loc: str
+) -> tuple[list[str], list[str], list[list]]:
+    """Run *rows* through the table's compiled validator.
+
+    Returns the column names, their array types and one value list per
+    column. Every bad cell is reported in a 422 shaped like FastAPI's own
+    validation errors (``loc`` is ``body.<loc>[.<row>].<column>``).
+    """
+    validator = await row_validators.get(conn, project, table)
+    if validator is None:
+        raise HTTPException(404, f"Table '{table}' not found in '{project}'")
+    try:
+        cols, vectors = validator.validate(rows)
+    except RowValidationError as exc:
+        index = loc == "rows"
+        raise HTTPException(
+            422,
+            [
+                {
+                    "loc": ["body", loc, *([e["row"]] if index else []), e["column"]],
+                    "msg": e["error"],
+                    "type": "value_error",
+                }
+                for e in exc.errors
+            ],
+        )
+    return cols, [validator.columns[c].sql_type for c in cols], vectors
+
+
+def _insert_sql(table: str, cols: list[str], types: list[str], returning: str) -> str:
+    """One statement inserting a row per element of the column arrays $1..$n."""
+    if not cols:
+        # Nothing but defaults: $1 is the row count
+        return (
+            f'INSERT INTO "{table}" (created_at) '
+            f"SELECT CURRENT_TIMESTAMP FROM generate_series(1, $1) RETURNING {returning}"
+        )
+    col_names = ", ".join(f'"{c}"' for c in cols)
+    arrays = ", ".join(f'${i+1}::"{t}"[]' for i, t in enumerate(types))
+    return (
+        f'INSERT INTO "{table}" ({col_names}) '
+        f"SELECT * FROM unnest({arrays}) RETURNING {returning}"
     )
-    return {r["column_name"] for r in records} - {"id", "created_at"}
 
 
-def _coerce_row(data: dict, valid_columns: set[str], table: str) -> dict:
-    """Validate column names and coerce date strings to date objects."""
-    bad = set(data.keys()) - valid_columns
-    if bad:
-        raise HTTPException(
-            400,
-            f"Unknown columns for table '{table}': {', '.join(sorted(bad))}. "
-            f"Valid columns: {', '.join(sorted(valid_columns))}",
+async def _publish_tile_changes(
+    project: str, table: str, cols: list[str], vectors: list[list]
+) -> None:
+    """Evict cached map tiles covering the points just written."""
+    geo = geo_columns(cols)
+    if geo is None:
+        return
+    bbox = points_bbox(vectors[cols.index(geo[0])], vectors[cols.index(geo[1])])
+    if bbox is not None:
+        await cache_bus.publish_committed(
+            "tiles", {"source": f"{project}.{table}", "bbox": bbox}
+        )
+
+
+async def _publish_species_names(cols: list[str], vectors: list[list]) -> None:
+    """Add the species names just recorded to every worker's autocomplete index."""
+    column = species_column(cols)
+    if column is not None:
+        await cache_bus.publish_committed(
+            "species", announcement(vectors[cols.index(column)])
         )
-    row: dict = {}
-    for k, v in data.items():
-        if isinstance(v, str):
-            # Try to coerce date-like strings
-            try:
-                row[k] = date.fromisoformat(v)
-                continue
-            except ValueError:
-                pass
-        row[k] = v
-    return row
 
 
 @router.post("/tables/{project}/{table}/rows")
@@ -273,27 +799,15 @@ async def insert_row(project: str, table: str, body: _SingleRowBody):
     _validate_identifier(project, "project_name")
     _validate_identifier(table, "table_name")
 
-    try:
-        conn = await asyncpg.connect(dsn=_project_dsn(project))
-    except asyncpg.InvalidCatalogNameError:
-        raise HTTPException(404, f"Project database '{project}' not found")
-
-    try:
-        valid_columns = await _get_table_columns(conn, table)
-        if not valid_columns:
-            raise HTTPException(404, f"Table '{table}' not found in '{project}'")
-
-        row = _coerce_row(body.data, valid_columns, table)
-        cols = list(row.keys())
-        placeholders = ", ".join(f"${i+1}" for i in range(len(cols)))
-        col_names = ", ".join(f'"{c}"' for c in cols)
-
-        record = await conn.fetchrow(
-            f'INSERT INTO "{table}" ({col_names}) VALUES ({placeholders}) RETURNING *',
-            *row.values(),
-        )
-    finally:
-        await conn.close()
+    async with _project_conn(project) as conn:
+        cols, types, vectors = await _validate_rows(conn, project, table, [body.data], "data")
+        async with conn.transaction():
+            record = await conn.fetchrow(
+                _insert_sql(table, cols, types, "*"), *(vectors or [1])
+            )
+            await change_feed.publish(conn, project, table, [record["id"]])
+    await _publish_tile_changes(project, table, cols, vectors)
+    await _publish_species_names(cols, vectors)
 
     return {"status": "ok", "row": _serialize_row(record)}
 
@@ -306,19 +820,22 @@ async def delete_row(project: str, table: str, row_id: int):
     _validate_identifier(project, "project_name")
     _validate_identifier(table, "table_name")
 
-    try:
-        conn = await asyncpg.connect(dsn=_project_dsn(project))
-    except asyncpg.InvalidCatalogNameError:
-        raise HTTPException(404, f"Project database '{project}' not found")
-
-    try:
-        result = await conn.execute(
-            f'DELETE FROM "{table}" WHERE id = $1', row_id
+    async with _project_conn(project) as conn:
+        validator = await row_validators.get(conn, project, table)
+        if validator is None:
+            raise HTTPException(404, f"Table '{table}' not found in '{project}'")
+        geo = geo_columns(validator.columns) or ()
+        returning = ", ".join(["id", *(f'"{c}"' for c in geo)])
+        deleted = await conn.fetchrow(
+            f'DELETE FROM "{table}" WHERE id = $1 RETURNING {returning}', row_id
         )
-        if result == "DELETE 0":
+        if deleted is None:
             raise HTTPException(404, f"Row {row_id} not found in '{table}'")
-    finally:
-        await conn.close()
+
+    if geo:
+        await _publish_tile_changes(
+            project, table, list(geo), [[deleted[geo[0]]], [deleted[geo[1]]]]
+        )
 
     return {"status": "ok", "deleted_id": row_id}
 
@@ -334,27 +851,241 @@ async def insert_rows_batch(project: str, table: str, body: _BatchRowsBody):
     if not body.rows:
         raise HTTPException(400, "No rows provided")
 
-    try:
-        conn = await asyncpg.connect(dsn=_project_dsn(project))
-    except asyncpg.InvalidCatalogNameError:
-        raise HTTPException(404, f"Project database '{project}' not found")
+    async with _project_conn(project) as conn:
+        cols, types, vectors = await _validate_rows(conn, project, table, body.rows, "rows")
+        async with conn.transaction():
+            ids = await conn.fetch(
+                _insert_sql(table, cols, types, "id"), *(vectors or [len(body.rows)])
+            )
+            await change_feed.publish(conn, project, table, [r["id"] for r in ids])
+    await _publish_tile_changes(project, table, cols, vectors)
+    await _publish_species_names(cols, vectors)
 
-    try:
-        valid_columns = await _get_table_columns(conn, table)
-        if not valid_columns:
+    return {"status": "ok", "count": len(ids)}
+
+
+@router.get("/tables/{project}/{table}/partitions")
+async def list_table_partitions(project: str, table: str):
+    """Return the partition settings and child partitions of a dynamic table."""
+    project = project.lower()
+    table = table.lower()
+    _validate_identifier(project, "project_name")
+    _validate_identifier(table, "table_name")
+
+    async with _project_conn(project, read=True) as conn:
+        config = await partitions.get_partition_config(conn, table)
+        if config is None:
+            raise HTTPException(404, f"Table '{table}' in '{project}' is not partitioned")
+        parts = await partitions.list_partitions(conn, table)
+
+    return {"project": project, "table": table, "partition": config, "partitions": parts}
+
+
+@router.post("/tables/{project}/{table}/partitions/maintain")
+async def maintain_table_partitions(project: str, table: str):
+    """Create the current and upcoming partitions of a dynamic table."""
+    project = project.lower()
+    table = table.lower()
+    _validate_identifier(project, "project_name")
+    _validate_identifier(table, "table_name")
+
+    async with _project_conn(project) as conn:
+        config = await partitions.get_partition_config(conn, table)
+        if config is None:
+            raise HTTPException(404, f"Table '{table}' in '{project}' is not partitioned")
+        created = await partitions.ensure_partitions(conn, table, config)
+
+    return {"status": "ok", "created": created}
+
+
+@router.post("/tables/{project}/{table}/partitions/detach")
+async def detach_table_partitions(project: str, table: str, body: PartitionDetachRequest):
+    """Detach (and optionally archive) partitions that end before a cutoff."""
+    project = project.lower()
+    table = table.lower()
+    _validate_identifier(project, "project_name")
+    _validate_identifier(table, "table_name")
+
+    async with _project_conn(project) as conn:
+        config = await partitions.get_partition_config(conn, table)
+        if config is None:
+            raise HTTPException(404, f"Table '{table}' in '{project}' is not partitioned")
+        detached = await partitions.detach_partitions(
+            conn, table, body.before, body.archive, _archive_schema(project)
+        )
+
+    return {"status": "ok", "detached": detached, "archived": body.archive}
+
+
+@router.post("/tables/{project}/{table}/cold-archive")
+async def cold_archive_table(project: str, table: str, body: ColdArchiveRequest):
+    """Move rows created before a cutoff into Parquet cold storage.
+
+    Archived rows stay readable through ``/rows``; see ``backend.cold_storage``.
+    """
+    project = project.lower()
+    table = table.lower()
+    _validate_identifier(project, "project_name")
+    _validate_identifier(table, "table_name")
+
+    before = datetime.combine(body.before, datetime.min.time())
+    async with _project_conn(project) as conn:
+        try:
+            result = await cold_storage.archive_table(conn, project, table, before)
+        except RuntimeError as exc:
+            raise HTTPException(503, str(exc))
+        if result is None:
             raise HTTPException(404, f"Table '{table}' not found in '{project}'")
 
-        coerced = [_coerce_row(r, valid_columns, table) for r in body.rows]
-        # Use columns from first row (all rows should have same keys)
-        cols = list(coerced[0].keys())
-        col_names = ", ".join(f'"{c}"' for c in cols)
-        placeholders = ", ".join(f"${i+1}" for i in range(len(cols)))
+    if result["rows"]:
+        await cache_bus.publish_committed("tiles", {"source": f"{project}.{table}"})
+    return {"status": "ok", "archived_rows": result["rows"], "files": result["files"]}
+
+
+async def _profile(project: str, table: str, full: bool = False) -> dict | None:
+    """Profile one table; None if another worker is already profiling it."""
+    async with async_session() as db:
+        locked = (
+            await db.execute(
+                text("SELECT pg_try_advisory_xact_lock(hashtext(:key))"),
+                {"key": f"eco_profile:{project}.{table}"},
+            )
+        ).scalar()
+        if not locked:
+            return None
+        async with _project_conn(project) as conn:
+            validator = await row_validators.get(conn, project, table)
+            if validator is None:
+                raise HTTPException(404, f"Table '{table}' not found in '{project}'")
+            row = await profiling.profile_table(conn, db, project, table, validator, full)
+        await db.commit()
+    return row
 
-        await conn.executemany(
-            f'INSERT INTO "{table}" ({col_names}) VALUES ({placeholders})',
-            [tuple(r[c] for c in cols) for r in coerced],
+
+@router.get("/tables/{project}/{table}/profile")
+async def get_table_profile(project: str, table: str):
+    """Return the last stored data profile of a dynamic table."""
+    project = project.lower()
+    table = table.lower()
+    _validate_identifier(project, "project_name")
+    _validate_identifier(table, "table_name")
+
+    async with async_session() as db:
+        stored = (
+            await db.execute(
+                select(TableProfileDB.profile, TableProfileDB.profiled_at).where(
+                    TableProfileDB.project_name == project, TableProfileDB.table_name == table
+                )
+            )
+        ).first()
+    if stored is None:
+        raise HTTPException(404, f"No profile for '{table}' in '{project}' yet")
+
+    return {"project": project, "table": table, "profiled_at": stored.profiled_at, **stored.profile}
+
+
+@router.post("/tables/{project}/{table}/profile")
+async def profile_dynamic_table(project: str, table: str, full: bool = False):
+    """Profile a dynamic table now (incrementally unless ``full``)."""
+    project = project.lower()
+    table = table.lower()
+    _validate_identifier(project, "project_name")
+    _validate_identifier(table, "table_name")
+
+    row = await _profile(project, table, full)
+    if row is None:
+        raise HTTPException(409, f"'{table}' in '{project}' is already being profiled")
+
+    return {"project": project, "table": table, "profiled_at": row["profiled_at"], **row["profile"]}
+
+
+async def profile_all_tables() -> list[str]:
+    """Profile every table a program writes to; returns the ``project.table`` names done."""
+    async with async_session() as db:
+        result = await db.execute(
+            select(func.lower(ProgramDB.project_name), func.lower(ProgramDB.table_name))
+            .where(ProgramDB.project_name.is_not(None), ProgramDB.table_name.is_not(None))
+            .distinct()
+        )
+        tables = sorted(result.all())
+
+    done = []
+    for project, table in tables:
+        if not _IDENTIFIER_RE.match(project) or not _IDENTIFIER_RE.match(table):
+            continue
+        try:
+            if await _profile(project, table) is not None:
+                done.append(f"{project}.{table}")
+        except (HTTPException, OSError, asyncpg.PostgresError):
+            continue  # one missing or broken table shouldn't stop the rest
+    return done
+
+
+async def _maintain_conn_partitions(
+    conn: asyncpg.Connection, project: str, created: dict[str, list[str]]
+) -> None:
+    tables = await conn.fetch(
+        """
+        SELECT relname FROM pg_class
+        WHERE relkind = 'p' AND relnamespace = current_schema()::regnamespace
+        """
+    )
+    for t in tables:
+        config = await partitions.get_partition_config(conn, t["relname"])
+        if config is None:
+            continue
+        made = await partitions.ensure_partitions(conn, t["relname"], config)
+        if made:
+            created[f"{project}.{t['relname']}"] = made
+
+
+async def maintain_all_partitions() -> dict[str, list[str]]:
+    """Run partition maintenance for every partitioned table in every project.
+
+    Returns a mapping of ``project.table`` to the partitions created.
+    """
+    created: dict[str, list[str]] = {}
+    if PROJECT_STORAGE == "schema":
+        pool = await _get_pool()
+        async with pool.acquire() as conn:
+            projects = await conn.fetch(
+                """
+                SELECT DISTINCT n.nspname FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE c.relkind = 'p' AND n.nspname <> 'public'
+                """
+            )
+        for p in projects:
+            project = p["nspname"]
+            if not _IDENTIFIER_RE.match(project):
+                continue
+            async with _project_conn(project) as conn:
+                await _maintain_conn_partitions(conn, project, created)
+        return created
+
+    main_db = _parse_conn_params()["dsn"].rsplit("/", 1)[-1].split("?", 1)[0]
+    sys_conn = await _connect("main", **_parse_conn_params())
+    try:
+        projects = await sys_conn.fetch(
+            """
+            SELECT datname FROM pg_database
+            WHERE NOT datistemplate AND datname NOT IN ('postgres', $1)
+            """,
+            main_db,
         )
     finally:
-        await conn.close()
+        await sys_conn.close()
 
-    return {"status": "ok", "count": len(coerced)}
+    for p in projects:
+        project = p["datname"]
+        if not _IDENTIFIER_RE.match(project):
+            continue
+        try:
+            conn = await _connect("project", dsn=_project_dsn(project))
+        except (asyncpg.InvalidCatalogNameError, asyncpg.InvalidAuthorizationSpecificationError):
+            continue
+        try:
+            await _maintain_conn_partitions(conn, project, created)
+        finally:
+            await conn.close()
+    return created
@@ -5,9 +5,11 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from backend.cache_bus import cache_bus
 from backend.database import get_db
 from backend.db_models import FormConfigDB
 from backend.models.form_config import FormConfigRequest, FormConfigResponse
+from backend.replicas import get_read_db
 
 router = APIRouter(prefix="/api/form-configs", tags=["form-configs"])
 
@@ -24,13 +26,18 @@ async def create_form_config(
         created_at=datetime.now(timezone.utc).isoformat(),
     )
     db.add(row)
+    await cache_bus.publish(
+        "form_config",
+        {"project": config.project_name.lower(), "table": config.table_name.lower()},
+        db,
+    )
     await db.commit()
     return row
 
 
 @router.get("/{project_name}/{table_name}", response_model=FormConfigResponse)
 async def get_form_config(
-    project_name: str, table_name: str, db: AsyncSession = Depends(get_db)
+    project_name: str, table_name: str, db: AsyncSession = Depends(get_read_db)
 ):
     result = await db.execute(
         select(FormConfigDB).where(
@@ -1,42 +1,70 @@
+import asyncio
+import os
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import func, or_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from backend.cache_bus import cache_bus
 from backend.database import get_db
-from backend.db_models import ProgramDB
+from backend.db_models import FormConfigDB, ProgramDB
 import uuid
 
-from backend.models import Program, ProgramCreate
+from backend.models import Program, ProgramBootstrap, ProgramCreate
+from backend.models.form_config import FormConfigResponse
+from backend.replicas import get_read_db
+from backend.responses import (
+    conditional_response,
+    fetch_json_array,
+    gzip_response,
+    json_array_response,
+    json_object_response,
+    model_columns,
+)
+from backend.routes.dynamic_tables import _IDENTIFIER_RE, _project_conn, project_catalog
+
+# How long browsers may reuse a bootstrap payload before revalidating its ETag
+BOOTSTRAP_MAX_AGE = int(os.getenv("BOOTSTRAP_MAX_AGE", "30"))
 
 router = APIRouter(prefix="/api/programs", tags=["programs"])
 
 
+async def _publish_change(db: AsyncSession, program: ProgramDB) -> None:
+    """Evict the program from every worker's caches once *db* commits."""
+    await cache_bus.publish(
+        "program",
+        {
+            "program_id": program.id,
+            "project": program.project_name.lower() if program.project_name else None,
+            "table": program.table_name.lower() if program.table_name else None,
+        },
+        db,
+    )
+
+
 @router.get("", response_model=list[Program])
 async def list_programs(
     category: Optional[str] = None,
     status: Optional[str] = None,
     search: Optional[str] = None,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
-    stmt = select(ProgramDB)
+    stmt = select(*model_columns(ProgramDB, Program))
     if category:
         stmt = stmt.where(ProgramDB.category == category)
     if status:
         stmt = stmt.where(ProgramDB.status == status.lower())
-    result = await db.execute(stmt)
-    rows = result.scalars().all()
     if search:
         q = search.lower()
-        rows = [
-            r
-            for r in rows
-            if q in r.title.lower()
-            or q in r.organization.lower()
-            or q in r.description.lower()
-        ]
-    return rows
+        stmt = stmt.where(
+            or_(
+                func.strpos(func.lower(ProgramDB.title), q) > 0,
+                func.strpos(func.lower(ProgramDB.organization), q) > 0,
+                func.strpos(func.lower(ProgramDB.description), q) > 0,
+            )
+        )
+    return json_array_response(await fetch_json_array(db, stmt))
 
 
 @router.post("", response_model=Program, status_code=201)
@@ -77,12 +105,13 @@ async def create_program(data: ProgramCreate, db: AsyncSession = Depends(get_db)
         table_cnn=data.table_cnn,
     )
     db.add(program)
+    await _publish_change(db, program)
     await db.commit()
     return program
 
 
 @router.get("/{program_id}", response_model=Program)
-async def get_program(program_id: str, db: AsyncSession = Depends(get_db)):
+async def get_program(program_id: str, db: AsyncSession = Depends(get_read_db)):
     result = await db.execute(select(ProgramDB).where(ProgramDB.id == program_id))
     program = result.scalars().first()
     if not program:
@@ -90,6 +119,74 @@ async def get_program(program_id: str, db: AsyncSession = Depends(get_db)):
     return program
 
 
+async def _form_config(db: AsyncSession, project: str, table: str) -> dict | None:
+    result = await db.execute(
+        select(FormConfigDB).where(
+            FormConfigDB.project_name == project,
+            FormConfigDB.table_name == table,
+        )
+    )
+    row = result.scalars().first()
+    if row is None:
+        return None
+    return FormConfigResponse.model_validate(row, from_attributes=True).model_dump()
+
+
+async def _catalog(project: str) -> tuple[str, str] | None:
+    """``(tables, schemas)`` JSON of *project*, or None if it doesn't exist yet."""
+    if not _IDENTIFIER_RE.match(project):
+        return None
+    try:
+        async with _project_conn(project, read=True) as conn:
+            row = await project_catalog(conn)
+    except HTTPException as exc:
+        if exc.status_code == 404:
+            return None
+        raise
+    return row["tables"], row["schemas"]
+
+
+@router.get("/{program_id}/bootstrap", response_model=ProgramBootstrap)
+async def bootstrap_program(
+    program_id: str, request: Request, db: AsyncSession = Depends(get_read_db)
+):
+    """Everything the contribution form needs, in one response.
+
+    Bundles the program, the form config of its table, the project's tables
+    and their column schemas, as the separate program, form-config, table
+    list and table schema endpoints return them. After the program is
+    loaded, the form config (main database) and the catalog (project
+    database) are fetched concurrently. ``form_config`` and ``tables`` are
+    null when the program has no table or it hasn't been created yet.
+    """
+    result = await db.execute(select(ProgramDB).where(ProgramDB.id == program_id))
+    program = result.scalars().first()
+    if not program:
+        raise HTTPException(status_code=404, detail="Program not found")
+
+    envelope = {
+        "program": Program.model_validate(program, from_attributes=True).model_dump(),
+        "form_config": None,
+    }
+    raw = {"tables": "null", "schemas": "{}"}
+    if program.project_name and program.table_name:
+        envelope["form_config"], catalog = await asyncio.gather(
+            _form_config(db, program.project_name, program.table_name),
+            _catalog(program.project_name.lower()),
+        )
+        if catalog is not None:
+            raw["tables"], raw["schemas"] = catalog
+
+    response = conditional_response(
+        request,
+        json_object_response(envelope, **raw),
+        f"public, max-age={BOOTSTRAP_MAX_AGE}",
+    )
+    if response.status_code == 304:
+        return response
+    return await gzip_response(request, response)
+
+
 @router.delete("/{program_id}", status_code=204)
 async def delete_program(program_id: str, db: AsyncSession = Depends(get_db)):
     result = await db.execute(select(ProgramDB).where(ProgramDB.id == program_id))
@@ -97,4 +194,5 @@ async def delete_program(program_id: str, db: AsyncSession = Depends(get_db)):
     if not program:
         raise HTTPException(status_code=404, detail="Program not found")
     await db.delete(program)
+    await _publish_change(db, program)
     await db.commit()
@@ -0,0 +1,80 @@
+import asyncio
+from collections import Counter
+
+import asyncpg
+from fastapi import APIRouter, HTTPException, Query
+from sqlalchemy import func, select
+
+from backend.database import async_session
+from backend.db_models import ProgramDB, SubmissionDB
+from backend.models import SpeciesAutocomplete
+from backend.routes.dynamic_tables import _IDENTIFIER_RE, _project_conn
+from backend.row_validators import row_validators
+from backend.species_index import MAX_NAME_LENGTH, species_column, species_index
+
+router = APIRouter(prefix="/api/species", tags=["species"])
+
+
+def _imagenet_labels() -> list[str]:
+    # Imported here: loading torch is slow and only needed on a full reload
+    from backend.classify_image import LABELS
+
+    return LABELS
+
+
+async def _table_species(project: str, table: str) -> list[asyncpg.Record]:
+    async with _project_conn(project, read=True) as conn:
+        validator = await row_validators.get(conn, project, table)
+        column = species_column(validator.columns) if validator else None
+        if column is None:
+            return []
+        return await conn.fetch(
+            f"""
+            SELECT "{column}"::text AS name, count(*) AS n FROM "{table}"
+            WHERE "{column}" IS NOT NULL AND char_length("{column}"::text) <= $1
+            GROUP BY 1
+            """,
+            MAX_NAME_LENGTH,
+        )
+
+
+async def _load_species() -> dict[str, int]:
+    """Every known species name and how often it was recorded."""
+    counts: Counter[str] = Counter(dict.fromkeys(await asyncio.to_thread(_imagenet_labels), 0))
+    async with async_session() as db:
+        result = await db.execute(
+            select(SubmissionDB.species_name, func.count())
+            .where(func.char_length(SubmissionDB.species_name) <= MAX_NAME_LENGTH)
+            .group_by(SubmissionDB.species_name)
+        )
+        counts.update(dict(result.all()))
+        result = await db.execute(
+            select(ProgramDB.project_name, ProgramDB.table_name)
+            .where(ProgramDB.project_name.is_not(None), ProgramDB.table_name.is_not(None))
+            .distinct()
+        )
+        tables = {(p.lower(), t.lower()) for p, t in result.all()}
+
+    for project, table in sorted(tables):
+        if not _IDENTIFIER_RE.match(project) or not _IDENTIFIER_RE.match(table):
+            continue
+        try:
+            rows = await _table_species(project, table)
+        except (HTTPException, OSError, asyncpg.PostgresError):
+            continue  # a missing or unreachable project shouldn't hide the rest
+        counts.update({r["name"]: r["n"] for r in rows})
+    return counts
+
+
+@router.get("/autocomplete", response_model=SpeciesAutocomplete)
+async def autocomplete_species(
+    q: str = Query(..., min_length=1, max_length=MAX_NAME_LENGTH),
+    limit: int = Query(10, ge=1, le=50),
+):
+    """Species names matching what the user has typed so far, most recorded first.
+
+    Matches the start of any word of a name; falls back to trigram
+    similarity for typos.
+    """
+    await species_index.ensure(_load_species)
+    return {"query": q, "suggestions": species_index.suggest(q, limit)}
@@ -4,9 +4,12 @@ from datetime import datetime, timezone
 from fastapi import APIRouter, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from backend.cache_bus import cache_bus
 from backend.database import get_db
 from backend.db_models import SubmissionDB
 from backend.models import Submission, SubmissionResponse
+from backend.species_index import announcement
+from backend.tiles import SUBMISSIONS_SOURCE, points_bbox
 
 router = APIRouter(prefix="/api/submissions", tags=["submissions"])
 
@@ -21,5 +24,9 @@ async def create_submission(
         **submission.model_dump(),
     )
     db.add(row)
+    bbox = points_bbox([row.latitude], [row.longitude])
+    if bbox is not None:
+        await cache_bus.publish("tiles", {"source": SUBMISSIONS_SOURCE, "bbox": bbox}, db)
+    await cache_bus.publish("species", announcement([row.species_name]), db)
     await db.commit()
     return row
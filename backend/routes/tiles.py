@@ -0,0 +1,113 @@
+import asyncio
+from contextlib import suppress
+
+import asyncpg
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.metrics import span
+from backend.replicas import get_read_db
+from backend.routes.dynamic_tables import _IDENTIFIER_RE, _project_conn
+from backend.row_validators import row_validators
+from backend.tiles import (
+    SUBMISSIONS_SOURCE,
+    TILE_MAX_ZOOM,
+    encode_points,
+    geo_columns,
+    geo_index_sql,
+    point_expr,
+    tile_cache,
+    tile_params,
+    tile_sql,
+)
+
+router = APIRouter(prefix="/api/tiles", tags=["tiles"])
+
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+
+# Dynamic tables whose geo index this worker has already ensured
+_geo_indexed: set[tuple[str, str]] = set()
+_index_tasks: set[asyncio.Task] = set()
+
+
+async def _ensure_geo_index(project: str, table: str, lat: str, lon: str) -> None:
+    """Build the tile bbox index of a dynamic table in the background.
+
+    Runs on the primary. ``CONCURRENTLY`` keeps inserts flowing, except on
+    partitioned tables, which don't support it.
+    """
+    with suppress(HTTPException, OSError, asyncpg.PostgresError):
+        async with _project_conn(project) as conn:
+            partitioned = await conn.fetchval(
+                "SELECT relkind = 'p' FROM pg_class "
+                "WHERE relname = $1 AND relnamespace = current_schema()::regnamespace",
+                table,
+            )
+            await conn.execute(geo_index_sql(table, lat, lon, concurrently=not partitioned))
+
+
+async def _submission_points(db: AsyncSession, params: list) -> list:
+    conn = await db.connection()
+    raw = (await conn.get_raw_connection()).driver_connection
+    points = (
+        f"SELECT id, {point_expr('latitude', 'varchar')} AS lat, "
+        f"{point_expr('longitude', 'varchar')} AS lon FROM submissions"
+    )
+    return await raw.fetch(tile_sql(points, 1), *params)
+
+
+async def _table_points(project: str, table: str, params: list) -> list:
+    async with _project_conn(project, read=True) as conn:
+        validator = await row_validators.get(conn, project, table)
+        if validator is None:
+            raise HTTPException(404, f"Table '{table}' not found in '{project}'")
+        geo = geo_columns(validator.columns)
+        if geo is None:
+            raise HTTPException(404, f"Table '{table}' has no latitude/longitude columns")
+        lat, lon = (validator.columns[c] for c in geo)
+        lat_sql = point_expr(lat.name, lat.sql_type)
+        lon_sql = point_expr(lon.name, lon.sql_type)
+        if (project, table) not in _geo_indexed:
+            _geo_indexed.add((project, table))
+            task = asyncio.create_task(_ensure_geo_index(project, table, lat_sql, lon_sql))
+            _index_tasks.add(task)
+            task.add_done_callback(_index_tasks.discard)
+        points = f'SELECT id, {lat_sql} AS lat, {lon_sql} AS lon FROM "{table}"'
+        return await conn.fetch(tile_sql(points, 1), *params)
+
+
+@router.get("/{source}/{z}/{x}/{y}.mvt")
+async def get_tile(
+    source: str, z: int, x: int, y: int, db: AsyncSession = Depends(get_read_db)
+):
+    """Mapbox Vector Tile of observation points, clustered at low zoom.
+
+    *source* is ``submissions`` or ``<project>.<table>`` for a dynamic table
+    with latitude/longitude columns.
+    """
+    if not 0 <= z <= TILE_MAX_ZOOM or not (0 <= x < 2**z and 0 <= y < 2**z):
+        raise HTTPException(404, "Tile out of range")
+    source = source.lower()
+    if source != SUBMISSIONS_SOURCE:
+        project, _, table = source.partition(".")
+        if not _IDENTIFIER_RE.match(project) or not _IDENTIFIER_RE.match(table):
+            raise HTTPException(404, f"Unknown tile source '{source}'")
+
+    key = (source, z, x, y)
+    tile = tile_cache.get(key)
+    if tile is None:
+        generation = tile_cache.generation(source)
+        params = tile_params(z, x, y)
+        with span("tiles.build", zoom=z):
+            if source == SUBMISSIONS_SOURCE:
+                records = await _submission_points(db, params)
+            else:
+                records = await _table_points(project, table, params)
+            tile = encode_points(source.rpartition(".")[2], records)
+        tile_cache.put(key, tile, generation)
+
+    return Response(
+        content=tile,
+        media_type=MVT_MEDIA_TYPE,
+        headers={"Cache-Control": "public, max-age=60"},
+    )
@@ -1,17 +1,29 @@
+import asyncio
 import os
 import re
 import uuid
 
-from fastapi import APIRouter, Depends, UploadFile, File, Form
-from sqlalchemy import select
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from sqlalchemy import or_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from backend.admission import Overloaded, admission
+from backend.cache_bus import cache_bus
 from backend.database import get_db
 from backend.db_models import ProgramDB
-from backend.models.upload import CnnResult, QualityScanResult, QualityWarning, UploadFilterResult, UploadResponse
-from backend.qualify_image import check_quality
+from backend.embedding_store import embedding_store
+from backend.image_hash import hash_index, phash
+from backend.models.upload import CnnResult, DuplicateMatch, GpsPosition, ImageMetadata, QualityScanResult, QualityWarning, UploadFilterResult, UploadResponse, VideoSampleInfo
+from backend.metrics import span
+from backend.probe_image import ProbeError, probe_image
+from backend.qualify_image import check_quality, decode_gray
+from backend.qualify_video import analyze_video
+from backend.storage import upload_storage
 
-UPLOAD_DIR = "/app/uploads"
+# Images below this size are rejected from their header, before decoding
+PROBE_MIN_WIDTH = int(os.getenv("PROBE_MIN_WIDTH", "160"))
+PROBE_MIN_HEIGHT = int(os.getenv("PROBE_MIN_HEIGHT", "120"))
 
 router = APIRouter(prefix="/api/uploads", tags=["uploads"])
 
@@ -56,13 +68,37 @@ def _label_from_filename(filename: str) -> str:
     return stem.strip().title()
 
 
-async def _run_quality_scan(
-    file: UploadFile, file_type: str, contents: bytes
-) -> QualityScanResult:
-    if file_type != "image":
-        return QualityScanResult(score=100.0, passed=True, reason="Good")
+def _analyze_image(
+    contents: bytes, cnn_filter: str | None
+) -> tuple[dict, str | None, dict | None]:
+    """CPU-bound image work: decode, quality scan, pHash and optional CNN.
 
-    result = check_quality(contents)
+    Runs in a worker thread while holding an admission slot. Returns the
+    ``check_quality`` result, the hex pHash (None if the image couldn't be
+    decoded) and the ``check_category`` result (None if the CNN didn't run or
+    failed).
+    """
+    # Decode once; the quality scan and perceptual hash share the image. Full
+    # resolution: the blur, noise and contrast thresholds are in full-size pixels
+    gray = decode_gray(contents)
+    with span("image.quality"):
+        quality = check_quality(contents, gray=gray)
+    image_phash = None
+    if gray is not None:
+        with span("image.phash"):
+            image_phash = f"{phash(gray):016x}"
+    cnn_data = None
+    if cnn_filter:
+        try:
+            from backend.classify_image import check_category
+            with span("image.cnn"):
+                cnn_data = check_category(contents, cnn_filter, with_embedding=True)
+        except Exception:
+            pass  # CNN failure shouldn't block upload
+    return quality, image_phash, cnn_data
+
+
+def _quality_from_result(result: dict) -> QualityScanResult:
     warnings = [QualityWarning(**w) for w in result["warnings"]]
     score = result["score"]
 
@@ -79,22 +115,96 @@ async def _run_quality_scan(
     )
 
 
+def _image_metadata(probe: dict | None) -> ImageMetadata | None:
+    if probe is None:
+        return None
+    exif = probe["exif"]
+    return ImageMetadata(
+        format=probe["format"],
+        width=probe["width"],
+        height=probe["height"],
+        orientation=exif.get("orientation"),
+        make=exif.get("make"),
+        model=exif.get("model"),
+        taken_at=exif.get("datetime_original") or exif.get("datetime"),
+        gps=GpsPosition(**exif["gps"]) if "gps" in exif else None,
+    )
+
+
+def _rejected(
+    file: UploadFile,
+    file_type: str,
+    contents: bytes,
+    check: str,
+    message: str,
+    probe: dict | None = None,
+) -> UploadFilterResult:
+    """Result for a file rejected from its header alone, without decoding."""
+    quality = QualityScanResult(
+        score=0.0,
+        passed=False,
+        reason=message,
+        warnings=[QualityWarning(check=check, message=message)],
+    )
+    return UploadFilterResult(
+        filename=file.filename or "unnamed",
+        file_type=file_type,  # type: ignore[arg-type]
+        size=len(contents),
+        accepted=False,
+        reason=message,
+        quality=quality,
+        image=_image_metadata(probe),
+    )
+
+
 async def _ai_filter(
     file: UploadFile, file_type: str, contents: bytes, cnn_filter: str | None = None
-) -> UploadFilterResult:
-    quality = await _run_quality_scan(file, file_type, contents)
+) -> tuple[UploadFilterResult, np.ndarray | None]:
+    """Run the quality scan and CNN on one file.
+
+    Returns the filter result and, when the CNN ran, the image's embedding.
+    """
+    # Videos: one streamed pass samples frames for both quality and CNN
+    video = None
+    if file_type == "video":
+        video = await asyncio.to_thread(analyze_video, contents, cnn_filter)
+
+    # Read the header first: corrupt or tiny images are rejected before decoding
+    probe = None
+    if file_type == "image":
+        with span("image.probe"):
+            try:
+                probe = probe_image(contents)
+            except ProbeError as exc:
+                message = f"Corrupt image header: {exc}"
+                return _rejected(file, file_type, contents, "decode", message), None
+        if probe and (probe["width"] < PROBE_MIN_WIDTH or probe["height"] < PROBE_MIN_HEIGHT):
+            return _rejected(
+                file,
+                file_type,
+                contents,
+                "resolution",
+                f"Image is too small ({probe['width']}x{probe['height']}px, "
+                f"minimum {PROBE_MIN_WIDTH}x{PROBE_MIN_HEIGHT})",
+                probe,
+            ), None
+
+    image_phash = None
+    cnn_result = None
+    embedding = None
     detected_label = (
         _label_from_filename(file.filename or "unnamed")
         if file_type == "image"
         else None
     )
-
-    # Run CNN classification if enabled and this is an image
-    cnn_result = None
-    if cnn_filter and file_type == "image":
-        try:
-            from backend.classify_image import check_category
-            cnn_data = check_category(contents, cnn_filter)
+    if file_type == "image":
+        quality_data, image_phash, cnn_data = await asyncio.to_thread(
+            _analyze_image, contents, cnn_filter
+        )
+        quality = _quality_from_result(quality_data)
+        if cnn_data is not None:
+            # None when the cascade decided early
+            embedding = cnn_data.get("embedding")
             cnn_result = CnnResult(
                 label=cnn_data["label"],
                 confidence=cnn_data["confidence"],
@@ -103,10 +213,15 @@ async def _ai_filter(
                 message=cnn_data["message"],
             )
             detected_label = cnn_data["label"]
-        except Exception:
-            pass  # CNN failure shouldn't block upload
+    elif video is not None:
+        quality = _quality_from_result(video["quality"])
+        if video["cnn"] is not None:
+            cnn_result = CnnResult(**video["cnn"])
+            detected_label = cnn_result.label
+    else:
+        quality = QualityScanResult(score=100.0, passed=True, reason="Good")
 
-    return UploadFilterResult(
+    filter_result = UploadFilterResult(
         filename=file.filename or "unnamed",
         file_type=file_type,  # type: ignore[arg-type]
         size=len(contents),
@@ -117,7 +232,49 @@ async def _ai_filter(
         ai_tags=[],
         ai_confidence=cnn_result.confidence if cnn_result else None,
         cnn=cnn_result,
+        phash=image_phash,
+        image=_image_metadata(probe),
+        video=VideoSampleInfo(
+            frames_sampled=video["frames_sampled"],
+            frames_total=video["frames_total"],
+            duration=video["duration"],
+            truncated=video["truncated"],
+        )
+        if video is not None
+        else None,
     )
+    return filter_result, embedding
+
+
+# (cnn_filter, table_cnn) by program id or project name; only used while the
+# cache bus is listening, so changes made by other workers always evict it.
+# Programs change rarely; any change drops the lot.
+_program_configs: dict[str, tuple[str | None, dict | None]] = {}
+cache_bus.subscribe("program", lambda _: _program_configs.clear())
+
+
+async def _program_config(
+    db: AsyncSession, program_id: str
+) -> tuple[str | None, dict | None] | None:
+    """CNN settings of the program with this id (or, failing that, project name)."""
+    if cache_bus.listening and program_id in _program_configs:
+        return _program_configs[program_id]
+    generation = cache_bus.generation
+    # Prefer the id match in one round trip
+    row = (
+        await db.execute(
+            select(ProgramDB.cnn_filter, ProgramDB.table_cnn)
+            .where(or_(ProgramDB.id == program_id, ProgramDB.project_name == program_id))
+            .order_by((ProgramDB.id == program_id).desc())
+            .limit(1)
+        )
+    ).first()
+    if row is None:
+        return None
+    config = (row.cnn_filter, row.table_cnn)
+    if cache_bus.listening and cache_bus.generation == generation:
+        _program_configs[program_id] = config
+    return config
 
 
 @router.post("", response_model=UploadResponse)
@@ -127,41 +284,76 @@ async def upload_files(
     table_name: str = Form(""),
     db: AsyncSession = Depends(get_db),
 ):
-    # Look up the program's CNN filter setting
+    if not program_id or "/" in program_id or program_id in (".", ".."):
+        raise HTTPException(status_code=400, detail="Invalid program_id")
+
     cnn_filter: str | None = None
-    result = await db.execute(select(ProgramDB).where(ProgramDB.id == program_id))
-    program = result.scalars().first()
-    if not program:
-        # Also try matching by project_name
-        result = await db.execute(
-            select(ProgramDB).where(ProgramDB.project_name == program_id)
-        )
-        program = result.scalars().first()
+    program = await _program_config(db, program_id)
     if program:
         # Check per-table CNN filter first, fall back to program-level
-        if table_name and program.table_cnn and table_name in program.table_cnn:
-            cnn_filter = program.table_cnn[table_name]
-        else:
-            cnn_filter = program.cnn_filter
+        cnn_filter, table_cnn = program
+        if table_name and table_cnn and table_name in table_cnn:
+            cnn_filter = table_cnn[table_name]
 
     results: list[UploadFilterResult] = []
+    admitted = False
+    # Hashes stored by this request; trees only see them after the commit
+    stored_hashes: list[tuple[int, str]] = []
 
     for f in files:
-        contents = await f.read()
+        with span("upload.read"):
+            contents = await f.read()
         file_type = _detect_file_type(f.content_type or "", f.filename or "")
-        filter_result = await _ai_filter(f, file_type, contents, cnn_filter)
+        if file_type in ("image", "video"):
+            # Only the first analysed file of a request can be refused, so an
+            # admitted bulk upload is never cut off halfway through
+            try:
+                async with admission.slot(program_id, may_reject=not admitted):
+                    admitted = True
+                    filter_result, embedding = await _ai_filter(
+                        f, file_type, contents, cnn_filter
+                    )
+            except Overloaded as exc:
+                raise HTTPException(
+                    status_code=429,
+                    detail=str(exc),
+                    headers={"Retry-After": str(exc.retry_after)},
+                )
+        else:
+            filter_result, embedding = await _ai_filter(f, file_type, contents, cnn_filter)
+
+        if filter_result.phash:
+            matches = await hash_index.lookup(
+                db, program_id, int(filter_result.phash, 16), recent=stored_hashes
+            )
+            filter_result.duplicates = [
+                DuplicateMatch(url=url, distance=d) for d, url in matches
+            ]
 
         if filter_result.accepted and file_type == "image":
             ext = (f.filename or "").rsplit(".", 1)[-1].lower() if "." in (f.filename or "") else "bin"
-            save_name = f"{uuid.uuid4().hex}.{ext}"
-            program_dir = os.path.join(UPLOAD_DIR, program_id)
-            os.makedirs(program_dir, exist_ok=True)
-            with open(os.path.join(program_dir, save_name), "wb") as fp:
-                fp.write(contents)
+            upload_id = uuid.uuid4().hex
+            save_name = f"{upload_id}.{ext}"
+            with span("upload.store"):
+                await upload_storage.save(
+                    f"{program_id}/{save_name}", contents, f.content_type or None
+                )
             filter_result.url = f"/uploads/{program_id}/{save_name}"
+            filter_result.upload_id = upload_id
+            if embedding is not None:
+                with span("upload.embedding"):
+                    await asyncio.to_thread(
+                        embedding_store.append, upload_id, f"{program_id}/{save_name}", embedding
+                    )
+            if filter_result.phash:
+                h = int(filter_result.phash, 16)
+                await hash_index.add(db, program_id, h, filter_result.url)
+                stored_hashes.append((h, filter_result.url))
 
         results.append(filter_result)
 
+    await db.commit()
+
     accepted = sum(1 for r in results if r.accepted)
     return UploadResponse(
         total_files=len(results),
@@ -170,3 +362,18 @@ async def upload_files(
         program_id=program_id,
         results=results,
     )
+
+
+_UPLOAD_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+@router.get("/{upload_id}/similar")
+async def similar_uploads(upload_id: str, k: int = 10):
+    """Return the k stored uploads whose CNN embeddings are closest to this one."""
+    if not _UPLOAD_ID_RE.match(upload_id):
+        raise HTTPException(status_code=400, detail="Invalid upload id")
+    k = max(1, min(k, 100))
+    matches = await asyncio.to_thread(embedding_store.similar, upload_id, k)
+    if matches is None:
+        raise HTTPException(status_code=404, detail="No embedding stored for this upload")
+    return {"upload_id": upload_id, "k": k, "results": matches}
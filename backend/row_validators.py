@@ -0,0 +1,359 @@
+"""
+Compiled row validators for dynamic-table inserts.
+
+A table's validator is built once from three sources: the column types in
+``information_schema``, the table's latest form config
+(``FormConfigDB.fields``) and the ``contribution_spec`` of any program that
+writes to it. Each column becomes a converter closure specialised for its
+Postgres type (``INTEGER`` range, ``VARCHAR(n)`` length, ISO dates, ...)
+plus a required flag: a column is required if it is ``NOT NULL`` or marked
+``required`` in either config.
+
+Rows are validated column by column: each converter runs over every row's
+value in one tight loop, producing column vectors that the insert routes
+pass to Postgres as arrays (``unnest``). Every failure is collected, so one response lists all the
+bad cells of a batch instead of the first.
+
+Validators are cached per ``(project, table)`` in ``row_validators`` and
+evicted in every worker through the cache bus when a table, its form
+config or a program's spec changes. Entries also expire after
+``ROW_VALIDATOR_TTL`` seconds as a backstop.
+"""
+
+import asyncio
+import os
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any
+
+import asyncpg
+from sqlalchemy import func, select
+
+from backend.cache_bus import cache_bus
+from backend.database import async_session
+from backend.db_models import FormConfigDB, ProgramDB
+from backend.sync import VERSION_COLUMN
+
+ROW_VALIDATOR_TTL = float(os.getenv("ROW_VALIDATOR_TTL", "60"))
+
+# Managed by the table itself; never accepted from clients
+SYSTEM_COLUMNS = {"id", "created_at", VERSION_COLUMN}
+
+_INT_RANGES = {
+    "smallint": (-(2**15), 2**15 - 1),
+    "integer": (-(2**31), 2**31 - 1),
+    "bigint": (-(2**63), 2**63 - 1),
+}
+_TRUE = {"true", "t", "yes", "y", "1", "on"}
+_FALSE = {"false", "f", "no", "n", "0", "off"}
+
+
+class RowValidationError(Exception):
+    """Raised with every problem found in a batch of rows."""
+
+    def __init__(self, errors: list[dict]):
+        super().__init__(f"{len(errors)} invalid value(s)")
+        self.errors = errors
+
+
+def _int_converter(low: int, high: int) -> Callable[[Any], int]:
+    def convert(value: Any) -> int:
+        if type(value) is int:
+            result = value
+        elif isinstance(value, float) and value.is_integer():
+            result = int(value)
+        elif isinstance(value, str):
+            result = int(value.strip())
+        else:
+            raise TypeError
+        if not low <= result <= high:
+            raise ValueError
+        return result
+
+    return convert
+
+
+def _float_converter(value: Any) -> float:
+    if type(value) is float:
+        return value
+    if isinstance(value, (int, str)) and not isinstance(value, bool):
+        return float(value)
+    raise TypeError
+
+
+def _bool_converter(value: Any) -> bool:
+    if type(value) is bool:
+        return value
+    if type(value) is int and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str):
+        lowered = value.strip().lower()
+        if lowered in _TRUE:
+            return True
+        if lowered in _FALSE:
+            return False
+    raise ValueError
+
+
+def _date_converter(value: Any) -> date:
+    if isinstance(value, str):
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            return datetime.fromisoformat(value).date()
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    raise TypeError
+
+
+def _timestamp_converter(value: Any) -> datetime:
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        return value
+    raise TypeError
+
+
+def _text_converter(max_length: int | None) -> Callable[[Any], str]:
+    def convert(value: Any) -> str:
+        if type(value) is not str:
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise TypeError
+            value = str(value)
+        if max_length is not None and len(value) > max_length:
+            raise ValueError
+        return value
+
+    return convert
+
+
+def _passthrough(value: Any) -> Any:
+    return value
+
+
+def _compile_column(data_type: str, max_length: int | None) -> tuple[Callable, str]:
+    """Converter and a human description of what it accepts."""
+    if data_type in _INT_RANGES:
+        low, high = _INT_RANGES[data_type]
+        return _int_converter(low, high), f"an integer between {low} and {high}"
+    if data_type in ("double precision", "real", "numeric"):
+        return _float_converter, "a number"
+    if data_type == "boolean":
+        return _bool_converter, "a boolean"
+    if data_type == "date":
+        return _date_converter, "an ISO date (YYYY-MM-DD)"
+    if data_type.startswith("timestamp"):
+        return _timestamp_converter, "an ISO timestamp"
+    if data_type in ("character varying", "character", "text"):
+        if max_length is not None:
+            return _text_converter(max_length), f"a string of at most {max_length} characters"
+        return _text_converter(None), "a string"
+    return _passthrough, data_type
+
+
+@dataclass(frozen=True)
+class _Column:
+    name: str
+    convert: Callable[[Any], Any]
+    expects: str
+    required: bool
+    sql_type: str  # udt name, for array casts such as ``$1::int4[]``
+
+
+class TableValidator:
+    """Validates and converts rows for one dynamic table."""
+
+    def __init__(self, table: str, columns: list[_Column]):
+        self.table = table
+        self.columns = {c.name: c for c in columns}
+        self._order = [c.name for c in columns]
+        self._required = [c.name for c in columns if c.required]
+        self.compiled_at = time.monotonic()
+
+    def validate(self, rows: list[dict]) -> tuple[list[str], list[tuple]]:
+        """Return ``(columns, vectors)``: one list of converted values per column.
+
+        The insert covers every column that is required or present in any
+        row, in table order; rows that omit a column insert ``NULL``.
+        Raises ``RowValidationError`` listing every bad cell, each as
+        ``{"row", "column", "error"}``.
+        """
+        errors: list[dict] = []
+        present: set[str] = set()
+        for row in rows:
+            present.update(row)
+
+        unknown = present - self.columns.keys()
+        if unknown:
+            valid = ", ".join(self._order)
+            for i, row in enumerate(rows):
+                for name in sorted(unknown.intersection(row)):
+                    errors.append(
+                        {
+                            "row": i,
+                            "column": name,
+                            "error": f"unknown column; valid columns: {valid}",
+                        }
+                    )
+
+        names = [n for n in self._order if n in present or n in self._required]
+        vectors = []
+        for name in names:
+            column = self.columns[name]
+            convert = column.convert
+            vector = []
+            for i, row in enumerate(rows):
+                value = row.get(name)
+                if value is None:
+                    if column.required:
+                        errors.append({"row": i, "column": name, "error": "required"})
+                    vector.append(None)
+                    continue
+                try:
+                    vector.append(convert(value))
+                except (TypeError, ValueError, OverflowError):
+                    errors.append(
+                        {
+                            "row": i,
+                            "column": name,
+                            "error": f"expected {column.expects}, got {value!r}",
+                        }
+                    )
+                    vector.append(None)
+            vectors.append(vector)
+
+        if errors:
+            errors.sort(key=lambda e: e["row"])
+            raise RowValidationError(errors)
+        return names, vectors
+
+
+async def _required_fields(project: str, table: str) -> set[str]:
+    """Lower-cased field names marked required by the form config or a program spec."""
+    async with async_session() as db:
+        fields = (
+            await db.execute(
+                select(FormConfigDB.fields)
+                .where(
+                    func.lower(FormConfigDB.project_name) == project,
+                    func.lower(FormConfigDB.table_name) == table,
+                )
+                .order_by(FormConfigDB.created_at.desc())
+                .limit(1)
+            )
+        ).scalar()
+        specs = (
+            await db.execute(
+                select(ProgramDB.contribution_spec).where(
+                    func.lower(ProgramDB.project_name) == project,
+                    func.lower(ProgramDB.table_name) == table,
+                )
+            )
+        ).scalars().all()
+
+    required = {
+        f["field_name"].lower() for f in fields or [] if f.get("required") and f.get("field_name")
+    }
+    for spec in specs:
+        for f in (spec or {}).get("fields", []):
+            if f.get("required") and f.get("name"):
+                required.add(f["name"].lower())
+    return required
+
+
+async def compile_validator(
+    conn: asyncpg.Connection, project: str, table: str
+) -> TableValidator | None:
+    """Build the validator for *table*, or ``None`` if it doesn't exist."""
+    records = await conn.fetch(
+        """
+        SELECT column_name, data_type, udt_name, character_maximum_length, is_nullable
+        FROM information_schema.columns
+        WHERE table_name = $1 AND table_schema = current_schema()
+        ORDER BY ordinal_position
+        """,
+        table,
+    )
+    if not records:
+        return None
+    required = await _required_fields(project, table)
+
+    columns = []
+    for r in records:
+        if r["column_name"] in SYSTEM_COLUMNS:
+            continue
+        convert, expects = _compile_column(r["data_type"], r["character_maximum_length"])
+        columns.append(
+            _Column(
+                name=r["column_name"],
+                convert=convert,
+                expects=expects,
+                required=r["is_nullable"] == "NO" or r["column_name"].lower() in required,
+                sql_type=r["udt_name"],
+            )
+        )
+    return TableValidator(table, columns)
+
+
+class ValidatorCache:
+    """Compiled validators keyed by ``(project, table)``."""
+
+    def __init__(self, ttl: float = ROW_VALIDATOR_TTL) -> None:
+        self.ttl = ttl
+        self._validators: dict[tuple[str, str], TableValidator] = {}
+        self._locks: dict[tuple[str, str], asyncio.Lock] = {}
+
+    def _fresh(self, key: tuple[str, str]) -> TableValidator | None:
+        validator = self._validators.get(key)
+        if validator is not None and time.monotonic() - validator.compiled_at < self.ttl:
+            return validator
+        return None
+
+    async def get(
+        self, conn: asyncpg.Connection, project: str, table: str
+    ) -> TableValidator | None:
+        """The validator for *table*, compiling it on first use."""
+        key = (project, table)
+        validator = self._fresh(key)
+        if validator is not None:
+            return validator
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            validator = self._fresh(key)
+            if validator is None:
+                generation = cache_bus.generation
+                validator = await compile_validator(conn, project, table)
+                if validator is None:
+                    return None
+                # Don't keep a validator built from config that changed meanwhile
+                if cache_bus.generation == generation:
+                    self._validators[key] = validator
+        return validator
+
+    def invalidate(self, project: str | None = None, table: str | None = None) -> None:
+        """Drop cached validators for a table, a whole project, or everything."""
+        if project is None:
+            self._validators.clear()
+            return
+        project = project.lower()
+        for key in list(self._validators):
+            if key[0] == project and (table is None or key[1] == table.lower()):
+                del self._validators[key]
+
+
+row_validators = ValidatorCache()
+
+
+def _on_change(data: dict | None) -> None:
+    if data is None:
+        row_validators.invalidate()
+    elif data.get("project"):
+        row_validators.invalidate(data["project"], data.get("table"))
+
+
+for _topic in ("program", "form_config", "table"):
+    cache_bus.subscribe(_topic, _on_change)
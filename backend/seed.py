@@ -1,32 +1,42 @@
-from sqlalchemy import select, update
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import bindparam, insert, select, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import AsyncConnection
 
 from backend.data.datasets import datasets
 from backend.data.programs import programs
 from backend.db_models import DatasetDB, ProgramDB
 
 
-async def seed(session: AsyncSession) -> None:
+async def seed(conn: AsyncConnection) -> None:
+    """Insert the bundled programs/datasets into empty tables.
+
+    Runs inside the seed migration's transaction; see ``backend.migrations``.
+    """
     # Seed programs
-    result = await session.execute(select(ProgramDB).limit(1))
-    if result.scalars().first() is None:
-        for p in programs:
-            session.add(ProgramDB(**p))
+    has_programs = (await conn.execute(select(ProgramDB.id).limit(1))).first()
+    if has_programs is None:
+        if programs:
+            await conn.execute(insert(ProgramDB), programs)
     else:
-        # Backfill contribution_spec on existing programs
-        for p in programs:
-            if p.get("contribution_spec"):
-                await session.execute(
-                    update(ProgramDB)
-                    .where(ProgramDB.id == p["id"])
-                    .values(contribution_spec=p["contribution_spec"])
-                )
+        # Backfill contribution_spec on existing programs in one statement
+        specs = [
+            {"id": p["id"], "spec": p["contribution_spec"]}
+            for p in programs
+            if p.get("contribution_spec")
+        ]
+        if specs:
+            await conn.execute(
+                text(
+                    """
+                    UPDATE programs SET contribution_spec = data.spec
+                    FROM jsonb_to_recordset(:rows) AS data(id VARCHAR, spec JSONB)
+                    WHERE programs.id = data.id
+                    """
+                ).bindparams(bindparam("rows", type_=JSONB)),
+                {"rows": specs},
+            )
 
     # Seed datasets
-    result = await session.execute(select(DatasetDB).limit(1))
-    if result.scalars().first() is None:
-        for d in datasets:
-            session.add(DatasetDB(**d))
-
-    await session.commit()
-
+    has_datasets = (await conn.execute(select(DatasetDB.id).limit(1))).first()
+    if has_datasets is None and datasets:
+        await conn.execute(insert(DatasetDB), datasets)
@@ -0,0 +1,265 @@
+"""
+In-memory index of species names for autocomplete.
+
+Names come from three places: the ImageNet labels the CNN can emit, the
+``species_name`` of submissions, and the species column of every program
+table. Each name is normalised (case-folded, whitespace collapsed) and
+counted. The display form is whichever spelling was seen most often.
+
+Lookups never touch the database:
+
+* Prefix matches come from a sorted array of ``(word suffix, name)``
+  pairs, so "jay" finds both "jay" and "blue jay" with two bisects.
+* When there are too few prefix matches, a trigram index supplies names
+  sharing most of the query's trigrams, so "blu jya" still finds
+  "blue jay".
+
+Results are ranked by how often the name was recorded. They are memoised
+per query until the index next changes.
+
+New names are added in place as submissions and rows come in. Every worker
+applies them from the cache bus's ``"species"`` topic. A full reload runs
+in the background when the bus reconnects, when a write is too large to
+announce name by name (its NOTIFY payload would be too large), or every ``SPECIES_INDEX_REFRESH`` seconds, which
+picks up deletes. Requests keep using the old index until the new one is
+swapped in.
+"""
+
+import asyncio
+import heapq
+import os
+import re
+import time
+from bisect import bisect_left, insort
+from collections import Counter
+from collections.abc import Awaitable, Callable
+from contextlib import suppress
+
+from backend.cache_bus import MAX_PAYLOAD_BYTES, cache_bus
+
+SPECIES_INDEX_REFRESH = float(os.getenv("SPECIES_INDEX_REFRESH", "900"))
+# Trigram similarity (Dice coefficient) a name needs to be offered as a fuzzy match
+SPECIES_FUZZY_THRESHOLD = float(os.getenv("SPECIES_FUZZY_THRESHOLD", "0.4"))
+
+# Program-table columns holding a species name, most specific first
+SPECIES_COLUMNS = ("species_name", "species", "scientific_name", "common_name")
+
+# Names longer than this are free text, not species
+MAX_NAME_LENGTH = 120
+
+_MEMO_SIZE = 4096
+_SPACE_RE = re.compile(r"\s+")
+
+# Raw name -> occurrences
+Counts = dict[str, int]
+Loader = Callable[[], Awaitable[Counts]]
+
+
+def normalize(name: str) -> str:
+    return _SPACE_RE.sub(" ", name.replace("_", " ")).strip().casefold()
+
+
+def species_column(columns) -> str | None:
+    """The column among *columns* that holds species names, if any."""
+    names = set(columns)
+    return next((c for c in SPECIES_COLUMNS if c in names), None)
+
+
+def _trigrams(key: str, partial: bool = False) -> set[str]:
+    """Padded trigrams per word; *partial* leaves the last word open-ended."""
+    words = key.split(" ")
+    grams = set()
+    for i, word in enumerate(words):
+        padded = f"  {word}" if partial and i == len(words) - 1 else f"  {word} "
+        grams.update(padded[j:j + 3] for j in range(len(padded) - 2))
+    return grams
+
+
+class _Entry:
+    __slots__ = ("forms", "count", "grams")
+
+    def __init__(self, grams: int) -> None:
+        self.forms: Counter[str] = Counter()
+        self.count = 0
+        self.grams = grams
+
+    @property
+    def display(self) -> str:
+        return self.forms.most_common(1)[0][0]
+
+
+class SpeciesIndex:
+    def __init__(self) -> None:
+        self._entries: dict[str, _Entry] = {}
+        # (suffix starting at a word, normalised name), sorted
+        self._suffixes: list[tuple[str, str]] = []
+        self._grams: dict[str, set[str]] = {}
+        self._memo: dict[tuple[str, int], list[dict]] = {}
+        self._loaded_at: float | None = None
+        self._stale = False
+        self._reload: asyncio.Task | None = None
+        # Names added while a reload is loading, replayed onto the new index
+        self._pending: list[Counts] | None = None
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @classmethod
+    def from_counts(cls, counts: Counts) -> "SpeciesIndex":
+        index = cls()
+        index._count(counts, bulk=True)
+        index._suffixes.sort()
+        return index
+
+    def add(self, counts: Counts) -> None:
+        """Count occurrences of raw names, indexing the ones not seen before."""
+        if not counts:
+            return
+        if self._pending is not None:
+            self._pending.append(counts)
+        self._memo.clear()
+        self._count(counts)
+
+    def _count(self, counts: Counts, bulk: bool = False) -> None:
+        for raw, n in counts.items():
+            if not isinstance(raw, str) or len(raw) > MAX_NAME_LENGTH:
+                continue
+            key = normalize(raw)
+            if not key:
+                continue
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(self._index(key, bulk))
+            entry.forms[raw.strip()] += n
+            entry.count += n
+
+    def _index(self, key: str, bulk: bool) -> int:
+        start = 0
+        while start != -1:
+            if bulk:
+                self._suffixes.append((key[start:], key))  # sorted once at the end
+            else:
+                insort(self._suffixes, (key[start:], key))
+            start = key.find(" ", start)
+            if start != -1:
+                start += 1
+        grams = _trigrams(key)
+        for gram in grams:
+            self._grams.setdefault(gram, set()).add(key)
+        return len(grams)
+
+    def mark_stale(self) -> None:
+        self._stale = True
+
+    async def ensure(self, load: Loader) -> None:
+        """Build the index on first use; afterwards reload it in the background."""
+        if self._loaded_at is None:
+            async with self._lock:
+                if self._loaded_at is None:
+                    await self._replace(load)
+            return
+        expired = time.monotonic() - self._loaded_at > SPECIES_INDEX_REFRESH
+        if (self._stale or expired) and self._reload is None:
+            self._reload = asyncio.create_task(self._background_reload(load))
+
+    async def _background_reload(self, load: Loader) -> None:
+        try:
+            with suppress(Exception):  # keep serving the old index
+                async with self._lock:
+                    await self._replace(load)
+        finally:
+            self._reload = None
+
+    async def _replace(self, load: Loader) -> None:
+        self._stale = False
+        self._pending = []
+        try:
+            fresh = SpeciesIndex.from_counts(await load())
+            for counts in self._pending:
+                fresh.add(counts)
+        finally:
+            self._pending = None
+        self._entries, self._suffixes, self._grams = (
+            fresh._entries, fresh._suffixes, fresh._grams
+        )
+        self._memo.clear()
+        self._loaded_at = time.monotonic()
+
+    def suggest(self, query: str, limit: int = 10) -> list[dict]:
+        """Up to *limit* ``{"name", "count", "match"}`` suggestions, best first."""
+        q = normalize(query)
+        if not q:
+            return []
+        memo_key = (q, limit)
+        cached = self._memo.get(memo_key)
+        if cached is not None:
+            return cached
+
+        lo = bisect_left(self._suffixes, (q,))
+        hi = bisect_left(self._suffixes, (q + "\U0010ffff",), lo)
+        found = {key for _, key in self._suffixes[lo:hi]}
+        ranked = heapq.nsmallest(
+            limit,
+            found,
+            key=lambda k: (-self._entries[k].count, not k.startswith(q), len(k), k),
+        )
+        results = [self._result(k, "prefix") for k in ranked]
+
+        if len(results) < limit and len(q) >= 3:
+            grams = _trigrams(q, partial=True)
+            # "  x" grams only say which letter a word starts with and have
+            # the longest postings; count them for names found by the others
+            leading = [g for g in grams if g.startswith("  ")]
+            shared: Counter[str] = Counter()
+            for gram in grams.difference(leading):
+                shared.update(self._grams.get(gram, ()))
+            for gram in leading:
+                postings = self._grams.get(gram, set())
+                shared.update(k for k in shared if k in postings)
+            scores = {
+                k: 2 * n / (len(grams) + self._entries[k].grams)
+                for k, n in shared.items()
+                if k not in found
+            }
+            fuzzy = heapq.nsmallest(
+                limit - len(results),
+                (k for k, score in scores.items() if score >= SPECIES_FUZZY_THRESHOLD),
+                key=lambda k: (-scores[k], -self._entries[k].count, k),
+            )
+            results.extend(self._result(k, "fuzzy") for k in fuzzy)
+
+        if len(self._memo) >= _MEMO_SIZE:
+            self._memo.clear()
+        self._memo[memo_key] = results
+        return results
+
+    def _result(self, key: str, match: str) -> dict:
+        entry = self._entries[key]
+        return {"name": entry.display, "count": entry.count, "match": match}
+
+
+def announcement(names: list) -> dict:
+    """Cache-bus payload announcing *names* were just recorded.
+
+    Asks for a reload instead when the names wouldn't fit in one NOTIFY.
+    """
+    counts = Counter(n for n in names if isinstance(n, str) and n.strip())
+    # Each name takes at least 6 bytes ('"x": 1, '); skip encoding hopeless cases
+    if len(counts) * 6 > MAX_PAYLOAD_BYTES:
+        return {"counts": None}
+    data = {"counts": dict(counts)}
+    if len(cache_bus.payload("species", data).encode()) > MAX_PAYLOAD_BYTES:
+        return {"counts": None}
+    return data
+
+
+def _on_species(data: dict | None) -> None:
+    if data is None or data.get("counts") is None:
+        species_index.mark_stale()
+    else:
+        species_index.add(data["counts"])
+
+
+species_index = SpeciesIndex()
+cache_bus.subscribe("species", _on_species)
@@ -0,0 +1,333 @@
+"""
+Pluggable storage for uploaded files.
+
+``upload_storage`` is picked by ``UPLOAD_STORAGE``:
+
+* ``local`` (default): files under ``UPLOAD_DIR``. Writes run in a worker
+  thread and go to a temp file that is ``os.replace``-d into place, so
+  readers never see a partial file. ``UPLOAD_FSYNC`` controls durability:
+  ``none`` leaves flushing to the OS; ``always`` fsyncs every file (and its
+  directory) before returning; ``batch`` group-commits — concurrent saves
+  within ``UPLOAD_FSYNC_WINDOW`` seconds share one round of fsyncs.
+* ``s3``: objects in ``S3_BUCKET`` (optionally under ``S3_PREFIX``) on AWS
+  or any S3-compatible server such as MinIO (``S3_ENDPOINT_URL``).
+  Credentials come from the usual ``AWS_*`` variables. Needs ``boto3``.
+
+Keys are ``<program_id>/<file name>`` in both backends, and files are
+served at ``/uploads/<key>`` either way (see ``main.py``).
+"""
+
+import asyncio
+import os
+import tempfile
+from collections.abc import Iterator
+
+from fastapi import HTTPException
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
+
+from backend.metrics import span
+
+UPLOAD_STORAGE = os.getenv("UPLOAD_STORAGE", "local")
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "/app/uploads")
+UPLOAD_FSYNC = os.getenv("UPLOAD_FSYNC", "batch")
+UPLOAD_FSYNC_WINDOW = float(os.getenv("UPLOAD_FSYNC_WINDOW", "0.005"))
+
+S3_BUCKET = os.getenv("S3_BUCKET", "ecoexchange-uploads")
+S3_PREFIX = os.getenv("S3_PREFIX", "")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_REGION = os.getenv("S3_REGION") or None
+# Redirect /uploads requests to presigned URLs instead of proxying the bytes
+S3_REDIRECT = os.getenv("S3_REDIRECT", "0") == "1"
+
+_STREAM_CHUNK = 256 * 1024
+
+
+def _file_mode() -> int:
+    # The mode open() would give a new file; mkstemp always uses 0600
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+_FILE_MODE = _file_mode()
+
+
+def _check_key(key: str) -> str:
+    """Reject keys that are empty or could escape the storage root."""
+    if not key or any(part in ("", ".", "..") for part in key.split("/")):
+        raise ValueError(f"Invalid storage key: {key!r}")
+    return key
+
+
+def _fsync_dir(path: str) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _commit_files(items: list[tuple[str, str]], durable: bool) -> None:
+    """Move each written ``(temp, final)`` pair into place, fsyncing if *durable*."""
+    if durable:
+        for tmp, _ in items:
+            fd = os.open(tmp, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+    for tmp, final in items:
+        os.replace(tmp, final)
+    if durable:
+        for directory in {os.path.dirname(final) for _, final in items}:
+            _fsync_dir(directory)
+
+
+class _FsyncBatcher:
+    """Group concurrent commits into one thread hop and one fsync per directory."""
+
+    def __init__(self, window: float):
+        self.window = window
+        self._pending: list[tuple[str, str, asyncio.Future]] = []
+        self._flusher: asyncio.Task | None = None
+
+    async def commit(self, tmp: str, final: str) -> None:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((tmp, final, future))
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush())
+        await future
+
+    def _take(self) -> list[tuple[str, str, asyncio.Future]]:
+        batch, self._pending = self._pending, []
+        self._flusher = None
+        return batch
+
+    async def _flush(self) -> None:
+        batch = None
+        try:
+            await asyncio.sleep(self.window)
+            batch = self._take()
+            with span("storage.fsync", files=len(batch)):
+                await asyncio.to_thread(
+                    _commit_files, [(tmp, final) for tmp, final, _ in batch], True
+                )
+        except BaseException as exc:
+            # Never leave a save() waiting on a flush that died
+            for _, _, future in batch if batch is not None else self._take():
+                if future.done():
+                    continue
+                if isinstance(exc, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(exc)
+            if isinstance(exc, OSError):
+                return
+            raise
+        for _, _, future in batch:
+            future.set_result(None)
+
+
+class LocalStorage:
+    def __init__(self, root: str = UPLOAD_DIR, fsync: str = UPLOAD_FSYNC):
+        if fsync not in ("none", "always", "batch"):
+            raise ValueError(f"UPLOAD_FSYNC must be none, always or batch, got {fsync!r}")
+        self.root = root
+        self.fsync = fsync
+        self._dirs: set[str] = set()
+        self._batcher: _FsyncBatcher | None = None
+
+    def __getstate__(self) -> dict:
+        # Picklable for process pools; the batcher is per event loop
+        return {"root": self.root, "fsync": self.fsync}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(**state)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, _check_key(key))
+
+    def _write_temp(self, key: str, data: bytes) -> tuple[str, str]:
+        final = self.path(key)
+        directory = os.path.dirname(final)
+        if directory not in self._dirs:
+            os.makedirs(directory, exist_ok=True)
+            self._dirs.add(directory)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                os.fchmod(fp.fileno(), _FILE_MODE)
+                fp.write(data)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return tmp, final
+
+    def _save_sync(self, key: str, data: bytes) -> None:
+        tmp, final = self._write_temp(key, data)
+        _commit_files([(tmp, final)], self.fsync == "always")
+
+    async def prepare(self) -> None:
+        await asyncio.to_thread(os.makedirs, self.root, exist_ok=True)
+
+    async def save(self, key: str, data: bytes, content_type: str | None = None) -> None:
+        if self.fsync != "batch":
+            await asyncio.to_thread(self._save_sync, key, data)
+            return
+        tmp, final = await asyncio.to_thread(self._write_temp, key, data)
+        if self._batcher is None:
+            self._batcher = _FsyncBatcher(UPLOAD_FSYNC_WINDOW)
+        await self._batcher.commit(tmp, final)
+
+    def read(self, key: str) -> bytes:
+        with open(self.path(key), "rb") as fp:
+            return fp.read()
+
+    def list_keys(self, prefix: str = "") -> list[str]:
+        """Keys under *prefix* (a program id or ""), sorted."""
+        base = os.path.join(self.root, prefix) if prefix else self.root
+        keys = []
+        for dirpath, _, names in os.walk(base):
+            rel = os.path.relpath(dirpath, self.root)
+            for name in names:
+                if not name.startswith(".upload-"):
+                    keys.append(name if rel == "." else f"{rel}/{name}")
+        return sorted(keys)
+
+
+class S3Storage:
+    def __init__(
+        self,
+        bucket: str = S3_BUCKET,
+        prefix: str = S3_PREFIX,
+        endpoint_url: str | None = S3_ENDPOINT_URL,
+        region: str | None = S3_REGION,
+    ):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self._client = None
+        self._client_pid: int | None = None
+
+    def __getstate__(self) -> dict:
+        return {
+            "bucket": self.bucket,
+            "prefix": self.prefix,
+            "endpoint_url": self.endpoint_url,
+            "region": self.region,
+        }
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(**state)
+
+    @property
+    def client(self):
+        # boto3 clients aren't fork-safe; make one per process
+        if self._client is None or self._client_pid != os.getpid():
+            try:
+                import boto3
+                from botocore.config import Config
+            except ImportError as exc:
+                raise RuntimeError("UPLOAD_STORAGE=s3 needs boto3 installed") from exc
+            self._client = boto3.client(
+                "s3",
+                endpoint_url=self.endpoint_url,
+                region_name=self.region,
+                config=Config(max_pool_connections=32, retries={"mode": "standard"}),
+            )
+            self._client_pid = os.getpid()
+        return self._client
+
+    def _object_key(self, key: str) -> str:
+        return self.prefix + _check_key(key)
+
+    def _ensure_bucket(self) -> None:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_bucket(Bucket=self.bucket)
+        except ClientError:
+            self.client.create_bucket(Bucket=self.bucket)
+
+    async def prepare(self) -> None:
+        await asyncio.to_thread(self._ensure_bucket)
+
+    async def save(self, key: str, data: bytes, content_type: str | None = None) -> None:
+        extra = {"ContentType": content_type} if content_type else {}
+        # A PUT is atomic: readers see the old object or the whole new one
+        await asyncio.to_thread(
+            self.client.put_object,
+            Bucket=self.bucket,
+            Key=self._object_key(key),
+            Body=data,
+            **extra,
+        )
+
+    def read(self, key: str) -> bytes:
+        obj = self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))
+        return obj["Body"].read()
+
+    def list_keys(self, prefix: str = "") -> list[str]:
+        """Keys under *prefix* (a program id or ""), sorted."""
+        full_prefix = self.prefix + (prefix.strip("/") + "/" if prefix else "")
+        keys = []
+        for page in self.client.get_paginator("list_objects_v2").paginate(
+            Bucket=self.bucket, Prefix=full_prefix
+        ):
+            keys.extend(obj["Key"][len(self.prefix):] for obj in page.get("Contents", []))
+        return sorted(keys)
+
+    def _get(self, key: str) -> dict:
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                raise HTTPException(404, "Not found")
+            raise
+
+    async def response(self, key: str) -> Response:
+        """Serve *key* for ``GET /uploads/<key>``."""
+        try:
+            _check_key(key)
+        except ValueError:
+            raise HTTPException(404, "Not found")
+        if S3_REDIRECT:
+            url = await asyncio.to_thread(
+                self.client.generate_presigned_url,
+                "get_object",
+                Params={"Bucket": self.bucket, "Key": self._object_key(key)},
+                ExpiresIn=3600,
+            )
+            return RedirectResponse(url, status_code=307)
+
+        obj = await asyncio.to_thread(self._get, key)
+        body = obj["Body"]
+
+        def chunks() -> Iterator[bytes]:
+            try:
+                yield from body.iter_chunks(_STREAM_CHUNK)
+            finally:
+                body.close()
+
+        headers = {"Content-Length": str(obj["ContentLength"])}
+        if obj.get("ETag"):
+            headers["ETag"] = obj["ETag"]
+        return StreamingResponse(
+            chunks(),
+            media_type=obj.get("ContentType") or "application/octet-stream",
+            headers=headers,
+        )
+
+
+def _make_storage() -> LocalStorage | S3Storage:
+    if UPLOAD_STORAGE == "s3":
+        return S3Storage()
+    if UPLOAD_STORAGE != "local":
+        raise ValueError(f"UPLOAD_STORAGE must be local or s3, got {UPLOAD_STORAGE!r}")
+    return LocalStorage()
+
+
+upload_storage = _make_storage()
@@ -0,0 +1,193 @@
+"""
+Delta-sync bookkeeping for dynamic tables.
+
+Every dynamic table gets a ``_version`` column holding the id of the
+transaction that last wrote the row (``pg_current_xact_id()``): a default
+on insert, a ``BEFORE UPDATE`` trigger on update. Deletes leave a row in the
+project's ``_tombstones`` table, stamped the same way.
+
+A client syncs with the watermark it got last time and receives every row
+and tombstone whose ``_version`` is at or above it. The new watermark is
+the xmin of the snapshot the sync read with: every transaction older than
+it had committed and was visible to that read, so nothing committed out of
+order can be skipped. Rows written by transactions in flight at the time
+come again on the next sync, which clients apply as idempotent upserts.
+
+Bulk removals that aren't real deletes (moving rows to an archive) should
+run with ``SET LOCAL eco.sync_archiving = 'on'`` so they don't flood clients
+with tombstones.
+"""
+
+import asyncpg
+
+VERSION_COLUMN = "_version"
+TOMBSTONE_TABLE = "_tombstones"
+
+# Archiving setting checked by the tombstone trigger
+ARCHIVING_SETTING = "eco.sync_archiving"
+
+# Sync order of a row; rows from before sync was enabled sort first
+_SYNC_ORDER = f"COALESCE({VERSION_COLUMN}, '0'::xid8)"
+
+
+async def _install_functions(conn: asyncpg.Connection) -> None:
+    schema = await conn.fetchval("SELECT current_schema()")
+    await conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS "{TOMBSTONE_TABLE}" (
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            {VERSION_COLUMN} XID8 NOT NULL DEFAULT pg_current_xact_id(),
+            deleted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    await conn.execute(
+        f'CREATE INDEX IF NOT EXISTS "{TOMBSTONE_TABLE}_version_idx" '
+        f'ON "{TOMBSTONE_TABLE}" (table_name, {VERSION_COLUMN})'
+    )
+    await conn.execute(
+        f"""
+        CREATE OR REPLACE FUNCTION "{schema}"._sync_stamp() RETURNS trigger AS $$
+        BEGIN
+            NEW.{VERSION_COLUMN} := pg_current_xact_id();
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+    # Qualified, so deletes from sessions with another search_path still land here.
+    # The trigger passes its table's name: on a partitioned table the trigger
+    # fires on the partition, and TG_TABLE_NAME would name that instead.
+    await conn.execute(
+        f"""
+        CREATE OR REPLACE FUNCTION "{schema}"._sync_tombstone() RETURNS trigger AS $$
+        BEGIN
+            IF coalesce(current_setting('{ARCHIVING_SETTING}', true), '') <> 'on' THEN
+                INSERT INTO "{schema}"."{TOMBSTONE_TABLE}" (table_name, row_id)
+                VALUES (coalesce(TG_ARGV[0], TG_TABLE_NAME), OLD.id);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+
+
+async def enable_sync(conn: asyncpg.Connection, table: str) -> None:
+    """Add the ``_version`` column and triggers to *table* (idempotent).
+
+    Rows that predate this have a NULL version and are only sent on a
+    full sync.
+    """
+    async with conn.transaction():
+        # Serialise concurrent first syncs; the DDL below isn't race-free
+        await conn.execute("SELECT pg_advisory_xact_lock(hashtext('eco_sync'))")
+        await _install_functions(conn)
+        # No default in ADD COLUMN: a volatile default would rewrite the table
+        await conn.execute(
+            f'ALTER TABLE "{table}" ADD COLUMN IF NOT EXISTS {VERSION_COLUMN} XID8'
+        )
+        await conn.execute(
+            f'ALTER TABLE "{table}" ALTER COLUMN {VERSION_COLUMN} '
+            f"SET DEFAULT pg_current_xact_id()"
+        )
+        # The expression changes_since orders and pages by, so each page is
+        # an index range scan rather than a sort of the whole table
+        await conn.execute(f'DROP INDEX IF EXISTS "{table}_version_idx"')
+        await conn.execute(
+            f'CREATE INDEX IF NOT EXISTS "{table}_sync_order_idx" '
+            f'ON "{table}" ({_SYNC_ORDER}, id)'
+        )
+        await conn.execute(
+            f"""
+            CREATE OR REPLACE TRIGGER "{table}_sync_stamp"
+            BEFORE UPDATE ON "{table}"
+            FOR EACH ROW EXECUTE FUNCTION _sync_stamp()
+            """
+        )
+        await conn.execute(
+            f"""
+            CREATE OR REPLACE TRIGGER "{table}_sync_tombstone"
+            AFTER DELETE ON "{table}"
+            FOR EACH ROW EXECUTE FUNCTION _sync_tombstone('{table}')
+            """
+        )
+
+
+async def sync_enabled(conn: asyncpg.Connection, table: str) -> bool:
+    return bool(
+        await conn.fetchval(
+            """
+            SELECT 1 FROM pg_trigger t
+            JOIN pg_class c ON c.oid = t.tgrelid
+            WHERE c.relname = $1 AND c.relnamespace = current_schema()::regnamespace
+              AND t.tgname = $2 AND t.tgnargs = 1
+            """,
+            table,
+            f"{table}_sync_tombstone",
+        )
+    )
+
+
+async def changes_since(
+    conn: asyncpg.Connection,
+    table: str,
+    columns: list[str],
+    since: int,
+    after: tuple[int, int] | None,
+    limit: int,
+) -> tuple[str, int, tuple[int, int] | None]:
+    """One page of rows written at or after *since*, ordered by ``(_version, id)``.
+
+    Rows are rendered by Postgres as a JSON array of arrays in *columns*
+    order. Returns ``(rows_json, count, last_key)``, where *last_key* is
+    the ``(version, id)`` to continue after, or None on the last page.
+    A NULL version sorts as 0.
+    """
+    values = ", ".join(f'page."{c}"' for c in columns)
+    after_version, after_id = after if after is not None else (0, 0)
+    page = await conn.fetchrow(
+        f"""
+        SELECT COALESCE(
+                   json_agg(json_build_array({values}) ORDER BY page._sync_v, page.id), '[]'
+               )::text AS rows,
+               count(*) AS n,
+               max(page._sync_v::text::bigint) AS last_version,
+               (array_agg(page.id ORDER BY page._sync_v DESC, page.id DESC))[1] AS last_id
+        FROM (
+            SELECT *, {_SYNC_ORDER} AS _sync_v FROM "{table}"
+            WHERE {_SYNC_ORDER} >= $1::bigint::text::xid8
+              AND ({_SYNC_ORDER}, id) > ($2::text::xid8, $3)
+            ORDER BY {_SYNC_ORDER}, id
+            LIMIT $4
+        ) page
+        """,
+        since,
+        str(after_version),
+        after_id,
+        limit,
+    )
+    more = page["n"] == limit
+    last = (page["last_version"], page["last_id"]) if more else None
+    return page["rows"], page["n"], last
+
+
+async def deletes_since(conn: asyncpg.Connection, table: str, since: int) -> list[int]:
+    """Ids of rows of *table* deleted at or after *since* (none on a full sync)."""
+    if since == 0:
+        return []
+    rows = await conn.fetch(
+        f"""
+        SELECT DISTINCT row_id FROM "{TOMBSTONE_TABLE}"
+        WHERE table_name = $1 AND {VERSION_COLUMN} >= $2::text::xid8
+        """,
+        table,
+        str(since),
+    )
+    return [r["row_id"] for r in rows]
+
+
+async def snapshot_watermark(conn: asyncpg.Connection) -> int:
+    """Oldest transaction still running in this connection's snapshot."""
+    return int(await conn.fetchval("SELECT pg_snapshot_xmin(pg_current_snapshot())::text"))
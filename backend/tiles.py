@@ -0,0 +1,277 @@
+"""
+Server-side vector tiles of observation points.
+
+A tile ``z/x/y`` (Web Mercator, XYZ scheme) is built with one query. The
+source's points inside the tile's bounds are projected to tile coordinates
+in SQL and grouped into ``TILE_CLUSTER_CELL``-unit grid cells. Below
+``TILE_CLUSTER_MAX_ZOOM`` a cell holding several points becomes one
+cluster feature carrying ``count``. At and above it cells are a single
+unit wide, so points stay separate unless they share a pixel. A tile
+therefore holds at most a few thousand features however many rows the
+source has.
+
+The bbox predicate compares the same float expressions of the latitude
+and longitude columns that ``point_expr`` renders. An expression index on
+the pair (``geo_index_sql``) lets a tile read only the rows in its band of
+latitude instead of scanning the source.
+
+Encoded tiles are kept in an in-memory LRU (``TILE_CACHE_BYTES``) while
+the cache bus is listening. Inserts and deletes publish the bounding box
+of the points they touched on the ``"tiles"`` topic. Every worker then
+drops the cached tiles of that source that intersect it, at all zooms.
+Cached keys are indexed by source, and each source has its own
+generation, so writes to one source neither walk nor stall the tiles of
+the others. ``TILE_CACHE_TTL`` bounds staleness from writes that bypass
+the routes.
+"""
+
+import math
+import os
+import time
+from collections import OrderedDict
+
+import asyncpg
+
+from backend import mvt
+from backend.cache_bus import cache_bus
+
+TILE_MAX_ZOOM = 22
+TILE_CLUSTER_MAX_ZOOM = int(os.getenv("TILE_CLUSTER_MAX_ZOOM", "14"))
+# Cluster grid cell size in tile units (the tile is mvt.EXTENT units wide)
+TILE_CLUSTER_CELL = int(os.getenv("TILE_CLUSTER_CELL", "64"))
+TILE_CACHE_BYTES = int(os.getenv("TILE_CACHE_BYTES", str(64 * 1024 * 1024)))
+TILE_CACHE_TTL = float(os.getenv("TILE_CACHE_TTL", "300"))
+
+# Web Mercator stops here
+MAX_LATITUDE = 85.05112878
+
+# Column pairs recognised as a point location, most specific first
+GEO_COLUMNS = (("latitude", "longitude"), ("lat", "lon"), ("lat", "lng"))
+
+BBox = tuple[float, float, float, float]  # west, south, east, north
+
+# Tile source backed by the submissions table; dynamic tables are "project.table"
+SUBMISSIONS_SOURCE = "submissions"
+
+_NUMBER_PATTERN = r"^\s*-?[0-9]+(\.[0-9]+)?\s*$"
+_NUMERIC_TYPES = {"float4", "float8", "numeric", "int2", "int4", "int8"}
+
+
+def point_expr(column: str, sql_type: str) -> str:
+    """SQL for *column* as float8; text that isn't a number becomes NULL."""
+    if sql_type in _NUMERIC_TYPES:
+        return f'"{column}"::float8'
+    # CASE guarantees the regex runs before the cast
+    return f"""CASE WHEN "{column}" ~ '{_NUMBER_PATTERN}' THEN "{column}"::float8 END"""
+
+
+def geo_index_sql(table: str, lat: str, lon: str, concurrently: bool = False) -> str:
+    """``CREATE INDEX`` on the ``point_expr`` expressions *lat* and *lon* of *table*."""
+    how = "CONCURRENTLY " if concurrently else ""
+    return (
+        f'CREATE INDEX {how}IF NOT EXISTS "{table}_geo_idx" '
+        f'ON "{table}" (({lat}), ({lon}))'
+    )
+
+
+def tile_bounds(z: int, x: int, y: int) -> BBox:
+    n = 2**z
+
+    def lat(row: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360 - 180, lat(y + 1), (x + 1) / n * 360 - 180, lat(y)
+
+
+def _tile_index(z: int, lon: float, lat: float) -> tuple[int, int]:
+    """The ``(x, y)`` of the zoom-*z* tile holding a point, clamped to the grid."""
+    n = 2**z
+    lat = math.radians(min(max(lat, -MAX_LATITUDE), MAX_LATITUDE))
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - math.log(math.tan(lat) + 1 / math.cos(lat)) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def _tile_ranges(bbox: BBox) -> list[tuple[int, int, int, int]]:
+    """Per zoom, the ``(x0, x1, y0, y1)`` tile ranges intersecting *bbox*."""
+    w, s, e, n = bbox
+    ranges = []
+    for z in range(TILE_MAX_ZOOM + 1):
+        x0, y0 = _tile_index(z, w, n)
+        x1, y1 = _tile_index(z, e, s)
+        ranges.append((x0, x1, y0, y1))
+    return ranges
+
+
+def geo_columns(columns) -> tuple[str, str] | None:
+    """The ``(latitude, longitude)`` column names among *columns*, if any."""
+    names = set(columns)
+    for lat, lon in GEO_COLUMNS:
+        if lat in names and lon in names:
+            return lat, lon
+    return None
+
+
+def points_bbox(lats: list, lons: list) -> BBox | None:
+    """Bounding box of the points that parse as numbers, or None if none do."""
+    pairs = []
+    for la, lo in zip(lats, lons):
+        try:
+            pairs.append((float(la), float(lo)))
+        except (TypeError, ValueError):
+            continue
+    if not pairs:
+        return None
+    return (
+        min(lo for _, lo in pairs),
+        min(la for la, _ in pairs),
+        max(lo for _, lo in pairs),
+        max(la for la, _ in pairs),
+    )
+
+
+def tile_sql(points_sql: str, first_param: int) -> str:
+    """Wrap *points_sql* (columns ``id``, ``lat``, ``lon``) into the tile query.
+
+    Parameters from *first_param* on: west, south, east, north, zoom scale
+    (``2**z * extent``), tile x and y offsets (in extent units) and the
+    cell size.
+    """
+    w, s, e, n, scale, x0, y0, cell = (f"${first_param + i}" for i in range(8))
+    return f"""
+        SELECT count(*) AS n, min(p.id::text) AS id,
+               round(avg(p.px))::int AS px, round(avg(p.py))::int AS py
+        FROM (
+            SELECT pts.id,
+                   (pts.lon + 180) / 360 * {scale} - {x0} AS px,
+                   (1 - ln(tan(radians(pts.lat)) + 1 / cos(radians(pts.lat))) / pi())
+                       / 2 * {scale} - {y0} AS py
+            FROM ({points_sql}) pts
+            WHERE pts.lat BETWEEN {s} AND {n} AND pts.lon BETWEEN {w} AND {e}
+        ) p
+        GROUP BY floor(p.px / {cell}), floor(p.py / {cell})
+    """
+
+
+def tile_params(z: int, x: int, y: int) -> list:
+    w, s, e, n = tile_bounds(z, x, y)
+    extent = mvt.EXTENT
+    cell = TILE_CLUSTER_CELL if z < TILE_CLUSTER_MAX_ZOOM else 1
+    return [
+        w,
+        max(s, -MAX_LATITUDE),
+        e,
+        min(n, MAX_LATITUDE),
+        float(2**z * extent),
+        float(x * extent),
+        float(y * extent),
+        cell,
+    ]
+
+
+def encode_points(layer: str, records: list[asyncpg.Record]) -> bytes:
+    features = []
+    for r in records:
+        px = min(max(r["px"], 0), mvt.EXTENT - 1)
+        py = min(max(r["py"], 0), mvt.EXTENT - 1)
+        if r["n"] > 1:
+            features.append((px, py, {"cluster": True, "count": r["n"]}, None))
+        else:
+            row_id = int(r["id"]) if r["id"].isdigit() else None
+            features.append((px, py, {"id": r["id"] if row_id is None else row_id}, row_id))
+    return mvt.encode_tile({layer: features})
+
+
+class TileCache:
+    """Encoded tiles by ``(source, z, x, y)``, least recently used first out."""
+
+    def __init__(self, max_bytes: int = TILE_CACHE_BYTES, ttl: float = TILE_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._tiles: OrderedDict[tuple, tuple[bytes, float]] = OrderedDict()
+        self._by_source: dict[str, set[tuple]] = {}
+        self._bytes = 0
+        # Bumped per source on eviction, and for all sources on a full flush
+        self._generations: dict[str, int] = {}
+        self._epoch = 0
+
+    def generation(self, source: str) -> tuple[int, int]:
+        """Pass to ``put``: tiles built across an eviction of *source* aren't kept."""
+        return self._epoch, self._generations.get(source, 0)
+
+    def get(self, key: tuple) -> bytes | None:
+        if not cache_bus.listening:
+            return None
+        entry = self._tiles.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[1] > self.ttl:
+            self._drop(key)
+            return None
+        self._tiles.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: tuple, tile: bytes, generation: tuple[int, int]) -> None:
+        # Skip tiles built from data that was invalidated while loading
+        if not cache_bus.listening or self.generation(key[0]) != generation:
+            return
+        self._drop(key)
+        self._tiles[key] = (tile, time.monotonic())
+        self._by_source.setdefault(key[0], set()).add(key)
+        self._bytes += len(tile)
+        while self._bytes > self.max_bytes and self._tiles:
+            self._drop(next(iter(self._tiles)))
+
+    def _drop(self, key: tuple) -> None:
+        entry = self._tiles.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+            keys = self._by_source[key[0]]
+            keys.discard(key)
+            if not keys:
+                del self._by_source[key[0]]
+
+    def evict(self, source: str | None = None, bbox: BBox | None = None) -> None:
+        """Drop tiles of *source* (all sources if None) that intersect *bbox*."""
+        if source is None:
+            self._epoch += 1
+            self._tiles.clear()
+            self._by_source.clear()
+            self._bytes = 0
+            return
+        self._generations[source] = self._generations.get(source, 0) + 1
+        keys = self._by_source.get(source)
+        if not keys:
+            return
+        if bbox is None:
+            for key in list(keys):
+                self._drop(key)
+            return
+        ranges = _tile_ranges(bbox)
+        for key in list(keys):
+            z, x, y = key[1:]
+            x0, x1, y0, y1 = ranges[z]
+            if x0 <= x <= x1 and y0 <= y <= y1:
+                self._drop(key)
+
+
+tile_cache = TileCache()
+
+
+def _on_tiles(data: dict | None) -> None:
+    if data is None:
+        tile_cache.evict()
+    else:
+        bbox = data.get("bbox")
+        tile_cache.evict(data["source"], tuple(bbox) if bbox else None)
+
+
+def _on_table(data: dict | None) -> None:
+    if data is None:
+        tile_cache.evict()
+    elif data.get("project") and data.get("table"):
+        tile_cache.evict(f"{data['project']}.{data['table']}")
+
+
+cache_bus.subscribe("tiles", _on_tiles)
+cache_bus.subscribe("table", _on_table)
@@ -0,0 +1,4 @@
+#!/bin/sh
+# Allow streaming-replication connections to the primary (runs on first init only)
+set -e
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -1,7 +1,8 @@
 const API_BASE = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000"
 
 export async function apiFetch<T>(path: string, options?: RequestInit): Promise<T> {
-  const res = await fetch(`${API_BASE}${path}`, options)
+  // Send cookies cross-origin: the API pins reads to the primary after a write
+  const res = await fetch(`${API_BASE}${path}`, { credentials: "include", ...options })
   if (!res.ok) throw new Error(`API error: ${res.status}`)
   if (res.status === 204) return undefined as T
   return res.json()
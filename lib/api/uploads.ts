@@ -57,6 +57,7 @@ export async function uploadFiles(
   const res = await fetch(`${API_BASE}/api/uploads`, {
     method: "POST",
     body: formData,
+    credentials: "include",
   })
   if (!res.ok) throw new Error(`Upload failed: ${res.status}`)
 